@@ -6,6 +6,13 @@
 #include <stdio.h>
 #include <windows.h>      
 #include <mutex>
+#include <condition_variable>
+#include <chrono>
+#include <memory>
+#include <atomic>
+#include <vector>
+#include <cmath>
+#include <algorithm>
 
 
 //==================================================================================================
@@ -35,6 +42,29 @@ CONNECT_DLL_API void cleanup_resource_manager(ViSession resource_mgr)
 }
 
 
+//==================================================================================================
+//            Timestamps
+//==================================================================================================
+
+//-------------------------------------------------------------------------------------
+//-- Get the number of timestamp ticks per second
+CONNECT_DLL_API long long get_timestamp_frequency()
+{
+	LARGE_INTEGER freq;
+	QueryPerformanceFrequency(&freq);
+	return freq.QuadPart;
+}
+
+//-------------------------------------------------------------------------------------
+//-- Get the current time, in the same units as the samples' timestamps
+CONNECT_DLL_API long long get_timestamp()
+{
+	LARGE_INTEGER now;
+	QueryPerformanceCounter(&now);
+	return now.QuadPart;
+}
+
+
 //==================================================================================================
 //            Data of events from the device
 //==================================================================================================
@@ -89,17 +119,493 @@ unsigned short EventInfo::y()
 	return n;
 }
 
-//-- The last event received from the device
-static EventInfo last_event;
+//-- The number of bytes an event must have for clicked(), x() and y() to be valid
+#define MIN_EVENT_SIZE 6
+
+
+//-- The last sample received from a device, published with a seqlock: the writer (the event handler)
+//-- never waits for readers, and a reader retries if the sample was changed while it was being read,
+//-- so readers always get a consistent sample.
+class PublishedSample {
+public:
+	PublishedSample();
+
+	void publish(const sample_info &sample);  // must be called by a single writer
+	sample_info read();
+
+private:
+	std::atomic<unsigned int> version;  // odd while the sample is being written
+	std::atomic<int> touched;
+	std::atomic<float> x, y;
+	std::atomic<unsigned int> seq;
+	std::atomic<long long> timestamp;
+	std::atomic<int> screen_x, screen_y;
+	std::atomic<int> transform_id;
+};
+
+PublishedSample::PublishedSample()
+{
+	version = 0;
+	touched = 0;
+	x = y = 0;
+	seq = 0;
+	timestamp = 0;
+	screen_x = screen_y = 0;
+	transform_id = 0;
+}
+
+void PublishedSample::publish(const sample_info &sample)
+{
+	unsigned int v = version.load(std::memory_order_relaxed);
+	version.store(v + 1, std::memory_order_relaxed);
+	std::atomic_thread_fence(std::memory_order_release);
+
+	touched.store(sample.touched, std::memory_order_relaxed);
+	x.store(sample.x, std::memory_order_relaxed);
+	y.store(sample.y, std::memory_order_relaxed);
+	seq.store(sample.seq, std::memory_order_relaxed);
+	timestamp.store(sample.timestamp, std::memory_order_relaxed);
+	screen_x.store(sample.screen_x, std::memory_order_relaxed);
+	screen_y.store(sample.screen_y, std::memory_order_relaxed);
+	transform_id.store(sample.transform_id, std::memory_order_relaxed);
+
+	version.store(v + 2, std::memory_order_release);
+}
+
+sample_info PublishedSample::read()
+{
+	sample_info sample;
+	unsigned int v1, v2;
+
+	do {
+		v1 = version.load(std::memory_order_acquire);
+
+		sample.touched = touched.load(std::memory_order_relaxed);
+		sample.x = x.load(std::memory_order_relaxed);
+		sample.y = y.load(std::memory_order_relaxed);
+		sample.seq = seq.load(std::memory_order_relaxed);
+		sample.timestamp = timestamp.load(std::memory_order_relaxed);
+		sample.screen_x = screen_x.load(std::memory_order_relaxed);
+		sample.screen_y = screen_y.load(std::memory_order_relaxed);
+		sample.transform_id = transform_id.load(std::memory_order_relaxed);
+
+		std::atomic_thread_fence(std::memory_order_acquire);
+		v2 = version.load(std::memory_order_relaxed);
+	} while ((v1 & 1) != 0 || v1 != v2);
+
+	return sample;
+}
+
+
+//-- The raw coordinates' range (0 to RAW_COORD_RANGE - 1)
+#define RAW_COORD_RANGE 4096
+
+//-- A transformation from raw coordinates to screen coordinates (see set_transform() and set_lookup_table()).
+//-- The computations are the same as in the Python TransformPlan and LookupTable classes (same operations,
+//-- in the same order, in double precision; rounded half to even), so they give identical results.
+class Transform {
+public:
+	enum Kind { SCALE, AFFINE, PROJECTIVE, LOOKUP_TABLE };
+
+	Transform(int id, const double *matrix);
+	Transform(int id, const double *table, int n);
+
+	void apply(double raw_x, double raw_y, int *screen_x, int *screen_y) const;
+
+	int id;
+
+private:
+	Kind kind;
+	double m[9];
+	std::vector<double> table;
+	int n_nodes, step;
+};
+
+Transform::Transform(int id, const double *matrix)
+{
+	this->id = id;
+	memcpy(m, matrix, sizeof(m));
+	n_nodes = step = 0;
+
+	//-- Normalize, like TransformPlan.from_matrix()
+	if (m[8] != 1)
+	{
+		double m22 = m[8];
+		for (int i = 0; i < 9; i++)
+			m[i] /= m22;
+	}
+
+	if (m[6] != 0 || m[7] != 0)
+		kind = PROJECTIVE;
+	else if (m[1] != 0 || m[3] != 0)
+		kind = AFFINE;
+	else
+		kind = SCALE;
+}
+
+Transform::Transform(int id, const double *table, int n)
+{
+	this->id = id;
+	memset(m, 0, sizeof(m));
+	kind = LOOKUP_TABLE;
+	this->table.assign(table, table + n * n * 2);
+	n_nodes = n;
+	step = RAW_COORD_RANGE / (n - 1);
+}
+
+void Transform::apply(double raw_x, double raw_y, int *screen_x, int *screen_y) const
+{
+	double x, y;
+
+	switch (kind)
+	{
+	case SCALE:
+		x = raw_x * m[0] + m[2];
+		y = raw_y * m[4] + m[5];
+		break;
+
+	case AFFINE:
+	case PROJECTIVE:
+		x = raw_x * m[0] + raw_y * m[1] + m[2];
+		y = raw_x * m[3] + raw_y * m[4] + m[5];
+		if (kind == PROJECTIVE)
+		{
+			double w = raw_x * m[6] + raw_y * m[7] + 1;
+			x /= w;
+			y /= w;
+		}
+		break;
+
+	default:  // LOOKUP_TABLE
+	{
+		raw_x = std::min(std::max(raw_x, 0.0), (double)(RAW_COORD_RANGE - 1));
+		raw_y = std::min(std::max(raw_y, 0.0), (double)(RAW_COORD_RANGE - 1));
+
+		int i = std::min((int)raw_x / step, n_nodes - 2);
+		int j = std::min((int)raw_y / step, n_nodes - 2);
+		double tx = raw_x / step - i;
+		double ty = raw_y / step - j;
+
+		const double *p00 = &table[(i * n_nodes + j) * 2];
+		const double *p01 = p00 + 2;
+		const double *p10 = p00 + n_nodes * 2;
+		const double *p11 = p10 + 2;
+
+		x = (p00[0] * (1 - tx) + p10[0] * tx) * (1 - ty) + (p01[0] * (1 - tx) + p11[0] * tx) * ty;
+		y = (p00[1] * (1 - tx) + p10[1] * tx) * (1 - ty) + (p01[1] * (1 - tx) + p11[1] * tx) * ty;
+		break;
+	}
+	}
+
+	*screen_x = (int)std::nearbyint(x);
+	*screen_y = (int)std::nearbyint(y);
+}
+
+
+//-- Update a statistics counter (compile with TSC_NO_STATS to remove the counters' overhead)
+#ifdef TSC_NO_STATS
+#define STAT_ADD(counter, n)
+#else
+#define STAT_ADD(counter, n) ((counter).fetch_add((n), std::memory_order_relaxed))
+#endif
+
+
+//-- The counters of a device (see device_stats)
+class DeviceCounters {
+public:
+	DeviceCounters();
+
+	std::atomic<unsigned long long> interrupts_received;
+	std::atomic<unsigned long long> interrupts_ignored;
+	std::atomic<unsigned long long> samples_overwritten;
+	std::atomic<unsigned long long> samples_read;
+
+	void reset();
+	device_stats get();
+};
+
+DeviceCounters::DeviceCounters()
+{
+	reset();
+}
+
+void DeviceCounters::reset()
+{
+	interrupts_received = 0;
+	interrupts_ignored = 0;
+	samples_overwritten = 0;
+	samples_read = 0;
+}
+
+device_stats DeviceCounters::get()
+{
+	device_stats stats;
+	stats.interrupts_received = interrupts_received;
+	stats.interrupts_ignored = interrupts_ignored;
+	stats.samples_overwritten = samples_overwritten;
+	stats.samples_read = samples_read;
+	return stats;
+}
+
+
+//-- A fixed-capacity queue of the samples received from one device.
+//-- The queue has a single writer (the event handler), which never waits: when the queue is full, the oldest
+//-- sample is overwritten. Readers must be serialized by the caller.
+class SampleQueue {
+public:
+	SampleQueue();
+
+	void push(const sample_info &sample);
+	int pop(sample_info *buf, int max_n, unsigned long long *n_overwritten);
+
+	//-- Discard the samples that were not popped yet
+	void discard() { read_count = write_count.load(std::memory_order_acquire); }
+
+	//-- Empty the queue and restart counting the samples (while no samples are pushed)
+	void reset() { write_count = 0; read_count = 0; }
+
+	//-- The number of samples pushed since the queue was created
+	unsigned int n_received() { return (unsigned int)write_count.load(); }
+
+private:
+	sample_info samples[SAMPLE_QUEUE_CAPACITY];
+	std::atomic<unsigned long long> write_count;  // the number of samples pushed
+	unsigned long long read_count;                // the number of samples popped or overwritten
+};
+
+SampleQueue::SampleQueue()
+{
+	this->write_count = 0;
+	this->read_count = 0;
+}
+
+void SampleQueue::push(const sample_info &sample)
+{
+	unsigned long long w = write_count.load(std::memory_order_relaxed);
+	samples[w % SAMPLE_QUEUE_CAPACITY] = sample;
+	write_count.store(w + 1);
+}
+
+int SampleQueue::pop(sample_info *buf, int max_n, unsigned long long *n_overwritten)
+{
+	unsigned long long w = write_count.load(std::memory_order_acquire);
+
+	//-- Samples older than the queue's capacity were already overwritten
+	unsigned long long first = read_count;
+	if (w - first > SAMPLE_QUEUE_CAPACITY)
+		first = w - SAMPLE_QUEUE_CAPACITY;
+
+	int n = w - first < (unsigned long long)max_n ? (int)(w - first) : max_n;
+	for (int i = 0; i < n; i++)
+		buf[i] = samples[(first + i) % SAMPLE_QUEUE_CAPACITY];
+
+	//-- The writer may have overwritten samples while we were copying them; discard these samples.
+	//-- A sample is safe if its slot was not reused by any sample pushed (or being pushed) so far.
+	std::atomic_thread_fence(std::memory_order_acquire);
+	unsigned long long w2 = write_count.load(std::memory_order_relaxed);
+	int n_discarded = 0;
+	if (w2 + 1 > SAMPLE_QUEUE_CAPACITY && first < w2 + 1 - SAMPLE_QUEUE_CAPACITY)
+	{
+		unsigned long long unsafe = w2 + 1 - SAMPLE_QUEUE_CAPACITY - first;
+		n_discarded = unsafe < (unsigned long long)n ? (int)unsafe : n;
+		memmove(buf, buf + n_discarded, (n - n_discarded) * sizeof(sample_info));
+	}
+
+	*n_overwritten = (first - read_count) + n_discarded;
+	read_count = first + n;
+
+	return n - n_discarded;
+}
+
+
+//-- The state of one connected device. Each device has its own state, so several devices
+//-- can be used concurrently without affecting each other.
+class Device {
+public:
+	Device(ViSession resource);
+
+	//-- Prepare the object for a new connection (while the VISA event handler is not installed)
+	void reset(ViSession resource);
+
+	std::atomic<ViSession> resource;
+	std::atomic<bool> connected;
+
+	PublishedSample last_sample;  // the last sample received (read without locking)
+	//-- The samples are numbered internally from the connection, and reported relative to the last
+	//-- clear_samples(): samples up to this internal sequence number were cleared
+	std::atomic<unsigned int> cleared_seq;
+	SampleQueue queue;            // all samples received
+
+	//-- The number of samples received since connect() or clear_samples()
+	unsigned int sample_count() { return queue.n_received() - cleared_seq; }
+	std::mutex read_lock;         // serializes the queue's readers (the event handler doesn't use it)
+	DeviceCounters counters;
+
+	//-- The callback is called while holding callback_lock, so set_sample_callback() can wait until
+	//-- the previous callback is no longer called
+	std::atomic<sample_callback> callback;
+	std::mutex callback_lock;
+
+	//-- The transformation applied to the samples (NULL = none), which is owned by current_transform.
+	//-- The threads that use it are counted in transform_users (see TransformUse). A transformation that
+	//-- was replaced is retired, and released by a later change that finds no thread using a transformation.
+	std::atomic<const Transform *> transform;
+	std::unique_ptr<Transform> current_transform;
+	std::vector<std::unique_ptr<Transform>> retired_transforms;
+	std::atomic<int> transform_users;
+	std::mutex transform_lock;  // serializes changes of the transformation
+
+	//-- For threads waiting for samples
+	std::mutex wait_lock;
+	std::condition_variable sample_received;
+	std::atomic<int> n_waiters;
+};
+
+Device::Device(ViSession resource)
+{
+	this->n_waiters = 0;
+	this->transform_users = 0;
+	reset(resource);
+}
+
+void Device::reset(ViSession resource)
+{
+	sample_info no_sample;
+	memset(&no_sample, 0, sizeof(no_sample));
+
+	this->resource = resource;
+	this->connected = true;
+	this->callback = NULL;
+	this->cleared_seq = 0;
+	this->queue.reset();
+	this->last_sample.publish(no_sample);
+	this->counters.reset();
+	this->transform = NULL;
+	this->current_transform.reset();
+	this->retired_transforms.clear();
+}
+
+
+//-- Use the device's current transformation: it's not released while this object exists
+class TransformUse {
+public:
+	TransformUse(Device *device) : device(device)
+	{
+		//-- Count the user before loading the pointer (both sequentially consistent), so a thread that
+		//-- replaces the transformation and then sees no users knows that no one uses the old one
+		device->transform_users++;
+		transform = device->transform.load();
+	}
+
+	~TransformUse() { device->transform_users--; }
+
+	const Transform *transform;
+
+private:
+	Device *device;
+};
+
+
+//-- The connected devices. The event handler gets its device directly (via the handler's userhandle);
+//-- the exported functions find it in this fixed table, without locking.
+//-- Device objects are never released: the object of a disconnected device is reused by a later connection,
+//-- so a thread that found a device just before it was disconnected never accesses a released object.
+#define MAX_DEVICES 64
+static std::atomic<Device *> devices[MAX_DEVICES];
+static std::atomic<int> n_device_slots(0);     // devices[0 .. n_device_slots - 1] were used
+static std::vector<std::unique_ptr<Device>> device_objects;  // all Device objects
+static std::vector<Device *> free_devices;     // the Device objects of disconnected devices
+static std::mutex devices_lock;  // serializes the changes to the above (connect() and disconnect())
+
+//-------------------------------------------------------------------------------------
+//-- Find a connected device (returns NULL if not found)
+static Device *find_device(ViSession resource)
+{
+	if (resource == 0)
+		return NULL;
+
+	int n = n_device_slots.load(std::memory_order_acquire);
+	for (int i = 0; i < n; i++)
+	{
+		Device *device = devices[i].load(std::memory_order_acquire);
+		if (device != NULL && device->resource.load(std::memory_order_acquire) == resource)
+			return device;
+	}
+
+	return NULL;
+}
+
+//-------------------------------------------------------------------------------------
+//-- Add a device to the table. Returns NULL if too many devices are connected
+static Device *add_device(ViSession resource)
+{
+	std::lock_guard<std::mutex> guard(devices_lock);
+
+	int n = n_device_slots.load(std::memory_order_relaxed);
+	int slot = 0;
+	while (slot < n && devices[slot].load(std::memory_order_relaxed) != NULL)
+		slot++;
+	if (slot == MAX_DEVICES)
+		return NULL;
+
+	Device *device;
+	if (free_devices.empty())
+	{
+		device = new Device(resource);
+		device_objects.push_back(std::unique_ptr<Device>(device));
+	}
+	else
+	{
+		device = free_devices.back();
+		free_devices.pop_back();
+		device->reset(resource);
+	}
+
+	devices[slot].store(device, std::memory_order_release);
+	if (slot == n)
+		n_device_slots.store(n + 1, std::memory_order_release);
+
+	return device;
+}
+
+//-------------------------------------------------------------------------------------
+//-- Remove a device from the table (its object is kept for reuse)
+static Device *remove_device(ViSession resource)
+{
+	std::lock_guard<std::mutex> guard(devices_lock);
+
+	int n = n_device_slots.load(std::memory_order_relaxed);
+	for (int i = 0; i < n; i++)
+	{
+		Device *device = devices[i].load(std::memory_order_relaxed);
+		if (device != NULL && device->resource.load(std::memory_order_relaxed) == resource)
+		{
+			devices[i].store(NULL, std::memory_order_release);
+			device->resource.store(0, std::memory_order_release);
+			free_devices.push_back(device);
+			return device;
+		}
+	}
+
+	return NULL;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Wake up the threads waiting for samples from the device
+static void notify_waiters(Device *device)
+{
+	//-- Lock the mutex, so a thread that just checked for new samples can't miss the notification
+	device->wait_lock.lock();
+	device->wait_lock.unlock();
+	device->sample_received.notify_all();
+}
 
 
 //==================================================================================================
 //            Communicate with the device
 //==================================================================================================
 
-std::mutex lock;
-
-
 //-------------------------------------------------------------------------------------
 //-- Try connecting with a specific device
 static ViSession try_connect(ViSession resource_mgr, char *resource_name)
@@ -111,20 +617,84 @@ static ViSession try_connect(ViSession resource_mgr, char *resource_name)
 
 
 //-------------------------------------------------------------------------------------
+//-- Count an interrupt whose data could not be read
+static void count_ignored_interrupt(Device *device)
+{
+	STAT_ADD(device->counters.interrupts_received, 1);
+	STAT_ADD(device->counters.interrupts_ignored, 1);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Store a sample received from the device, and notify the threads waiting for it
+static void store_sample(Device *device, ViSession instr, bool touched, unsigned short x, unsigned short y,
+	long long timestamp)
+{
+	sample_info sample;
+	sample.touched = touched;
+	sample.x = x;
+	sample.y = y;
+	sample.seq = device->queue.n_received() + 1;
+	sample.timestamp = timestamp;
+
+	{
+		TransformUse use(device);
+		if (use.transform == NULL)
+		{
+			sample.screen_x = sample.screen_y = 0;
+			sample.transform_id = 0;
+		}
+		else
+		{
+			use.transform->apply(sample.x, sample.y, &sample.screen_x, &sample.screen_y);
+			sample.transform_id = use.transform->id;
+		}
+	}
+
+	STAT_ADD(device->counters.interrupts_received, 1);
+	device->queue.push(sample);
+	device->last_sample.publish(sample);
+
+	if (device->n_waiters > 0)
+		notify_waiters(device);
+
+	if (device->callback.load(std::memory_order_relaxed) != NULL)
+	{
+		//-- Check again while holding the lock: the callback may have been removed (and freed) meanwhile
+		std::lock_guard<std::mutex> guard(device->callback_lock);
+		sample_callback notify = device->callback;
+		if (notify != NULL)
+			notify(instr);
+	}
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Handle an interrupt from the device. userhandle is the device's Device object.
+//-- This function never waits for the threads that read the samples.
 ViStatus _VI_FUNCH event_handler(ViSession instr, ViEventType etype,
 	ViEvent event, ViAddr userhandle)
 {
+	Device *device = (Device *)userhandle;
 	EventInfo data;
+	long long timestamp = get_timestamp();
 
 	//-- Get the size of this event (should be 40 bytes)
 
 	ViStatus status = viGetAttribute(event, VI_ATTR_USB_RECV_INTR_SIZE, &data.nbytes);
 	if (status < VI_SUCCESS) {
 		printf("Failed getting VI_ATTR_USB_RECV_INTR_SIZE, event ignored\n");
+		count_ignored_interrupt(device);
 		return status;
 	}
 	if (data.nbytes > 256) {
 		printf("Data too long, ignored");
+		count_ignored_interrupt(device);
+		return VI_SUCCESS;
+	}
+	if (data.nbytes < MIN_EVENT_SIZE) {
+		printf("Data too short, ignored");
+		count_ignored_interrupt(device);
 		return VI_SUCCESS;
 	}
 
@@ -132,14 +702,11 @@ ViStatus _VI_FUNCH event_handler(ViSession instr, ViEventType etype,
 	status = viGetAttribute(event, VI_ATTR_USB_RECV_INTR_DATA, data.data);
 	if (status < VI_SUCCESS) {
 		printf("Failed getting VI_ATTR_USB_RECV_INTR_DATA, event ignored\n");
+		count_ignored_interrupt(device);
 		return status;
 	}
 
-	//-- Store the data
-	lock.lock();  // lock to prevent confusions with other threads (other event handlers + calls to the DLL)
-	last_event.nbytes = data.nbytes;
-	memcpy((void*)last_event.data, data.data, 256);
-	lock.unlock();
+	store_sample(device, instr, data.clicked(), data.x(), data.y(), timestamp);
 
 	return VI_SUCCESS;
 }
@@ -157,12 +724,21 @@ CONNECT_DLL_API ViSession connect(ViSession resource_mgr, char *resource_name)
 		return 0;
 	}
 
+	//-- Create the device's state before events start arriving
+	Device *device = add_device(resource);
+	if (device == NULL)
+	{
+		printf("Too many devices are connected\n");
+		viClose(resource);
+		return 0;
+	}
+
 	//-- Register the event handler
-	ViStatus status = viInstallHandler(resource, VI_EVENT_USB_INTR, event_handler, (ViAddr)12345678);
+	ViStatus status = viInstallHandler(resource, VI_EVENT_USB_INTR, event_handler, (ViAddr)device);
 	if (status < VI_SUCCESS)
 	{
 		printf("Could not install the interrupt handler\n");
-		viClose(resource);
+		disconnect(resource);
 		return NULL;
 	}
 
@@ -171,7 +747,7 @@ CONNECT_DLL_API ViSession connect(ViSession resource_mgr, char *resource_name)
 	if (status < VI_SUCCESS)
 	{
 		printf("Could not enable the interrupt event for %s, status=%d\n", resource_name, status);
-		viClose(resource);
+		disconnect(resource);
 		return 0;
 	}
 
@@ -179,12 +755,71 @@ CONNECT_DLL_API ViSession connect(ViSession resource_mgr, char *resource_name)
 }
 
 
+//-------------------------------------------------------------------------------------
+//-- The resource names of TSC2017 devices (Texas Instruments vendor ID, TSC2017 product ID)
+#define TSC2017_RESOURCE_PATTERN "USB0::0x0451::0x2FD7::?*::RAW"
+
+//-------------------------------------------------------------------------------------
+//-- Find the TSC2017 devices connected to the computer.
+//-- Arguments: a resource manager, a buffer for the '\n'-separated resource names, and the buffer's size
+//-- Returns the number of devices found (which may be more than the number of names written to buf)
+CONNECT_DLL_API int find_devices(ViSession resource_mgr, char *buf, int buf_size)
+{
+	ViFindList find_list;
+	ViUInt32 n_found;
+	char name[VI_FIND_BUFLEN];
+
+	if (buf_size > 0)
+		buf[0] = '\0';
+
+	ViStatus status = viFindRsrc(resource_mgr, (ViString)TSC2017_RESOURCE_PATTERN, &find_list, &n_found, name);
+	if (status < VI_SUCCESS)
+		return 0;  // no devices found (VI_ERROR_RSRC_NFOUND) or an error
+
+	int n_written = 0;
+	for (ViUInt32 i = 0; i < n_found; i++)
+	{
+		if (i > 0 && viFindNext(find_list, name) < VI_SUCCESS)
+		{
+			n_found = i;
+			break;
+		}
+
+		//-- Append the name (with a separator) if it fits
+		int len = (int)strlen(name);
+		int needed = n_written + (n_written > 0 ? 1 : 0) + len + 1;
+		if (needed > buf_size)
+			continue;
+
+		if (n_written > 0)
+			buf[n_written++] = '\n';
+		memcpy(buf + n_written, name, len + 1);
+		n_written += len;
+	}
+
+	viClose(find_list);
+
+	return (int)n_found;
+}
+
+
 //-------------------------------------------------------------------------------------
 //-- Disconnect from the device. 
 //-- Argument: a device created by connect()
 CONNECT_DLL_API void disconnect(ViSession resource)
 {
+	//-- Closing the session also removes the event handler, so the device state can be released afterwards
 	viClose(resource);
+
+	Device *device = remove_device(resource);
+	if (device == NULL)
+		return;
+
+	device->connected = false;
+	device->callback_lock.lock();
+	device->callback = NULL;
+	device->callback_lock.unlock();
+	notify_waiters(device);
 }
 
 
@@ -193,17 +828,313 @@ CONNECT_DLL_API void disconnect(ViSession resource)
 //-- Argument: a device created by connect()
 CONNECT_DLL_API touch_info get_touch_info(ViSession resource)
 {
-	touch_info ti = {0, 0, 0, 0};
+	touch_info ti = {0, 0, 0, 0, 0, 0, 0, 0, 0};
 
-	if (last_event.nbytes == 0)
-	{
+	Device *device = find_device(resource);
+	if (device == NULL)
 		return ti;
+
+	sample_info sample = device->last_sample.read();
+	if (sample.seq <= device->cleared_seq)
+	{
+		return ti;  // no sample received yet (or since clear_samples() was called)
 	}
 
 	ti.valid = 1;
-	ti.touched = last_event.clicked();
-	ti.x = last_event.x();
-	ti.y = last_event.y();
+	ti.touched = sample.touched;
+	ti.x = sample.x;
+	ti.y = sample.y;
+	ti.seq = sample.seq - device->cleared_seq;
+	ti.timestamp = sample.timestamp;
+	ti.screen_x = sample.screen_x;
+	ti.screen_y = sample.screen_y;
+	ti.transform_id = sample.transform_id;
 
 	return ti;
 }
+
+
+//-------------------------------------------------------------------------------------
+//-- Same as get_touch_info(), but write the touch information into a caller-owned struct
+CONNECT_DLL_API void get_touch_info_into(ViSession resource, touch_info *ti)
+{
+	*ti = get_touch_info(resource);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Get the touch information from several devices at once.
+//-- Arguments: n devices created by connect(), and a buffer for n touch_info structs
+CONNECT_DLL_API void get_touch_info_multi(ViSession *resources, int n, touch_info *ti)
+{
+	for (int i = 0; i < n; i++)
+		ti[i] = get_touch_info(resources[i]);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Get all samples received from the device since the previous call.
+//-- Arguments: a device created by connect(), a buffer for the samples, and the buffer size (in samples)
+//-- Returns the number of samples written to the buffer
+CONNECT_DLL_API int read_samples(ViSession resource, sample_info *buf, int max_n)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return 0;
+
+	std::lock_guard<std::mutex> guard(device->read_lock);
+
+	unsigned long long n_overwritten;
+	int n = device->queue.pop(buf, max_n, &n_overwritten);
+	for (int i = 0; i < n; i++)
+		buf[i].seq -= device->cleared_seq;
+
+	STAT_ADD(device->counters.samples_overwritten, n_overwritten);
+	STAT_ADD(device->counters.samples_read, n);
+
+	return n;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Convert a screen coordinate to the packed format (clamped to the range of a short)
+static short pack_coord(int value)
+{
+	return (short)std::min(std::max(value, -32768), 32767);
+}
+
+//-- Convert a sample to the packed format (seq_base: see Device::cleared_seq)
+static void pack_sample(const sample_info &sample, const Transform *transform, unsigned int seq_base,
+	packed_sample *out)
+{
+	int screen_x = sample.screen_x;
+	int screen_y = sample.screen_y;
+	if (transform != NULL && sample.transform_id != transform->id)
+		transform->apply(sample.x, sample.y, &screen_x, &screen_y);
+
+	out->raw_x = (short)sample.x;
+	out->raw_y = (short)sample.y;
+	out->screen_x = pack_coord(screen_x);
+	out->screen_y = pack_coord(screen_y);
+	out->flags = sample.touched ? PACKED_SAMPLE_TOUCHED : 0;
+	out->seq = sample.seq - seq_base;
+	out->timestamp = (unsigned long long)sample.timestamp;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Get the samples received since the previous call, in the packed format
+CONNECT_DLL_API int read_packed_samples(ViSession resource, packed_sample *buf, int max_n)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return 0;
+
+	std::lock_guard<std::mutex> guard(device->read_lock);
+
+	//-- Pop the samples in chunks, and pack each chunk (using the transformation only while packing it)
+	sample_info chunk[256];
+	int n_read = 0;
+	while (n_read < max_n)
+	{
+		unsigned long long n_overwritten;
+		int n = device->queue.pop(chunk, std::min(max_n - n_read, 256), &n_overwritten);
+		STAT_ADD(device->counters.samples_overwritten, n_overwritten);
+
+		{
+			TransformUse use(device);
+			for (int i = 0; i < n; i++)
+				pack_sample(chunk[i], use.transform, device->cleared_seq, buf + n_read + i);
+		}
+		n_read += n;
+
+		if (n == 0)
+			break;
+	}
+
+	STAT_ADD(device->counters.samples_read, n_read);
+
+	return n_read;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Make a transformation the device's current one (NULL = none). Returns the transformation's ID.
+//-- This never waits for the threads that use the previous transformation: it is retired instead.
+static int install_transform(Device *device, Transform *transform)
+{
+	std::lock_guard<std::mutex> guard(device->transform_lock);
+	device->transform.store(transform);
+
+	if (device->current_transform)
+		device->retired_transforms.push_back(std::move(device->current_transform));
+	device->current_transform.reset(transform);
+
+	//-- With no users now (checked after the store, both sequentially consistent), threads that use a
+	//-- transformation from now on get the new one, so no thread can still use the retired ones
+	if (device->transform_users.load() == 0)
+		device->retired_transforms.clear();
+
+	return transform == NULL ? 0 : transform->id;
+}
+
+//-- The ID of the next transformation
+static std::atomic<int> next_transform_id(1);
+
+
+//-------------------------------------------------------------------------------------
+//-- Set the transformation from raw coordinates to screen coordinates (a 3x3 matrix)
+CONNECT_DLL_API int set_transform(ViSession resource, const double *matrix)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return 0;
+
+	return install_transform(device, new Transform(next_transform_id++, matrix));
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Set a lookup table (n x n x 2 doubles) as the transformation from raw coordinates to screen coordinates
+CONNECT_DLL_API int set_lookup_table(ViSession resource, const double *table, int n)
+{
+	if (n < 2 || RAW_COORD_RANGE % (n - 1) != 0)
+		return 0;
+
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return 0;
+
+	return install_transform(device, new Transform(next_transform_id++, table, n));
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Stop transforming the samples' coordinates
+CONNECT_DLL_API void clear_transform(ViSession resource)
+{
+	Device *device = find_device(resource);
+	if (device != NULL)
+		install_transform(device, NULL);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Discard the samples received so far: get_touch_info() will return invalid data, and read_samples()
+//-- will return only samples received after this call. The samples are numbered again from 1, and the
+//-- device's counters are reset. Used when reusing an open session.
+CONNECT_DLL_API void clear_samples(ViSession resource)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return;
+
+	std::lock_guard<std::mutex> guard(device->read_lock);
+	device->cleared_seq = device->queue.n_received();
+	device->queue.discard();
+	device->counters.reset();
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Stop handling the device's interrupts, e.g. while an open session is idle. The session keeps its
+//-- event handler, and resume_events() enables the interrupts again.
+CONNECT_DLL_API void suspend_events(ViSession resource)
+{
+	if (find_device(resource) != NULL)
+		viDisableEvent(resource, VI_EVENT_USB_INTR, VI_HNDLR);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Handle the device's interrupts again after suspend_events().
+//-- Returns 0 if the resource is not connected or the interrupts could not be enabled
+CONNECT_DLL_API int resume_events(ViSession resource)
+{
+	if (find_device(resource) == NULL)
+		return 0;
+
+	ViStatus status = viEnableEvent(resource, VI_EVENT_USB_INTR, VI_HNDLR, VI_NULL);
+	return status >= VI_SUCCESS ? 1 : 0;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Get the number of samples received from the device since connect() (or clear_samples())
+CONNECT_DLL_API unsigned int get_sample_count(ViSession resource)
+{
+	Device *device = find_device(resource);
+	return device == NULL ? 0 : device->sample_count();
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Wait until a new sample arrives from the device (i.e., until the number of samples differs
+//-- from after_count), or until timeout_ms have passed (negative = wait forever).
+//-- Returns the current number of samples (after_count if the wait timed out)
+CONNECT_DLL_API unsigned int wait_for_sample(ViSession resource, unsigned int after_count, int timeout_ms)
+{
+	Device *dev = find_device(resource);
+	if (dev == NULL)
+		return after_count;
+
+	//-- Register as a waiter before checking for new samples, so the event handler would notify us
+	dev->n_waiters++;
+
+	{
+		std::unique_lock<std::mutex> guard(dev->wait_lock);
+
+		//-- Stop waiting also if the device is disconnected while we wait
+		auto new_sample_arrived = [dev, after_count]() {
+			return !dev->connected || dev->sample_count() != after_count;
+		};
+
+		if (timeout_ms < 0)
+			dev->sample_received.wait(guard, new_sample_arrived);
+		else
+			dev->sample_received.wait_for(guard, std::chrono::milliseconds(timeout_ms), new_sample_arrived);
+	}
+
+	dev->n_waiters--;
+
+	return dev->connected ? dev->sample_count() : after_count;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Set a function to call (from the VISA event thread) whenever a sample is received from the device.
+//-- Set NULL to stop calling it. When this function returns, the previous callback is no longer running
+//-- and will not be called again, so it can be released. The callback must not call this function.
+CONNECT_DLL_API void set_sample_callback(ViSession resource, sample_callback callback)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return;
+
+	std::lock_guard<std::mutex> guard(device->callback_lock);
+	device->callback = callback;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Get the device's counters (all zero if the DLL was compiled with TSC_NO_STATS).
+//-- Returns 0 if the resource is not connected
+CONNECT_DLL_API int get_device_stats(ViSession resource, device_stats *stats)
+{
+	Device *device = find_device(resource);
+	if (device == NULL)
+		return 0;
+
+	*stats = device->counters.get();
+	return 1;
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Reset the device's counters to zero
+CONNECT_DLL_API void reset_device_stats(ViSession resource)
+{
+	Device *device = find_device(resource);
+	if (device != NULL)
+		device->counters.reset();
+}
@@ -17,8 +17,55 @@ typedef struct {
 	int valid;  // Whether valid information was returned
 	int touched;
 	float x, y;
+	unsigned int seq;     // The sample's sequence number (1 = the first sample after connect() or clear_samples())
+	long long timestamp;  // When the sample was received (QueryPerformanceCounter ticks)
+	int screen_x, screen_y;  // The screen coordinates (see set_transform()), valid if transform_id != 0
+	int transform_id;        // The transformation that computed screen_x, screen_y (0 = none)
 } touch_info;
 
+
+//-- One sample captured by the event handler (see read_samples())
+typedef struct {
+	int touched;
+	float x, y;
+	unsigned int seq;     // The sample's sequence number (1 = the first sample after connect() or clear_samples())
+	long long timestamp;  // When the sample was received (QueryPerformanceCounter ticks)
+	int screen_x, screen_y;  // The screen coordinates (see set_transform()), valid if transform_id != 0
+	int transform_id;        // The transformation that computed screen_x, screen_y (0 = none)
+} sample_info;
+
+
+//-- The compact form of a sample (see read_packed_samples()): 21 bytes, without padding
+#pragma pack(push, 1)
+typedef struct {
+	short raw_x, raw_y;           // The TSC2017 coordinates (12 bits)
+	short screen_x, screen_y;     // The screen coordinates (see set_transform())
+	unsigned char flags;          // PACKED_SAMPLE_* bits
+	unsigned int seq;             // The sample's sequence number
+	unsigned long long timestamp; // When the sample was received (QueryPerformanceCounter ticks)
+} packed_sample;
+#pragma pack(pop)
+
+#define PACKED_SAMPLE_TOUCHED 0x01
+
+
+//-- Counters of a connected device (see get_device_stats())
+typedef struct {
+	unsigned long long interrupts_received;  // Interrupts received from the device
+	unsigned long long interrupts_ignored;   // Interrupts whose data could not be read
+	unsigned long long samples_overwritten;  // Samples dropped from the queue before read_samples() returned them
+	unsigned long long samples_read;         // Samples returned by read_samples()
+} device_stats;
+
+
+//-- A function called whenever a sample is received from a device (see set_sample_callback())
+typedef void (__stdcall *sample_callback)(ViSession resource);
+
+
+//-- The maximal number of samples queued per device between two calls to read_samples()
+#define SAMPLE_QUEUE_CAPACITY 4096
+
+
 extern "C" {
 
 	//-- Create a ResourceManager object
@@ -27,9 +74,15 @@ extern "C" {
 	//-- Cleanup a ResourceManager created by create_resource_manager()
 	CONNECT_DLL_API void cleanup_resource_manager(ViSession resource_mgr);
 
-	//-- Connect with the TSC device. Returns a pointer to the device (resource)
+	//-- Connect with the TSC device. Returns a pointer to the device (resource), or 0 if the connection failed
+	//-- (up to 64 devices can be connected at the same time)
 	CONNECT_DLL_API ViSession connect(ViSession resource_mgr, char *resource_name);
 
+	//-- Find the TSC2017 devices connected to the computer. Their resource names are written to buf,
+	//-- separated by '\n' and terminated by '\0' (only names that fit in buf_size bytes are written).
+	//-- Returns the number of devices found
+	CONNECT_DLL_API int find_devices(ViSession resource_mgr, char *buf, int buf_size);
+
 	//-- Disconnect from the device. 
 	//-- Argument: a device created by connect()
 	CONNECT_DLL_API void disconnect(ViSession resource);
@@ -37,4 +90,74 @@ extern "C" {
 	//-- Get touch information from the device.
 	//-- Argument: a device created by connect()
 	CONNECT_DLL_API touch_info get_touch_info(ViSession resource);
+
+	//-- Same as get_touch_info(), but write the touch information into a caller-owned struct
+	CONNECT_DLL_API void get_touch_info_into(ViSession resource, touch_info *ti);
+
+	//-- Get the touch information from several devices at once.
+	//-- Arguments: n devices created by connect(), and a buffer for n touch_info structs
+	CONNECT_DLL_API void get_touch_info_multi(ViSession *resources, int n, touch_info *ti);
+
+	//-- Get all samples received from the device since the previous call, and remove them from the queue.
+	//-- Arguments: a device created by connect(), a buffer for the samples, and the buffer size (in samples)
+	//-- Returns the number of samples written to the buffer
+	CONNECT_DLL_API int read_samples(ViSession resource, sample_info *buf, int max_n);
+
+	//-- Same as read_samples(), in the compact format. The screen coordinates are always computed with the
+	//-- current transformation (samples received before the transformation was changed are transformed again).
+	CONNECT_DLL_API int read_packed_samples(ViSession resource, packed_sample *buf, int max_n);
+
+	//-- Discard the samples received so far (get_touch_info() returns invalid data until a new sample arrives),
+	//-- restart the samples' sequence numbers from 1, and reset the device's counters
+	CONNECT_DLL_API void clear_samples(ViSession resource);
+
+	//-- Stop handling the device's interrupts (e.g. while an open session is idle), until resume_events()
+	CONNECT_DLL_API void suspend_events(ViSession resource);
+
+	//-- Handle the device's interrupts again after suspend_events().
+	//-- Returns 0 if the resource is not connected or the interrupts could not be enabled
+	CONNECT_DLL_API int resume_events(ViSession resource);
+
+	//-- Set the transformation from raw coordinates to screen coordinates, which is applied to each sample
+	//-- when it's received. matrix: 3x3 (row-major) matrix that transforms (raw_x, raw_y, 1) column vectors;
+	//-- if its last row is not (0, 0, 1), the transformation is projective.
+	//-- Returns the transformation's ID (see touch_info.transform_id), or 0 if the resource is not connected
+	CONNECT_DLL_API int set_transform(ViSession resource, const double *matrix);
+
+	//-- Set a lookup table as the transformation from raw coordinates to screen coordinates.
+	//-- table: n x n x 2 doubles; the (x, y) screen coordinates of the raw coordinates (i * step, j * step)
+	//-- are table[(i * n + j) * 2] and table[(i * n + j) * 2 + 1], where step = 4096 / (n - 1).
+	//-- The coordinates between grid nodes are interpolated bilinearly.
+	//-- Returns the transformation's ID (see touch_info.transform_id), or 0 if the resource is not connected
+	//-- or the table size is invalid
+	CONNECT_DLL_API int set_lookup_table(ViSession resource, const double *table, int n);
+
+	//-- Stop transforming the samples' coordinates
+	CONNECT_DLL_API void clear_transform(ViSession resource);
+
+	//-- Get the number of timestamp ticks per second
+	CONNECT_DLL_API long long get_timestamp_frequency();
+
+	//-- Get the current time, in the same units as the samples' timestamps
+	CONNECT_DLL_API long long get_timestamp();
+
+	//-- Get the number of samples received from the device since connect() or clear_samples()
+	CONNECT_DLL_API unsigned int get_sample_count(ViSession resource);
+
+	//-- Wait until the number of samples received from the device differs from after_count
+	//-- (i.e., until a new sample arrives), or until timeout_ms have passed (negative = wait forever).
+	//-- Returns the current number of samples (after_count if the wait timed out)
+	CONNECT_DLL_API unsigned int wait_for_sample(ViSession resource, unsigned int after_count, int timeout_ms);
+
+	//-- Set a function to call (from the VISA event thread) whenever a sample is received from the device.
+	//-- Set NULL to stop calling it. Returns after the previous callback is no longer running.
+	//-- The callback must not call this function.
+	CONNECT_DLL_API void set_sample_callback(ViSession resource, sample_callback callback);
+
+	//-- Get the device's counters (all zero if the DLL was compiled with TSC_NO_STATS).
+	//-- Returns 0 if the resource is not connected
+	CONNECT_DLL_API int get_device_stats(ViSession resource, device_stats *stats);
+
+	//-- Reset the device's counters to zero
+	CONNECT_DLL_API void reset_device_stats(ViSession resource);
 }
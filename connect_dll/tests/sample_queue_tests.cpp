@@ -0,0 +1,155 @@
+//==================================================================================================
+//   Tests of connect_dll's sample queue and transformations, which run without a TSC2017 device.
+//
+//   The DLL's source is compiled into the test, which feeds samples to a device the way the VISA
+//   event handler does. To build and run (from a Visual Studio developer command prompt, in this directory):
+//
+//       cl /EHsc /I..\visa\include /DCONNECT_DLL_EXPORTS sample_queue_tests.cpp ..\visa\lib\visa32.lib
+//       sample_queue_tests.exe
+//
+//   Add /DTSC_NO_STATS to test the build without counters. The exit code is the number of failed checks.
+//==================================================================================================
+
+#include "../connect_dll/connect_dll.cpp"
+
+
+static int n_failed = 0;
+
+#define CHECK(condition) \
+	do { if (!(condition)) { printf("%s(%d): check failed: %s\n", __FILE__, __LINE__, #condition); n_failed++; } } while (0)
+
+
+//-- Feed samples to a device, as if the device sent them
+static void receive(Device *device, ViSession resource, int n, unsigned short first_x)
+{
+	for (int i = 0; i < n; i++)
+		store_sample(device, resource, true, (unsigned short)(first_x + i), 100, get_timestamp());
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- When the queue is full, the oldest samples are overwritten and counted.
+//-- The reader also drops the oldest sample of a full queue, since the writer may be overwriting it.
+static void test_queue_overflow()
+{
+	const ViSession resource = 101;
+	Device *device = add_device(resource);
+	static sample_info buf[SAMPLE_QUEUE_CAPACITY];
+
+	receive(device, resource, SAMPLE_QUEUE_CAPACITY + 10, 0);
+	CHECK(get_sample_count(resource) == SAMPLE_QUEUE_CAPACITY + 10);
+
+	int n = read_samples(resource, buf, SAMPLE_QUEUE_CAPACITY);
+	CHECK(n == SAMPLE_QUEUE_CAPACITY - 1);
+	CHECK(buf[0].seq == 12 && buf[0].x == 11);
+	CHECK(buf[n - 1].seq == SAMPLE_QUEUE_CAPACITY + 10);
+	CHECK(read_samples(resource, buf, SAMPLE_QUEUE_CAPACITY) == 0);
+
+	device_stats stats;
+	CHECK(get_device_stats(resource, &stats));
+#ifdef TSC_NO_STATS
+	CHECK(stats.interrupts_received == 0 && stats.samples_overwritten == 0);
+#else
+	CHECK(stats.interrupts_received == SAMPLE_QUEUE_CAPACITY + 10);
+	CHECK(stats.samples_overwritten == 11);
+	CHECK(stats.samples_read == SAMPLE_QUEUE_CAPACITY - 1);
+#endif
+
+	//-- A partial read leaves the rest of the queue for the next read
+	receive(device, resource, 5, 0);
+	CHECK(read_samples(resource, buf, 2) == 2 && buf[1].seq == SAMPLE_QUEUE_CAPACITY + 12);
+	CHECK(read_samples(resource, buf, 10) == 3 && buf[0].seq == SAMPLE_QUEUE_CAPACITY + 13);
+
+	remove_device(resource);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- clear_samples() discards the queued samples and numbers the next ones from 1 (via cleared_seq)
+static void test_clear_samples()
+{
+	const ViSession resource = 102;
+	Device *device = add_device(resource);
+	sample_info buf[16];
+	packed_sample packed[16];
+
+	receive(device, resource, 7, 0);
+	clear_samples(resource);
+	CHECK(device->cleared_seq == 7);
+	CHECK(get_sample_count(resource) == 0);
+	CHECK(!get_touch_info(resource).valid);
+	CHECK(read_samples(resource, buf, 16) == 0);
+
+	receive(device, resource, 2, 50);
+	touch_info ti = get_touch_info(resource);
+	CHECK(ti.valid && ti.seq == 2 && ti.x == 51);
+	CHECK(get_sample_count(resource) == 2);
+	CHECK(read_samples(resource, buf, 16) == 2 && buf[0].seq == 1 && buf[1].seq == 2);
+
+	receive(device, resource, 1, 60);
+	CHECK(read_packed_samples(resource, packed, 16) == 1 && packed[0].seq == 3 && packed[0].raw_x == 60);
+
+#ifndef TSC_NO_STATS
+	//-- The counters were reset by clear_samples()
+	device_stats stats;
+	CHECK(get_device_stats(resource, &stats));
+	CHECK(stats.interrupts_received == 3 && stats.samples_read == 3);
+#endif
+
+	//-- A new connection with the same Device object starts from scratch
+	remove_device(resource);
+	device = add_device(resource);
+	CHECK(device->cleared_seq == 0 && get_sample_count(resource) == 0);
+	receive(device, resource, 1, 0);
+	CHECK(get_touch_info(resource).seq == 1);
+
+	remove_device(resource);
+}
+
+
+//-------------------------------------------------------------------------------------
+//-- Changing the transformation doesn't wait for the threads that use the previous one
+static void test_transform_retired()
+{
+	const ViSession resource = 103;
+	Device *device = add_device(resource);
+	const double identity[9] = {1, 0, 0, 0, 1, 0, 0, 0, 1};
+	const double shift[9] = {1, 0, 10, 0, 1, 20, 0, 0, 1};
+
+	set_transform(resource, identity);
+	{
+		TransformUse use(device);  // e.g. the event handler, transforming a sample
+		int id = set_transform(resource, shift);
+		CHECK(id != 0 && id != use.transform->id);
+		CHECK(device->retired_transforms.size() == 1);
+
+		//-- The retired transformation is still valid for its user
+		int x, y;
+		use.transform->apply(5, 6, &x, &y);
+		CHECK(x == 5 && y == 6);
+	}
+
+	//-- The next change releases the retired transformations, since no thread uses them
+	clear_transform(resource);
+	CHECK(device->retired_transforms.empty());
+
+	receive(device, resource, 1, 0);
+	CHECK(get_touch_info(resource).transform_id == 0);
+
+	remove_device(resource);
+}
+
+
+//-------------------------------------------------------------------------------------
+int main()
+{
+	test_queue_overflow();
+	test_clear_samples();
+	test_transform_retired();
+
+	if (n_failed == 0)
+		printf("All the tests passed\n");
+	else
+		printf("%d checks failed\n", n_failed);
+	return n_failed;
+}
@@ -1,11 +1,14 @@
 
-from tsc2017 import Touchpad
+import numbers
+
+from tsc2017 import Touchpad, TouchInfo
+from ._streaming import clock
 
 
 class Mouse(object):
 
     #----------------------------------------------------------------
-    def __init__(self, touchpad, ttrk_mouse=None):
+    def __init__(self, touchpad, ttrk_mouse=None, snapshot_ttl=None):
         """
         Create a Mouse object
 
@@ -13,6 +16,8 @@ class Mouse(object):
         :type touchpad: Touchpad
 
         :param ttrk_mouse: The original "Mouse" object (`trajtracker.env.mouse <http://trajtracker.com/apiref/ttrk/Environment.html#trajtracker.Environment.mouse>`_)
+
+        :param snapshot_ttl: See :attr:`~tsc2017.Mouse.snapshot_ttl`
         """
         if not isinstance(touchpad, Touchpad):
             raise TypeError("Invalid 'touchpad' argument - expecting a tsc2017.Touchpad object")
@@ -21,18 +26,79 @@ class Mouse(object):
         self._touchpad = touchpad
         self._ttrk_mouse = ttrk_mouse
 
+        self._snapshot = TouchInfo(False, 0, 0)
+        self._snapshot_time = None
+        self._in_frame = False
+        self.snapshot_ttl = snapshot_ttl
+
+    #----------------------------------------------------------------
+    @property
+    def snapshot_ttl(self):
+        """
+        How long (in seconds) touch data read from the touchpad can be reused.
+
+        If set, all calls to :func:`~tsc2017.Mouse.check_button_pressed` and :attr:`~tsc2017.Mouse.position`
+        within this period share a single touchpad read (e.g., set it to a fraction of the frame duration).
+        If None, each call reads the touchpad.
+
+        :type: float
+        """
+        return self._snapshot_ttl
+
+    @snapshot_ttl.setter
+    def snapshot_ttl(self, value):
+        if value is not None and (not isinstance(value, numbers.Number) or value < 0):
+            raise TypeError("{:}.snapshot_ttl was set to an incorrect value ({:})".format(type(self).__name__, value))
+        self._snapshot_ttl = value
+        self._snapshot_time = None
+
+    #----------------------------------------------------------------
+    def begin_frame(self):
+        """
+        Read the touchpad once. Until :func:`~tsc2017.Mouse.end_frame` or the next call to this function,
+        :func:`~tsc2017.Mouse.check_button_pressed` and :attr:`~tsc2017.Mouse.position` return this data
+        without reading the touchpad again, so they are consistent with each other.
+        """
+        self._touchpad.get_touch_data_into(self._snapshot)
+        self._in_frame = True
+
+    #----------------------------------------------------------------
+    def end_frame(self):
+        """
+        Stop using the data read by :func:`~tsc2017.Mouse.begin_frame`
+        """
+        self._in_frame = False
+
+    #----------------------------------------------------------------
+    def _get_touch_data(self):
+
+        if self._in_frame:
+            return self._snapshot
+
+        if self._snapshot_ttl is not None:
+            now = clock()
+            if self._snapshot_time is None or now - self._snapshot_time >= self._snapshot_ttl:
+                self._touchpad.get_touch_data_into(self._snapshot)
+                self._snapshot_time = now
+            return self._snapshot
+
+        return self._touchpad.get_touch_data()
+
     #----------------------------------------------------------------
     def check_button_pressed(self, button_number):
         """
         Check whether the finger is currently touching the touchpad
 
+        If the touchpad is streaming (:func:`~tsc2017.Touchpad.start_streaming`), this reads the newest sample
+        collected by the sampling thread, without accessing the device.
+
         :param button_number: Only 0 is supported
         :return: int
         """
         if button_number != 0:
             raise ValueError("tsc2017.{:}.check_button_pressed() got invalid button_number ({:}), only button #0 is supported".
                              format(type(self).__name__, button_number))
-        return self._touchpad.get_touch_data().touched
+        return self._get_touch_data().touched
 
     #----------------------------------------------------------------
     def show_cursor(self, show):
@@ -51,9 +117,12 @@ class Mouse(object):
         """
         Get the current position of the finger on the touchpad
 
+        If the touchpad is streaming (:func:`~tsc2017.Touchpad.start_streaming`), this reads the newest sample
+        collected by the sampling thread, without accessing the device.
+
         :return: (x, y) coordinates
         """
-        ti = self._touchpad.get_touch_data()
+        ti = self._get_touch_data()
         if ti.touched:
             return ti.x, ti.y
         else:
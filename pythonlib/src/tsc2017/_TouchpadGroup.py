@@ -0,0 +1,95 @@
+import ctypes
+
+from tsc2017 import Touchpad, TouchInfo, TSCError
+from ._tsc2017 import DLLTouchInfo
+from ._streaming import clock
+
+
+class TouchpadGroup(object):
+    """
+    Several TSC2017 touchpads, each connected to a different device, which are read together.
+
+    Each device's samples are kept separately in the DLL, so the touchpads do not interfere with each other.
+    """
+
+    #----------------------------------------------------------------
+    def __init__(self, touchpads):
+        """
+        Create a TouchpadGroup object
+
+        :param touchpads: The touchpads. They must all use the same DLL.
+        :type touchpads: list of Touchpad
+        """
+        touchpads = tuple(touchpads)
+        if len(touchpads) == 0 or not all(isinstance(tp, Touchpad) for tp in touchpads):
+            raise TypeError("Invalid 'touchpads' argument - expecting a list of tsc2017.Touchpad objects")
+
+        self._touchpads = touchpads
+        self._validate_library()
+        self._touch_info_buf = (DLLTouchInfo * len(touchpads))()
+
+    #----------------------------------------------------------------
+    @property
+    def touchpads(self):
+        """
+        The touchpads in this group
+
+        :type: tuple of Touchpad
+        """
+        return self._touchpads
+
+    #----------------------------------------------------------------
+    def get_touch_data(self):
+        """
+        Get the touch data from all devices, with a single call to the DLL (older DLLs are called once per device).
+
+        The touch data of each device is transformed using its own touchpad's transformation.
+        All touchpads must be connected (:func:`~tsc2017.Touchpad.connect`) before calling this function.
+
+        :return: A list of :class:`~tsc2017.TouchInfo` objects, one per touchpad (in the order of
+                 :attr:`~tsc2017.TouchpadGroup.touchpads`)
+        """
+        # noinspection PyProtectedMember
+        resources = [tp._resource for tp in self._touchpads]
+        if None in resources:
+            raise TSCError("Invalid state: {:}.get_touch_data() cannot be called before all touchpads are connected".
+                           format(type(self).__name__))
+
+        self._validate_library()
+
+        # noinspection PyProtectedMember
+        get_touch_info_multi = self._touchpads[0]._library.get_touch_info_multi
+        if get_touch_info_multi is None:
+            #-- An older DLL: read the devices one by one
+            result = [tp._poll_touch_data() for tp in self._touchpads]
+            for tp, ti in zip(self._touchpads, result):
+                tp._last_seq = ti.seq
+            return result
+
+        n = len(resources)
+        buf = self._touch_info_buf
+        t0 = clock()
+        get_touch_info_multi((ctypes.c_uint32 * n)(*resources), n, buf)
+        duration = clock() - t0
+
+        result = []
+        for tp, data in zip(self._touchpads, buf):
+            # noinspection PyProtectedMember
+            if tp._instrumentation:
+                # noinspection PyProtectedMember
+                tp._stats.add_call(duration, data.valid, data.seq, data.timestamp)
+            # noinspection PyProtectedMember
+            result.append(tp._dll_touch_info_to(data, TouchInfo(False, 0, 0)))
+            tp._last_seq = data.seq
+
+        return result
+
+    #----------------------------------------------------------------
+    def _validate_library(self):
+        """
+        Check that all the touchpads use the same DLL (the DLLs of unconnected touchpads may not be loaded yet)
+        """
+        # noinspection PyProtectedMember
+        libraries = set(tp._library for tp in self._touchpads if tp._library is not None)
+        if len(libraries) > 1:
+            raise ValueError("Invalid 'touchpads' argument - all touchpads must use the same DLL")
@@ -2,9 +2,30 @@
 #   TrajTracker external I/O interfaces: tsc2017 replacements
 #------------------------------------------------------------------------------
 
+import sys
+
+
 def version():
     return 1, 0, 0
 
 
-from ._tsc2017 import Touchpad, TouchInfo, TSCError
+from ._tsc2017 import Touchpad, TouchInfo, TransformPlan, LookupTable, TSCError, find_devices
+from ._samples import get_samples_dtype, get_packed_sample_dtype, unpack_samples, flag_touched
+from ._streaming import SampleRingBuffer
+from ._resources import close_idle_resources
 from ._Mouse import Mouse
+from ._TouchpadGroup import TouchpadGroup
+
+
+#-- numpy is imported only when first used, so samples_dtype and packed_sample_dtype (numpy dtypes) are
+#-- created on first access
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name == "samples_dtype":
+            return get_samples_dtype()
+        if name == "packed_sample_dtype":
+            return get_packed_sample_dtype()
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+else:
+    samples_dtype = get_samples_dtype()
+    packed_sample_dtype = get_packed_sample_dtype()
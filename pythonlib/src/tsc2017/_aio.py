@@ -0,0 +1,153 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: asyncio support
+#
+#   This module uses Python 3 syntax, so it's imported only when its functions are used
+#------------------------------------------------------------------------------
+
+import asyncio
+
+
+#=================================================================================================
+class _SampleNotifier(object):
+    """
+    Wakes up an asyncio event loop whenever the DLL reports a new sample from the device
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, touchpad):
+        self._touchpad = touchpad
+        self._loop = asyncio.get_event_loop()
+        self._sample_received = asyncio.Event()
+        # noinspection PyProtectedMember
+        touchpad._add_sample_listener(self._on_sample)
+
+    #------------------------------------------------------------
+    def _on_sample(self):
+        """
+        Called from the DLL's event thread
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._sample_received.set)
+        except RuntimeError:
+            pass  # The event loop was closed
+
+    #------------------------------------------------------------
+    def sample_count(self):
+        # noinspection PyProtectedMember
+        return self._touchpad._sample_count()
+
+    #------------------------------------------------------------
+    async def wait(self, after_count):
+        """
+        Wait until the device's sample count differs from after_count
+
+        :return: The new sample count
+        """
+        while True:
+            self._sample_received.clear()
+            count = self.sample_count()
+            if count != after_count:
+                return count
+            await self._sample_received.wait()
+
+    #------------------------------------------------------------
+    def close(self):
+        # noinspection PyProtectedMember
+        self._touchpad._remove_sample_listener(self._on_sample)
+
+
+#=================================================================================================
+class TouchStream(object):
+    """
+    An asynchronous iterator over the samples received from a touchpad: each iteration waits (without
+    blocking the event loop) until a new sample arrives, and returns it as a :class:`~tsc2017.TouchInfo`.
+
+    If the samples arrive faster than they are consumed, each iteration returns the newest sample.
+
+    The stream gets notifications from the device until it's closed: use it in an ``async with`` statement,
+    or call :func:`aclose`. It's also closed when an iteration fails or is cancelled, and when the
+    stream is garbage-collected.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, touchpad):
+        self._touchpad = touchpad
+        self._notifier = None
+        self._sample_count = None
+
+    #------------------------------------------------------------
+    def __aiter__(self):
+        return self
+
+    #------------------------------------------------------------
+    async def __anext__(self):
+        if self._notifier is None:
+            self._notifier = _SampleNotifier(self._touchpad)
+            self._sample_count = self._notifier.sample_count()
+
+        completed = False
+        try:
+            self._sample_count = await self._notifier.wait(self._sample_count)
+            # noinspection PyProtectedMember
+            ti = self._touchpad._poll_touch_data()
+            completed = True
+            return ti
+
+        finally:
+            #-- The iteration was cancelled (e.g. by a timeout) or failed: don't leave the listener installed
+            if not completed:
+                self.close()
+
+    #------------------------------------------------------------
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    #------------------------------------------------------------
+    async def aclose(self):
+        """
+        Stop getting notifications from the device (like the aclose() of asynchronous generators)
+        """
+        self.close()
+
+    #------------------------------------------------------------
+    def close(self):
+        """
+        Stop getting notifications from the device
+        """
+        if self._notifier is not None:
+            self._notifier.close()
+            self._notifier = None
+
+    #------------------------------------------------------------
+    def __del__(self):
+        self.close()
+
+
+#-----------------------------------------------------------------
+async def next_touch(touchpad, timeout=None):
+    """
+    Wait until the touchpad is touched (returns immediately if it's already touched)
+
+    :return: TouchInfo, or None if the wait timed out
+    """
+
+    notifier = _SampleNotifier(touchpad)
+
+    async def wait_for_touch():
+        while True:
+            count = notifier.sample_count()
+            # noinspection PyProtectedMember
+            ti = touchpad._poll_touch_data()
+            if ti.touched:
+                return ti
+            await notifier.wait(count)
+
+    try:
+        return await asyncio.wait_for(wait_for_touch(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        notifier.close()
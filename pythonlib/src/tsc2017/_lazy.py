@@ -0,0 +1,48 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: deferred imports
+#
+#   "import tsc2017" should be fast, so heavy modules (numpy) are imported only
+#   when a function that needs them is first called.
+#------------------------------------------------------------------------------
+
+import importlib
+
+
+#=================================================================================================
+class LazyModule(object):
+    """
+    A placeholder for a module, which imports the module when one of its attributes is first used
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, module_name):
+        self._module_name = module_name
+        self._module = None
+
+    #------------------------------------------------------------
+    def __getattr__(self, name):
+        if self._module is None:
+            self._module = importlib.import_module(self._module_name)
+        return getattr(self._module, name)
+
+
+#-----------------------------------------------------------------
+def cached(factory):
+    """
+    A decorator for functions without arguments: the function is called only once, and later calls
+    return the same value
+    """
+    values = []
+
+    def get():
+        if len(values) == 0:
+            values.append(factory())
+        return values[0]
+
+    get.__name__ = factory.__name__
+    get.__doc__ = factory.__doc__
+    return get
+
+
+#-- numpy, imported when first used
+numpy = LazyModule("numpy")
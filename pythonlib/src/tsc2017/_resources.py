@@ -0,0 +1,206 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: VISA resources shared by all Touchpad objects
+#------------------------------------------------------------------------------
+
+import atexit
+import ctypes
+import threading
+import time
+
+
+#=================================================================================================
+class _ManagerEntry(object):
+    """
+    The resources of one DLL
+    """
+
+    __slots__ = "resource_manager", "n_users", "idle_sessions"
+
+    def __init__(self, resource_manager):
+        self.resource_manager = resource_manager
+        self.n_users = 0
+        self.idle_sessions = []  # (device name, session, idle since) of the open sessions that no Touchpad uses, oldest first
+
+
+#=================================================================================================
+class ResourcePool(object):
+    """
+    The VISA resources of the process, shared by all Touchpad objects that use the same DLL:
+
+    - One resource manager per DLL, with the number of Touchpad objects that use it
+    - Idle device sessions: when a Touchpad disconnects from a device, the device's session remains open, so
+      connecting to this device again (by any Touchpad) does not need to open a new VISA session.
+      The device's interrupts are disabled while the session is idle.
+
+    At most max_idle_sessions sessions per DLL remain idle (the oldest ones are closed first), each for at most
+    max_idle_time seconds. Idle resources are also closed by :func:`close_idle`, which is called when the
+    program exits.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, max_idle_sessions=4, max_idle_time=60):
+        self._lock = threading.Lock()
+        self._entries = {}  # library -> _ManagerEntry
+        self._max_idle_sessions = max_idle_sessions
+        self._max_idle_time = max_idle_time
+        self._expiry_timer = None
+
+    #------------------------------------------------------------
+    def acquire_manager(self, library):
+        """
+        Get the DLL's resource manager (creating it if needed). Each call must be matched by a call
+        to :func:`release_manager`
+
+        :return: The resource manager, or 0 if it could not be created
+        """
+        with self._lock:
+            entry = self._entries.get(library)
+            if entry is None:
+                resource_manager = library.create_resource_manager()
+                if resource_manager == 0:
+                    return 0
+                entry = _ManagerEntry(resource_manager)
+                self._entries[library] = entry
+
+            entry.n_users += 1
+            return entry.resource_manager
+
+    #------------------------------------------------------------
+    def release_manager(self, library):
+        """
+        Stop using the DLL's resource manager. The resource manager remains open (idle) when no one uses it.
+        """
+        with self._lock:
+            entry = self._entries.get(library)
+            if entry is not None and entry.n_users > 0:
+                entry.n_users -= 1
+
+    #------------------------------------------------------------
+    def open_session(self, library, device_name):
+        """
+        Open a session with a device: reuse an idle session with this device if there is one (after enabling
+        its interrupts again and discarding its old samples), or connect to the device otherwise.
+        The DLL's resource manager must have been acquired.
+
+        :param device_name: The USB device ID (bytes)
+        :return: The session, or 0 if the connection failed
+        """
+        with self._lock:
+            entry = self._entries[library]
+            resource = self._take_idle_session(entry, device_name)
+            resource_manager = entry.resource_manager
+
+        if resource is not None:
+            if library.resume_events(ctypes.c_uint32(resource)):
+                library.clear_samples(ctypes.c_uint32(resource))
+                return resource
+            #-- The interrupts could not be enabled (e.g. the device was unplugged): open a new session
+            library.disconnect(ctypes.c_uint32(resource))
+
+        return library.connect(ctypes.c_uint32(resource_manager), ctypes.c_char_p(device_name))
+
+    #------------------------------------------------------------
+    def close_session(self, library, device_name, resource):
+        """
+        Stop using a session opened by :func:`open_session`. The session remains open (idle) with its interrupts
+        disabled, unless the DLL is too old to disable them and discard the session's samples.
+        """
+        if library.set_sample_callback is not None:
+            library.set_sample_callback(ctypes.c_uint32(resource), library.SampleCallback())
+
+        with self._lock:
+            entry = self._entries.get(library)
+            keep = entry is not None and self._max_idle_sessions > 0 and \
+                library.suspend_events is not None and library.clear_samples is not None
+
+            if not keep:
+                library.disconnect(ctypes.c_uint32(resource))
+                return
+
+            library.suspend_events(ctypes.c_uint32(resource))
+            entry.idle_sessions.append((device_name, resource, time.monotonic()))
+
+            while len(entry.idle_sessions) > self._max_idle_sessions:
+                _, oldest, _ = entry.idle_sessions.pop(0)
+                library.disconnect(ctypes.c_uint32(oldest))
+
+            self._schedule_expiry()
+
+    #------------------------------------------------------------
+    def close_idle(self):
+        """
+        Close all idle sessions, and the resource managers that are not used by any Touchpad
+        """
+        with self._lock:
+            for library, entry in list(self._entries.items()):
+                for _, resource, _ in entry.idle_sessions:
+                    library.disconnect(ctypes.c_uint32(resource))
+                entry.idle_sessions = []
+
+                if entry.n_users == 0:
+                    library.cleanup_resource_manager(ctypes.c_uint32(entry.resource_manager))
+                    del self._entries[library]
+
+    #------------------------------------------------------------
+    @staticmethod
+    def _take_idle_session(entry, device_name):
+        """
+        Remove the newest idle session with the device from the pool
+
+        :return: The session, or None if there is none
+        """
+        for i in range(len(entry.idle_sessions) - 1, -1, -1):
+            if entry.idle_sessions[i][0] == device_name:
+                return entry.idle_sessions.pop(i)[1]
+        return None
+
+    #------------------------------------------------------------
+    def _schedule_expiry(self):
+        """
+        Close the idle sessions when they expire (called with the lock held)
+        """
+        if self._expiry_timer is not None or self._max_idle_time is None:
+            return
+
+        idle_since = [s[2] for entry in self._entries.values() for s in entry.idle_sessions]
+        if len(idle_since) == 0:
+            return
+
+        delay = max(0, min(idle_since) + self._max_idle_time - time.monotonic())
+        self._expiry_timer = threading.Timer(delay, self._close_expired)
+        self._expiry_timer.daemon = True
+        self._expiry_timer.start()
+
+    #------------------------------------------------------------
+    def _close_expired(self):
+        """
+        Close the sessions that were idle for max_idle_time (called by the expiry timer)
+        """
+        with self._lock:
+            self._expiry_timer = None
+            now = time.monotonic()
+
+            for library, entry in self._entries.items():
+                expired = [s for s in entry.idle_sessions if now - s[2] >= self._max_idle_time]
+                for _, resource, _ in expired:
+                    library.disconnect(ctypes.c_uint32(resource))
+                entry.idle_sessions = [s for s in entry.idle_sessions if s not in expired]
+
+            self._schedule_expiry()
+
+
+#-- The pool of this process
+resource_pool = ResourcePool()
+atexit.register(resource_pool.close_idle)
+
+
+#-----------------------------------------------------------------
+def close_idle_resources():
+    """
+    Close the VISA resources that no :class:`~tsc2017.Touchpad` currently uses.
+
+    When a Touchpad disconnects or is closed, its VISA session and resource manager remain open, so creating
+    another Touchpad and reconnecting to the same device is fast. An idle session is closed after a minute, and
+    these resources are closed automatically when the program exits; call this function to close them earlier.
+    """
+    resource_pool.close_idle()
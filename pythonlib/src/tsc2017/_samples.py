@@ -0,0 +1,72 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: the numpy formats of samples
+#------------------------------------------------------------------------------
+
+from __future__ import division
+
+from ._lazy import numpy as np, cached
+
+
+#-- The bits of the "flags" field of packed samples
+flag_touched = 0x01
+
+#-- The range of coordinates in packed samples (int16)
+_min_coord = -32768
+_max_coord = 32767
+
+
+#-----------------------------------------------------------------
+@cached
+def get_samples_dtype():
+    """
+    The numpy dtype of the samples returned by Touchpad.read_samples() (available as tsc2017.samples_dtype)
+    """
+    return np.dtype([("touched", np.bool_), ("x", np.int32), ("y", np.int32), ("timestamp", np.float64),
+                     ("seq", np.uint32)])
+
+
+#-----------------------------------------------------------------
+@cached
+def get_packed_sample_dtype():
+    """
+    The canonical compact format of samples (available as tsc2017.packed_sample_dtype), used by
+    Touchpad.read_packed_samples(), the streaming ring buffer and recordings. 21 bytes per sample, no padding:
+
+    - raw_x, raw_y (int16): The TSC2017 coordinates
+    - x, y (int16): The screen coordinates
+    - flags (uint8): flag_touched
+    - seq (uint32): The sample's sequence number
+    - timestamp (uint64): When the sample was received, in nanoseconds on the time.perf_counter() clock
+
+    This is the layout of the DLL's packed_sample struct (except the timestamp, which the DLL reports in
+    QueryPerformanceCounter ticks).
+    """
+    return np.dtype([("raw_x", "<i2"), ("raw_y", "<i2"), ("x", "<i2"), ("y", "<i2"), ("flags", "u1"),
+                     ("seq", "<u4"), ("timestamp", "<u8")])
+
+
+#-----------------------------------------------------------------
+def clip_coord(value):
+    """
+    Clip a coordinate to the range of packed samples
+    """
+    return min(max(value, _min_coord), _max_coord)
+
+
+#-----------------------------------------------------------------
+def unpack_samples(packed):
+    """
+    Convert packed samples (:data:`tsc2017.packed_sample_dtype`) to the format returned by
+    :func:`tsc2017.Touchpad.read_samples` (:data:`tsc2017.samples_dtype`)
+
+    :param packed: numpy array of packed samples
+    :return: numpy structured array with the fields "touched" (bool), "x", "y" (int), "timestamp" (seconds)
+             and "seq"
+    """
+    samples = np.empty(len(packed), dtype=get_samples_dtype())
+    samples["touched"] = (packed["flags"] & flag_touched) != 0
+    samples["x"] = packed["x"]
+    samples["y"] = packed["y"]
+    samples["timestamp"] = packed["timestamp"] / 1e9
+    samples["seq"] = packed["seq"]
+    return samples
@@ -0,0 +1,167 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: instrumentation of the Touchpad hot path
+#------------------------------------------------------------------------------
+
+from __future__ import division
+
+import ctypes
+
+
+#-----------------------------------------------------------------
+#-- The counters returned from the DLL's get_device_stats() function
+class DLLDeviceStats(ctypes.Structure):
+    _fields_ = ("interrupts_received", ctypes.c_uint64), ("interrupts_ignored", ctypes.c_uint64), \
+               ("samples_overwritten", ctypes.c_uint64), ("samples_read", ctypes.c_uint64)
+
+
+#=================================================================================================
+class LatencyHistogram(object):
+    """
+    A histogram of durations with logarithmic bucket sizes (HDR-style): durations are kept in
+    nanoseconds, with 16 buckets per power of two, i.e., with a relative error of up to ~6%.
+    Recording a value takes constant time and no memory allocation.
+    """
+
+    _sub_bucket_bits = 4
+    _sub_bucket_count = 1 << _sub_bucket_bits
+
+    #------------------------------------------------------------
+    def __init__(self):
+        self._counts = [0] * (64 * self._sub_bucket_count)
+        self.reset()
+
+    #------------------------------------------------------------
+    def reset(self):
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    #------------------------------------------------------------
+    def record(self, duration):
+        """
+        Add a duration (in seconds) to the histogram
+        """
+        ns = int(duration * 1e9)
+        if ns < 0:
+            ns = 0
+
+        self._counts[self._bucket_of(ns)] += 1
+        self.count += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+    #------------------------------------------------------------
+    def _bucket_of(self, ns):
+        shift = ns.bit_length() - self._sub_bucket_bits - 1
+        if shift <= 0:
+            return ns
+        return (shift << self._sub_bucket_bits) + (ns >> shift)
+
+    #------------------------------------------------------------
+    def _bucket_max_value(self, bucket):
+        shift = (bucket >> self._sub_bucket_bits) - 1
+        if shift <= 0:
+            return bucket
+        mantissa = (bucket & (self._sub_bucket_count - 1)) + self._sub_bucket_count
+        return ((mantissa + 1) << shift) - 1
+
+    #------------------------------------------------------------
+    def percentile(self, percent):
+        """
+        Get the duration (in seconds) below which the given percentage of the recorded durations fall
+
+        :return: The duration, or None if no durations were recorded
+        """
+        if self.count == 0:
+            return None
+
+        threshold = self.count * percent / 100
+        n = 0
+        for bucket, bucket_count in enumerate(self._counts):
+            n += bucket_count
+            if bucket_count > 0 and n >= threshold:
+                return min(self._bucket_max_value(bucket) / 1e9, self.max)
+
+        return self.max
+
+    #------------------------------------------------------------
+    def summary(self):
+        """
+        :return: dict with the number of recorded durations, and their min, mean, median (p50), p90, p99 and max
+                 (in seconds)
+        """
+        return dict(count=self.count,
+                    min=self.min,
+                    mean=self.total / self.count if self.count > 0 else None,
+                    p50=self.percentile(50),
+                    p90=self.percentile(90),
+                    p99=self.percentile(99),
+                    max=self.max)
+
+
+#=================================================================================================
+class TouchpadStats(object):
+    """
+    Counters of the calls that read the touch data from the DLL
+    """
+
+    #------------------------------------------------------------
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.reset()
+
+    #------------------------------------------------------------
+    def reset(self):
+        self.n_calls = 0
+        self.n_invalid = 0
+        self.n_repeated = 0
+        self.n_missed = 0
+        self.last_seq = None
+        self.first_sample = None   # (seq, timestamp)
+        self.last_sample = None    # (seq, timestamp)
+        self.latency.reset()
+
+    #------------------------------------------------------------
+    def add_call(self, duration, valid, seq, timestamp):
+        """
+        Count one call to the DLL
+
+        :param duration: The call's duration (seconds)
+        :param valid: Whether the DLL returned valid data
+        :param seq: The sequence number of the returned sample
+        :param timestamp: The timestamp of the returned sample (in the DLL's units)
+        """
+        self.n_calls += 1
+        self.latency.record(duration)
+
+        if not valid:
+            self.n_invalid += 1
+            return
+
+        if seq == self.last_seq:
+            self.n_repeated += 1
+            return
+
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.n_missed += seq - self.last_seq - 1
+        self.last_seq = seq
+
+        if self.first_sample is None:
+            self.first_sample = seq, timestamp
+        self.last_sample = seq, timestamp
+
+    #------------------------------------------------------------
+    def sample_rate(self, timestamp_scale):
+        """
+        The device's effective sample rate (samples per second), based on the samples' sequence numbers and
+        timestamps; or None if not enough samples were read
+        """
+        if self.first_sample is None or self.last_sample[1] == self.first_sample[1]:
+            return None
+        return (self.last_sample[0] - self.first_sample[0]) / ((self.last_sample[1] - self.first_sample[1]) * timestamp_scale)
@@ -0,0 +1,166 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: sampling the TSC2017 in a background thread
+#------------------------------------------------------------------------------
+
+from __future__ import division
+
+import time
+import threading
+
+from ._lazy import numpy as np
+from ._samples import get_packed_sample_dtype, clip_coord, flag_touched
+
+
+#-- The clock used for timestamping samples
+clock = getattr(time, "perf_counter", time.time)
+
+#=================================================================================================
+class SampleRingBuffer(object):
+    """
+    A preallocated buffer that keeps the most recent samples (in the compact format,
+    :data:`tsc2017.packed_sample_dtype`). When the buffer is full, each new sample overwrites the oldest one.
+
+    The buffer is written by a single thread (the sampler). Readers can access it from any thread.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, capacity):
+
+        from ._tsc2017 import _set_touch_info
+
+        self._samples = np.zeros(capacity, dtype=get_packed_sample_dtype())
+        self._n_written = 0
+
+        #-- Views of the fields, for reading a single sample without copying its record
+        self._flags = self._samples["flags"]
+        self._x = self._samples["x"]
+        self._y = self._samples["y"]
+        self._seq = self._samples["seq"]
+        self._timestamp = self._samples["timestamp"]
+        self._set_touch_info = _set_touch_info
+
+    #------------------------------------------------------------
+    @property
+    def capacity(self):
+        """
+        The maximal number of samples kept in the buffer
+        """
+        return len(self._samples)
+
+    #------------------------------------------------------------
+    @property
+    def n_written(self):
+        """
+        The number of samples written to the buffer since it was created (including overwritten samples)
+        """
+        return self._n_written
+
+    #------------------------------------------------------------
+    def append(self, timestamp, touched, x, y, seq, raw_x=0, raw_y=0):
+        """
+        Add a sample
+
+        :param timestamp: In seconds
+        """
+        self._samples[self._n_written % len(self._samples)] = \
+            (raw_x, raw_y, clip_coord(x), clip_coord(y), flag_touched if touched else 0, seq, round(timestamp * 1e9))
+        self._n_written += 1
+
+    #------------------------------------------------------------
+    def latest_into(self, out, skip_seq=None):
+        """
+        Copy the newest sample in the buffer into an existing object, without creating a new record
+
+        :param out: A :class:`~tsc2017.TouchInfo`, or a numpy record with the fields "touched", "x", "y",
+                    "timestamp" (seconds) and "seq"
+        :param skip_seq: If the newest sample has this sequence number, *out* is not changed
+        :return: The newest sample's sequence number, or None if the buffer is empty
+        """
+        capacity = len(self._samples)
+        while True:
+            n = self._n_written
+            if n == 0:
+                return None
+
+            i = (n - 1) % capacity
+            seq = int(self._seq[i])
+            if seq != skip_seq:
+                self._set_touch_info(out, bool(self._flags[i] & flag_touched), int(self._x[i]), int(self._y[i]),
+                                     int(self._timestamp[i]) / 1e9, seq)
+
+            #-- Retry if the writer reused the slot meanwhile (it's reused only after capacity - 1 more samples)
+            if self._n_written - n < capacity:
+                return seq
+
+    #------------------------------------------------------------
+    def get_samples(self):
+        """
+        Get a copy of all samples currently in the buffer, from the oldest to the newest
+
+        :return: numpy structured array (:data:`tsc2017.packed_sample_dtype`)
+        """
+        n = self._n_written
+        capacity = len(self._samples)
+        if n <= capacity:
+            return self._samples[:n].copy()
+
+        first = n % capacity
+        return np.concatenate((self._samples[first:], self._samples[:first]))
+
+
+#=================================================================================================
+class Sampler(threading.Thread):
+    """
+    A thread that samples a touchpad at a fixed rate and writes the samples to a SampleRingBuffer.
+    When the touchpad is recording, the thread also writes all samples received since the previous
+    iteration to the recording (see Touchpad.record()).
+
+    Each sample is stored once, with the time when the device sent it (or the polling time, if no sample was
+    received yet): polling again before a new sample arrives doesn't add it again.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, touchpad, rate_hz, ring_buffer):
+        super(Sampler, self).__init__(name="tsc2017-sampler")
+        self.daemon = True
+        self._touchpad = touchpad
+        self._interval = 1 / rate_hz
+        self._ring_buffer = ring_buffer
+        self._stop_requested = False
+
+    #------------------------------------------------------------
+    def run(self):
+
+        from ._tsc2017 import TouchInfo
+
+        touchpad = self._touchpad
+        ti = TouchInfo(False, 0, 0)
+        last_seq = None
+        next_sample_time = clock()
+
+        while not self._stop_requested:
+
+            # noinspection PyProtectedMember
+            data = touchpad._poll_dll_touch_info()
+            if data.seq != last_seq:
+                last_seq = data.seq
+                # noinspection PyProtectedMember
+                touchpad._dll_touch_info_to(data, ti)
+                self._ring_buffer.append(clock() if ti.timestamp is None else ti.timestamp, ti.touched, ti.x, ti.y,
+                                         ti.seq, int(data.x), int(data.y))
+            # noinspection PyProtectedMember
+            touchpad._record_new_samples()
+
+            next_sample_time += self._interval
+            delay = next_sample_time - clock()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                #-- We're late: don't try to catch up with the missed samples
+                next_sample_time = clock()
+
+    #------------------------------------------------------------
+    def stop(self):
+        self._stop_requested = True
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
@@ -5,18 +5,39 @@
 from __future__ import division
 
 import os
+import sys
+import time
 import ctypes
-import numpy as np
 import numbers
+import threading
+import weakref
+
+from ._streaming import SampleRingBuffer, Sampler, clock
+from ._samples import get_packed_sample_dtype, unpack_samples
+from ._stats import TouchpadStats, DLLDeviceStats
+from ._resources import resource_pool
+from ._lazy import numpy as np
 
 
 #-----------------------------------------------------------------
 class TouchInfo(object):
+    """
+    Touch information: whether the touchpad was touched, the (x, y) screen coordinates, the time
+    when the sample was received from the device (in seconds, on the time.perf_counter() clock; None
+    if unknown), and the sample's sequence number.
+
+    Sequence numbers are counted per connection, starting from 1 (0 = no sample was received yet).
+    A gap between the sequence numbers of two samples indicates how many samples were not read.
+    """
 
-    def __init__(self, touched, x, y):
+    __slots__ = "touched", "x", "y", "timestamp", "seq"
+
+    def __init__(self, touched, x, y, timestamp=None, seq=None):
         self.touched = touched
         self.x = x
         self.y = y
+        self.timestamp = timestamp
+        self.seq = seq
 
     def __str__(self):
         if self.touched:
@@ -25,6 +46,25 @@ class TouchInfo(object):
             return "No touched"
 
 
+#-----------------------------------------------------------------
+def _set_touch_info(out, touched, x, y, timestamp, seq):
+    """
+    Update a TouchInfo object or a numpy record
+    """
+    if isinstance(out, TouchInfo):
+        out.touched = touched
+        out.x = x
+        out.y = y
+        out.timestamp = timestamp
+        out.seq = seq
+    else:
+        out["touched"] = touched
+        out["x"] = x
+        out["y"] = y
+        out["timestamp"] = np.nan if timestamp is None else timestamp
+        out["seq"] = 0 if seq is None else seq
+
+
 #-----------------------------------------------------------------
 class TSCError(Exception):
     def __init__(self, message):
@@ -41,15 +81,58 @@ class DLLFuncs(object):
         self.dll = dll
         self.dll_path = dll_path
 
-    def add_func(self, name_in_python, name_in_dll, prototype, params):
-        func = prototype((name_in_dll, self.dll), params)
+    def add_func(self, name_in_python, name_in_dll, prototype, params, optional=False):
+        """
+        :param optional: Whether the function may be missing from the DLL (older DLLs export only the functions
+                         that connect to the device and get the touch info). A missing function is set to None.
+        """
+        try:
+            func = prototype((name_in_dll, self.dll), params)
+        except AttributeError:
+            if not optional:
+                raise
+            func = None
         setattr(self, name_in_python, func)
 
+    def require(self, name_in_python, feature):
+        """
+        Raise TSCError if the DLL does not export the given (optional) function
+        """
+        if getattr(self, name_in_python) is None:
+            raise TSCError("{:} is not supported by the DLL ({:}), which is too old. Please use a newer connect_tsc.dll".
+                           format(feature, self.dll_path))
+
 
 #-----------------------------------------------------------------
 #-- The value returned from the DLL's get_touch_info() function
 class DLLTouchInfo(ctypes.Structure):
-    _fields_ = ("valid", ctypes.c_int), ("touched", ctypes.c_int), ("x", ctypes.c_float), ("y", ctypes.c_float)  #, ("z", ctypes.c_float)
+    _fields_ = ("valid", ctypes.c_int), ("touched", ctypes.c_int), ("x", ctypes.c_float), ("y", ctypes.c_float), \
+               ("seq", ctypes.c_uint32), ("timestamp", ctypes.c_int64), \
+               ("screen_x", ctypes.c_int), ("screen_y", ctypes.c_int), ("transform_id", ctypes.c_int)
+
+
+#-----------------------------------------------------------------
+#-- The value returned from the get_touch_info() function of older DLLs (which don't have get_touch_info_into())
+class DLLLegacyTouchInfo(ctypes.Structure):
+    _fields_ = ("valid", ctypes.c_int), ("touched", ctypes.c_int), ("x", ctypes.c_float), ("y", ctypes.c_float)
+
+
+#-----------------------------------------------------------------
+#-- One sample returned from the DLL's read_packed_samples() function (same layout as packed_sample_dtype)
+class DLLPackedSample(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = ("raw_x", ctypes.c_int16), ("raw_y", ctypes.c_int16), ("x", ctypes.c_int16), ("y", ctypes.c_int16), \
+               ("flags", ctypes.c_uint8), ("seq", ctypes.c_uint32), ("timestamp", ctypes.c_uint64)
+
+
+#-- The DLLs loaded so far (DLLFuncs objects, by DLL path)
+_loaded_dlls = {}
+
+#-- The maximal number of samples the DLL queues between two calls to read_samples()
+sample_queue_capacity = 4096
+
+#-- How often the wait functions poll the device, with older DLLs that cannot wait for samples (in seconds)
+_legacy_poll_interval = 0.001
 
 
 #-----------------------------------------------------------------
@@ -65,48 +148,453 @@ def is_coord(value, allow_float=False):
     return is_collection(value) and len(value) == 2 and \
            isinstance(value[0], elem_type) and isinstance(value[1], elem_type)
 
+
+#-- Round to the nearest integer, with ties rounded to even (like np.round())
+if sys.version_info[0] >= 3:
+    _round = round
+else:
+    _round = lambda value: int(np.round(value))
+
 #=================================================================================================
 
 
 touchpad_full_size = (4096, 4096)
 
 
+#-----------------------------------------------------------------
+class TransformPlan(object):
+    """
+    A precompiled transformation from raw TSC2017 coordinates (0-4095) to screen coordinates.
+
+    In the general (projective) case, the transformation is:
+
+    - w = raw_x * persp_x + raw_y * persp_y + 1
+    - screen_x = round((raw_x * scale_x + raw_y * shear_x + offset_x) / w)
+    - screen_y = round((raw_x * shear_y + raw_y * scale_y + offset_y) / w)
+
+    For an affine plan (persp_x = persp_y = 0), w is not computed; and when also shear_x = shear_y = 0,
+    each coordinate is transformed with a single multiply-add.
+
+    :class:`~tsc2017.Touchpad` compiles this plan from its :attr:`~tsc2017.Touchpad.scale_coords_by` and
+    :attr:`~tsc2017.Touchpad.shift_coords_by` (including the centering of the touchpad's coordinates).
+    A plan can also be created from a calibration (see :mod:`tsc2017.calibration`) and assigned to
+    :attr:`~tsc2017.Touchpad.transform_plan`.
+    """
+
+    __slots__ = "scale_x", "scale_y", "offset_x", "offset_y", "shear_x", "shear_y", "persp_x", "persp_y", \
+                "_kind"
+
+    #------------------------------------------------------------
+    def __init__(self, scale_x=1.0, scale_y=1.0, offset_x=0.0, offset_y=0.0, shear_x=0.0, shear_y=0.0,
+                 persp_x=0.0, persp_y=0.0):
+        self.scale_x = float(scale_x)
+        self.scale_y = float(scale_y)
+        self.offset_x = float(offset_x)
+        self.offset_y = float(offset_y)
+        self.shear_x = float(shear_x)
+        self.shear_y = float(shear_y)
+        self.persp_x = float(persp_x)
+        self.persp_y = float(persp_y)
+
+        if self.persp_x != 0 or self.persp_y != 0:
+            self._kind = "projective"
+        elif self.shear_x != 0 or self.shear_y != 0:
+            self._kind = "affine"
+        else:
+            self._kind = "scale"
+
+    #------------------------------------------------------------
+    @classmethod
+    def compile(cls, scale_coords_by=None, shift_coords_by=None):
+        """
+        Create the plan that centers the touchpad coordinates, scales them and then shifts them
+
+        :param scale_coords_by: (x scale, y scale) or None
+        :param shift_coords_by: (x shift, y shift) or None
+        """
+        scale_x, scale_y = (1, 1) if scale_coords_by is None else scale_coords_by
+        shift_x, shift_y = (0, 0) if shift_coords_by is None else shift_coords_by
+        center_x = touchpad_full_size[0] / 2
+        center_y = touchpad_full_size[1] / 2
+
+        return cls(scale_x, scale_y, shift_x - center_x * scale_x, shift_y - center_y * scale_y)
+
+    #------------------------------------------------------------
+    @classmethod
+    def from_matrix(cls, matrix):
+        """
+        Create a plan from a transformation matrix, which transforms (raw_x, raw_y, 1) column vectors
+
+        :param matrix: 2x3 (affine) or 3x3 (projective) matrix
+        """
+        m = np.array(matrix, dtype=np.float64)
+        if m.shape == (2, 3):
+            m = np.vstack((m, (0, 0, 1)))
+        elif m.shape != (3, 3):
+            raise ValueError("{:}.from_matrix(): the matrix must be 2x3 or 3x3 (got shape {:})".
+                             format(cls.__name__, m.shape))
+
+        if m[2, 2] == 0:
+            raise ValueError("{:}.from_matrix(): invalid matrix (its bottom-right element is 0)".format(cls.__name__))
+        m /= m[2, 2]
+
+        return cls(scale_x=m[0, 0], shear_x=m[0, 1], offset_x=m[0, 2],
+                   shear_y=m[1, 0], scale_y=m[1, 1], offset_y=m[1, 2],
+                   persp_x=m[2, 0], persp_y=m[2, 1])
+
+    #------------------------------------------------------------
+    @property
+    def kind(self):
+        """
+        "scale" (scale and offset only), "affine" or "projective"
+        """
+        return self._kind
+
+    #------------------------------------------------------------
+    def apply(self, raw_x, raw_y):
+        """
+        Transform one sample
+
+        :return: (x, y) screen coordinates (int)
+        """
+        if self._kind == "scale":
+            return _round(raw_x * self.scale_x + self.offset_x), _round(raw_y * self.scale_y + self.offset_y)
+
+        x = raw_x * self.scale_x + raw_y * self.shear_x + self.offset_x
+        y = raw_x * self.shear_y + raw_y * self.scale_y + self.offset_y
+        if self._kind == "projective":
+            w = raw_x * self.persp_x + raw_y * self.persp_y + 1
+            x /= w
+            y /= w
+
+        return _round(x), _round(y)
+
+    #------------------------------------------------------------
+    def apply_batch(self, raw_xy):
+        """
+        Transform many samples at once. The results are identical to calling :func:`apply` per sample.
+
+        :param raw_xy: Array-like of N (x, y) raw coordinates
+        :return: numpy array of shape (N, 2) with the screen coordinates (int32)
+        """
+        raw = np.array(raw_xy, dtype=np.float64)
+
+        if self._kind == "scale":
+            raw *= (self.scale_x, self.scale_y)
+            raw += (self.offset_x, self.offset_y)
+            return np.round(raw).astype(np.int32)
+
+        #-- Same operations, in the same order, as in apply()
+        raw_x = raw[:, 0]
+        raw_y = raw[:, 1]
+        xy = np.empty_like(raw)
+        xy[:, 0] = raw_x * self.scale_x + raw_y * self.shear_x + self.offset_x
+        xy[:, 1] = raw_x * self.shear_y + raw_y * self.scale_y + self.offset_y
+        if self._kind == "projective":
+            w = raw_x * self.persp_x + raw_y * self.persp_y + 1
+            xy /= w[:, np.newaxis]
+
+        return np.round(xy).astype(np.int32)
+
+    #------------------------------------------------------------
+    @property
+    def matrix(self):
+        """
+        The plan as a 3x3 transformation matrix, which transforms (raw_x, raw_y, 1) column vectors
+        """
+        return np.array([[self.scale_x, self.shear_x, self.offset_x],
+                         [self.shear_y, self.scale_y, self.offset_y],
+                         [self.persp_x, self.persp_y, 1]])
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        if self._kind == "scale":
+            return "{:}(scale_x={:}, scale_y={:}, offset_x={:}, offset_y={:})".format(
+                type(self).__name__, self.scale_x, self.scale_y, self.offset_x, self.offset_y)
+        return "{:}.from_matrix({:})".format(type(self).__name__, self.matrix.tolist())
+
+
+#=================================================================================================
+class LookupTable(object):
+    """
+    A precomputed transformation from raw TSC2017 coordinates to screen coordinates, for nonlinear
+    calibrations (see :func:`tsc2017.calibration.fit_polynomial`).
+
+    The table keeps the screen coordinates of a grid of raw coordinates (every *step* raw units, in both
+    directions), and the coordinates between grid nodes are interpolated bilinearly. Transforming a sample
+    therefore takes constant time, however complex the calibration model is.
+
+    The table is saved as a .npy file; :func:`load` memory-maps it, so it's available immediately
+    (pages are read from the disk only when used).
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, table):
+        """
+        :param table: Array of shape (n, n, 2): table[i, j] is the (x, y) screen coordinates of the raw
+                      coordinates (i * step, j * step), where step = 4096 / (n - 1) must be a power of 2
+        """
+        shape = np.shape(table)
+        if len(shape) != 3 or shape[0] != shape[1] or shape[2] != 2 or shape[0] < 2 or \
+                touchpad_full_size[0] % (shape[0] - 1) != 0:
+            raise ValueError("{:}: invalid table shape {:}".format(type(self).__name__, shape))
+
+        self._table = table
+        self._step = touchpad_full_size[0] // (shape[0] - 1)
+        self._max_node = shape[0] - 2
+
+    #------------------------------------------------------------
+    @classmethod
+    def build(cls, func, step=16):
+        """
+        Create a lookup table by evaluating a transformation on the grid nodes
+
+        :param func: A function that gets an (N, 2) array of raw coordinates and returns an (N, 2) array
+                     of the corresponding screen coordinates (float)
+        :param step: The distance between grid nodes, in raw units (a power of 2)
+        """
+        if not isinstance(step, numbers.Integral) or step < 1 or touchpad_full_size[0] % step != 0:
+            raise ValueError("{:}.build(): step must be a power of 2 up to {:} (got {:})".
+                             format(cls.__name__, touchpad_full_size[0], step))
+
+        nodes = np.arange(0, touchpad_full_size[0] + 1, step, dtype=np.float64)
+        raw_x, raw_y = np.meshgrid(nodes, nodes, indexing="ij")
+        screen_xy = np.asarray(func(np.column_stack((raw_x.ravel(), raw_y.ravel()))), dtype=np.float64)
+
+        return cls(screen_xy.reshape(len(nodes), len(nodes), 2).astype(np.float32))
+
+    #------------------------------------------------------------
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a table saved by :func:`save`
+
+        :param mmap: Whether to memory-map the file rather than read it
+        """
+        return cls(np.load(path, mmap_mode="r" if mmap else None))
+
+    #------------------------------------------------------------
+    def save(self, path):
+        """
+        Save the table as a .npy file
+        """
+        np.save(path, np.asarray(self._table, dtype=np.float32))
+
+    #------------------------------------------------------------
+    @property
+    def step(self):
+        """
+        The distance between grid nodes, in raw units
+        """
+        return self._step
+
+    #------------------------------------------------------------
+    @property
+    def table(self):
+        """
+        The screen coordinates of the grid nodes: an array of shape (n, n, 2)
+        """
+        return self._table
+
+    #------------------------------------------------------------
+    def apply(self, raw_x, raw_y):
+        """
+        Transform one sample
+
+        :return: (x, y) screen coordinates (int)
+        """
+        step = self._step
+        max_raw = touchpad_full_size[0] - 1
+        raw_x = min(max(raw_x, 0), max_raw)
+        raw_y = min(max(raw_y, 0), max_raw)
+
+        i = min(int(raw_x) // step, self._max_node)
+        j = min(int(raw_y) // step, self._max_node)
+        tx = raw_x / step - i
+        ty = raw_y / step - j
+
+        (p00, p01), (p10, p11) = self._table[i:i+2, j:j+2].tolist()
+        x = (p00[0] * (1 - tx) + p10[0] * tx) * (1 - ty) + (p01[0] * (1 - tx) + p11[0] * tx) * ty
+        y = (p00[1] * (1 - tx) + p10[1] * tx) * (1 - ty) + (p01[1] * (1 - tx) + p11[1] * tx) * ty
+
+        return _round(x), _round(y)
+
+    #------------------------------------------------------------
+    def apply_batch(self, raw_xy):
+        """
+        Transform many samples at once. The results are identical to calling :func:`apply` per sample.
+
+        :param raw_xy: Array-like of N (x, y) raw coordinates
+        :return: numpy array of shape (N, 2) with the screen coordinates (int32)
+        """
+        raw = np.clip(np.array(raw_xy, dtype=np.float64), 0, touchpad_full_size[0] - 1)
+        raw_x = raw[:, 0]
+        raw_y = raw[:, 1]
+
+        #-- Same operations, in the same order, as in apply()
+        i = np.minimum(raw_x.astype(np.int64) // self._step, self._max_node)
+        j = np.minimum(raw_y.astype(np.int64) // self._step, self._max_node)
+        tx = (raw_x / self._step - i)[:, np.newaxis]
+        ty = (raw_y / self._step - j)[:, np.newaxis]
+
+        table = self._table
+        p00 = table[i, j].astype(np.float64)
+        p01 = table[i, j + 1].astype(np.float64)
+        p10 = table[i + 1, j].astype(np.float64)
+        p11 = table[i + 1, j + 1].astype(np.float64)
+        xy = (p00 * (1 - tx) + p10 * tx) * (1 - ty) + (p01 * (1 - tx) + p11 * tx) * ty
+
+        return np.round(xy).astype(np.int32)
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        return "{:}(step={:})".format(type(self).__name__, self._step)
+
+
 class Touchpad(object):
 
     #------------------------------------------------------------
-    def __init__(self, dll_path=None, scale_coords_by=None, shift_coords_by=None):
+    def __init__(self, dll_path=None, scale_coords_by=None, shift_coords_by=None, instrumentation=False,
+                 transform_plan=None, lookup_table=None):
         """
         Initialize the Touchpad object.
 
         :param dll_path: The full path to the tsc_connect.dll file. If you do not have this file,
                          dowload it from `here <https://github.com/trajtracker/tsc2017/raw/master/lib/connect_dll.dll>`_
+                         The DLL is loaded only when first needed (by :func:`~tsc2017.Touchpad.connect` or
+                         :func:`~tsc2017.Touchpad.find_devices`)
         :type dll_path: str
 
         :param scale_coords_by: See :attr:`~tsc2017.Touchpad.scale_coords_by`
         :param shift_coords_by: See :attr:`~tsc2017.Touchpad.shift_coords_by`
+        :param instrumentation: See :attr:`~tsc2017.Touchpad.instrumentation`
+        :param transform_plan: See :attr:`~tsc2017.Touchpad.transform_plan` (overrides scale_coords_by
+                               and shift_coords_by)
+        :param lookup_table: See :attr:`~tsc2017.Touchpad.lookup_table`
         """
 
-        self._init_dll(dll_path)
-        # noinspection PyUnresolvedReferences
-        self._resource_manager = self._library.create_resource_manager()
-
-        if self._resource_manager == 0:
-            raise TSCError('Could not create a resource manager')
+        #-- The DLL is loaded, and the resource manager created, only when needed (see _open_library())
+        self._dll_path = dll_path
+        self._library = None
+        self._resource_manager = None
 
+        self._closed = False
         self._resource = None
+        self._device_name = None
+        self._resource_handle = None
+        self._touch_info_buf = DLLTouchInfo()
+        self._touch_info_ptr = ctypes.pointer(self._touch_info_buf)
+        self._timestamp_scale = 0
+        self._timestamp_offset = 0
+        self._samples_buf = None
+        self._samples_lock = threading.Lock()
+        self._sample_listeners = []
+        self._dll_sample_callback = None
+        self._dll_sample_callback_set = False
+        self._sampler = None
+        self._stream_buffer = None
+        self._recorder = None
+        self._recorder_lock = threading.Lock()
+        self._recording_started_streaming = False
+        self._scale_coords_by = None
+        self._shift_coords_by = None
+        self._lookup_table = None
+        self._filters = None
+        self._filtered_seq = None
+        self._filtered_xy = None
+        self._filter_lock = threading.Lock()
+        self._dll_transform_id = 0
+        self._legacy_lock = threading.Lock()
+        self._legacy_touch_state = None
+        self._legacy_seq = 0
+        self._legacy_timestamp = 0
         self.scale_coords_by = scale_coords_by
         self.shift_coords_by = shift_coords_by
+        if transform_plan is not None:
+            self.transform_plan = transform_plan
+        self.lookup_table = lookup_table
 
         self._last_touch_data = None
+        self._last_seq = 0
+
+        self._stats = TouchpadStats()
+        self.instrumentation = instrumentation
+
+    #------------------------------------------------------------
+    @classmethod
+    def from_profile(cls, path, device_id=None, dll_path=None, connect=True):
+        """
+        Create a calibrated touchpad from a calibration profile (see :func:`tsc2017.calibration.save_profile`),
+        and connect to the device.
+
+        :param path: The profile file
+        :param device_id: The device to use. If the profile has a single device, this argument can be omitted.
+        :param dll_path: The DLL path (by default, the path saved in the profile)
+        :param connect: Whether to connect to the device
+        :return: Touchpad
+        """
+        from .calibration import load_profile
+        profile = load_profile(path, device_id)
+
+        touchpad = cls(dll_path=profile.dll_path if dll_path is None else dll_path,
+                       transform_plan=profile.transform_plan, lookup_table=profile.lookup_table)
+        if connect:
+            touchpad.connect(profile.device_id)
+
+        return touchpad
 
     #------------------------------------------------------------
     def __del__(self):
-        if hasattr(self, "_resource"):
-            self.disconnect()
+        if hasattr(self, "_closed") and ctypes is not None:   # ctypes may be None on program shutdown
+            self.close()
 
-        if hasattr(self, "_resource_manager") and ctypes is not None:   # ctypes may be None on program shutdown
-            # noinspection PyUnresolvedReferences
-            self._library.cleanup_resource_manager(ctypes.c_uint32(self._resource_manager))
+    #------------------------------------------------------------
+    def close(self):
+        """
+        Disconnect from the device and release the touchpad's resources. The touchpad cannot be used afterwards.
+
+        The VISA session and resource manager are kept open for reuse by other Touchpad objects
+        (see :func:`tsc2017.close_idle_resources`).
+
+        Instead of calling close(), you can use the touchpad as a context manager::
+
+            with tsc2017.Touchpad(dll_path) as touchpad:
+                touchpad.connect(device_id)
+                ...
+        """
+        if self._closed:
+            return
+
+        self.disconnect()
+        if self._resource_manager is not None:
+            resource_pool.release_manager(self._library)
+            self._resource_manager = None
+        self._closed = True
+
+    #------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    #------------------------------------------------------------
+    def _open_library(self):
+        """
+        Load the DLL and get a VISA resource manager, if not done yet
+        """
+        if self._resource_manager is not None:
+            return
+
+        if self._closed:
+            raise TSCError("Invalid state: {:} was already closed".format(type(self).__name__))
+
+        self._init_dll(self._dll_path)
+        resource_manager = resource_pool.acquire_manager(self._library)
+        if resource_manager == 0:
+            raise TSCError('Could not create a resource manager')
+
+        self._resource_manager = resource_manager
 
     #------------------------------------------------------------
     def _init_dll(self, dll_path):
@@ -114,6 +602,11 @@ class Touchpad(object):
         if dll_path is None:
             dll_path = os.environ['WINDIR'] + "\\System\\"
 
+        #-- Each DLL is loaded once; all touchpads that use it share its resources (see _resources.py)
+        if dll_path in _loaded_dlls:
+            self._library = _loaded_dlls[dll_path]
+            return
+
         dll = ctypes.WinDLL(dll_path)
 
         lib = DLLFuncs(dll, dll_path)
@@ -134,10 +627,102 @@ class Touchpad(object):
                      ctypes.WINFUNCTYPE(ctypes.c_uint32, ctypes.c_uint32, ctypes.c_char_p),
                      ((1, "resource_mgr"), (1, "resource_name")))
 
+        #-- Older DLLs don't have get_touch_info_into(), and their get_touch_info() returns a shorter struct
+        lib.add_func("get_touch_info_into", "get_touch_info_into",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32, ctypes.POINTER(DLLTouchInfo)),
+                     ((1, "resource"), (1, "ti")),
+                     optional=True)
+
+        touch_info_type = DLLLegacyTouchInfo if lib.get_touch_info_into is None else DLLTouchInfo
         lib.add_func("get_touch_info", "get_touch_info",
-                     ctypes.WINFUNCTYPE(DLLTouchInfo, ctypes.c_uint32),
+                     ctypes.WINFUNCTYPE(touch_info_type, ctypes.c_uint32),
                      ((1, "resource"), ))
 
+        #-- The functions below were added in later versions of the DLL, so they may be missing
+        lib.add_func("find_devices", "find_devices",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32, ctypes.c_char_p, ctypes.c_int),
+                     ((1, "resource_mgr"), (1, "buf"), (1, "buf_size")),
+                     optional=True)
+
+        lib.add_func("get_touch_info_multi", "get_touch_info_multi",
+                     ctypes.WINFUNCTYPE(None, ctypes.POINTER(ctypes.c_uint32), ctypes.c_int, ctypes.POINTER(DLLTouchInfo)),
+                     ((1, "resources"), (1, "n"), (1, "ti")),
+                     optional=True)
+
+        lib.add_func("read_packed_samples", "read_packed_samples",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32, ctypes.POINTER(DLLPackedSample), ctypes.c_int),
+                     ((1, "resource"), (1, "buf"), (1, "max_n")),
+                     optional=True)
+
+        lib.add_func("clear_samples", "clear_samples",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        lib.add_func("suspend_events", "suspend_events",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        lib.add_func("resume_events", "resume_events",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        lib.add_func("get_timestamp_frequency", "get_timestamp_frequency",
+                     ctypes.WINFUNCTYPE(ctypes.c_int64),
+                     (),
+                     optional=True)
+
+        lib.add_func("get_timestamp", "get_timestamp",
+                     ctypes.WINFUNCTYPE(ctypes.c_int64),
+                     (),
+                     optional=True)
+
+        lib.add_func("get_sample_count", "get_sample_count",
+                     ctypes.WINFUNCTYPE(ctypes.c_uint, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        lib.add_func("wait_for_sample", "wait_for_sample",
+                     ctypes.WINFUNCTYPE(ctypes.c_uint, ctypes.c_uint32, ctypes.c_uint, ctypes.c_int),
+                     ((1, "resource"), (1, "after_count"), (1, "timeout_ms")),
+                     optional=True)
+
+        lib.add_func("set_transform", "set_transform",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32, ctypes.POINTER(ctypes.c_double)),
+                     ((1, "resource"), (1, "matrix")),
+                     optional=True)
+
+        lib.add_func("set_lookup_table", "set_lookup_table",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32, ctypes.POINTER(ctypes.c_double), ctypes.c_int),
+                     ((1, "resource"), (1, "table"), (1, "n")),
+                     optional=True)
+
+        lib.add_func("clear_transform", "clear_transform",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        #-- A function called by the DLL whenever a sample is received from the device
+        lib.SampleCallback = ctypes.WINFUNCTYPE(None, ctypes.c_uint32)
+
+        lib.add_func("set_sample_callback", "set_sample_callback",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32, lib.SampleCallback),
+                     ((1, "resource"), (1, "callback")),
+                     optional=True)
+
+        lib.add_func("get_device_stats", "get_device_stats",
+                     ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint32, ctypes.POINTER(DLLDeviceStats)),
+                     ((1, "resource"), (1, "stats")),
+                     optional=True)
+
+        lib.add_func("reset_device_stats", "reset_device_stats",
+                     ctypes.WINFUNCTYPE(None, ctypes.c_uint32),
+                     ((1, "resource"), ),
+                     optional=True)
+
+        _loaded_dlls[dll_path] = lib
         self._library = lib
 
     #=============================================================================================
@@ -162,6 +747,7 @@ class Touchpad(object):
             raise TypeError("{:}.scale_coords_by was set to an incorrect value ({:})".
                             format(type(self).__name__, value))
         self._scale_coords_by = value
+        self._set_transform_plan(TransformPlan.compile(self._scale_coords_by, self._shift_coords_by))
 
     #------------------------------------------------------------
     @property
@@ -182,6 +768,136 @@ class Touchpad(object):
             raise TypeError("{:}.shift_coords_by was set to an incorrect value ({:})".
                             format(type(self).__name__, value))
         self._shift_coords_by = value
+        self._set_transform_plan(TransformPlan.compile(self._scale_coords_by, self._shift_coords_by))
+
+    #------------------------------------------------------------
+    @property
+    def transform_plan(self):
+        """
+        The precompiled transformation from raw TSC2017 coordinates to screen coordinates. It is rebuilt
+        whenever :attr:`~tsc2017.Touchpad.scale_coords_by` or :attr:`~tsc2017.Touchpad.shift_coords_by`
+        are changed.
+
+        You can also set a plan that was fitted with :mod:`tsc2017.calibration` (e.g., when the touchpad
+        is rotated relatively to the screen). Setting scale_coords_by or shift_coords_by afterwards
+        replaces this plan.
+
+        While connected, the transformation is applied by the DLL as soon as each sample is received.
+
+        :type: tsc2017.TransformPlan
+        """
+        return self._transform_plan
+
+    @transform_plan.setter
+    def transform_plan(self, value):
+        if not isinstance(value, TransformPlan):
+            raise TypeError("{:}.transform_plan was set to an incorrect value ({:})".
+                            format(type(self).__name__, value))
+        self._set_transform_plan(value)
+
+    def _set_transform_plan(self, plan):
+        self._transform_plan = plan
+        self._transform = plan if self._lookup_table is None else self._lookup_table
+        self._update_dll_transform()
+
+    #------------------------------------------------------------
+    @property
+    def lookup_table(self):
+        """
+        A lookup table with a nonlinear calibration (see :func:`tsc2017.calibration.fit_polynomial`).
+        When set, it transforms the raw TSC2017 coordinates instead of :attr:`~tsc2017.Touchpad.transform_plan`.
+        Set to None to use transform_plan again.
+
+        :type: tsc2017.LookupTable
+        """
+        return self._lookup_table
+
+    @lookup_table.setter
+    def lookup_table(self, value):
+        if value is not None and not isinstance(value, LookupTable):
+            raise TypeError("{:}.lookup_table was set to an incorrect value ({:})".
+                            format(type(self).__name__, value))
+        self._lookup_table = value
+        self._transform = self._transform_plan if value is None else value
+        self._update_dll_transform()
+
+    #------------------------------------------------------------
+    def _update_dll_transform(self):
+        """
+        Send the current transformation to the DLL, which then transforms each sample as soon as it's
+        received - so reading the touch data only needs to copy the screen coordinates.
+
+        Samples that the DLL transformed with an older transformation (received before the change) are
+        transformed here instead (see _dll_touch_info_to()), or again by the DLL's read_packed_samples().
+        """
+        #-- Older DLLs cannot transform the samples: they are transformed here
+        if self._resource is None or self._library.set_transform is None:
+            self._dll_transform_id = 0
+            return
+
+        if self._lookup_table is None:
+            plan = self._transform_plan
+            matrix = (ctypes.c_double * 9)(plan.scale_x, plan.shear_x, plan.offset_x,
+                                           plan.shear_y, plan.scale_y, plan.offset_y,
+                                           plan.persp_x, plan.persp_y, 1)
+            # noinspection PyUnresolvedReferences
+            transform_id = self._library.set_transform(self._resource_handle, matrix)
+        else:
+            table = np.ascontiguousarray(self._lookup_table.table, dtype=np.float64)
+            # noinspection PyUnresolvedReferences
+            transform_id = self._library.set_lookup_table(self._resource_handle,
+                                                          table.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+                                                          table.shape[0])
+
+        self._dll_transform_id = transform_id
+
+    #------------------------------------------------------------
+    @property
+    def filters(self):
+        """
+        A filter that smooths the screen coordinates (see :mod:`tsc2017.filters`), or None.
+
+        The filter is applied to each new sample returned by :func:`~tsc2017.Touchpad.get_touch_data`
+        (and the other functions that return :class:`~tsc2017.TouchInfo`, including while streaming).
+        A sample that is returned again (when no new sample arrived) is not filtered again.
+
+        The samples returned by :func:`~tsc2017.Touchpad.read_samples` and recorded by
+        :func:`~tsc2017.Touchpad.record` are not filtered; filter them with the filter's apply() function.
+
+        :type: tsc2017.filters.Filter
+        """
+        return self._filters
+
+    @filters.setter
+    def filters(self, value):
+        from .filters import Filter
+        if value is not None and not isinstance(value, Filter):
+            raise TypeError("{:}.filters was set to an incorrect value ({:})".format(type(self).__name__, value))
+
+        with self._filter_lock:
+            if value is not None:
+                value.reset()
+            self._filters = value
+            self._filtered_seq = None
+
+    #------------------------------------------------------------
+    @property
+    def instrumentation(self):
+        """
+        Whether to collect statistics about the reading of touch data (see :func:`~tsc2017.Touchpad.stats`).
+
+        When False, the only instrumentation overhead of reading the touch data is checking this flag.
+
+        :type: bool
+        """
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("{:}.instrumentation was set to an incorrect value ({:})".format(type(self).__name__, value))
+
+        self._instrumentation = value
 
     #=============================================================================================
     #     Communicate with the TSC2017 touchpad
@@ -196,66 +912,806 @@ class Touchpad(object):
                             "USB0::0x0451::0x2FD7::NI-VISA-30004::3::RAW", perhaps with a number other than
                             30004.
 
-                            To get the device ID, run NI-MAX and check out the list of devices connected to your computer.
+                            To get the device ID, call :func:`~tsc2017.Touchpad.find_devices`, or run NI-MAX and check
+                            out the list of devices connected to your computer. To connect to the first device
+                            found, use :func:`~tsc2017.Touchpad.connect_first`.
         :type device_name: str
         """
         if self._resource is not None:
             self.disconnect()
 
-        # noinspection PyUnresolvedReferences
-        resource = self._library.connect(ctypes.c_uint32(self._resource_manager), ctypes.c_char_p(device_name))
+        if not isinstance(device_name, bytes):
+            device_name = device_name.encode("ascii")
+
+        self._open_library()
+
+        resource = resource_pool.open_session(self._library, device_name)
         if resource == 0:
             raise TSCError('Could not connect to device {:}'.format(device_name))
 
         self._resource = resource
+        self._device_name = device_name
+        self._resource_handle = ctypes.c_uint32(resource)
+        self._last_seq = 0
+        self._legacy_touch_state = None
+        self._legacy_seq = 0
+        with self._filter_lock:
+            self._filtered_seq = None
+            if self._filters is not None:
+                self._filters.reset()
+        self._stats.reset()
+        self._sync_timestamps()
+        self._update_dll_transform()
 
     #------------------------------------------------------------
-    def disconnect(self):
+    def find_devices(self):
         """
-        Disconnect from the TSC2017 device
+        Find the TSC2017 devices connected to the computer
+
+        :return: list of USB device IDs (str), which can be passed to :func:`~tsc2017.Touchpad.connect`
         """
-        if self._resource is not None:
+        self._open_library()
+        self._library.require("find_devices", "find_devices()")
+
+        buf_size = 1024
+        while True:
+            buf = ctypes.create_string_buffer(buf_size)
             # noinspection PyUnresolvedReferences
-            self._library.disconnect(ctypes.c_uint32(self._resource))
-            self._resource = None
+            n_found = self._library.find_devices(ctypes.c_uint32(self._resource_manager), buf, buf_size)
+            names = buf.value.decode("ascii").split("\n") if buf.value else []
+            if len(names) >= n_found:
+                return names
+            buf_size *= 4
 
     #------------------------------------------------------------
-    def get_touch_data(self):
+    def connect_first(self):
         """
-        Get touch data from the TSC2017 device.
+        Connect to the first TSC2017 device found on the computer (see :func:`~tsc2017.Touchpad.find_devices`)
 
-        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+        :return: The USB device ID of the connected device (str)
+        """
+        devices = self.find_devices()
+        if len(devices) == 0:
+            raise TSCError("No TSC2017 device was found")
+
+        for device_id in devices:
+            try:
+                self.connect(device_id)
+                return device_id
+            except TSCError:
+                pass
 
-        :return: tuple: (touched=bool, x=int, y=int)
+        raise TSCError("Could not connect to any of the TSC2017 devices found ({:})".format(", ".join(devices)))
+
+    #------------------------------------------------------------
+    def disconnect(self):
+        """
+        Disconnect from the TSC2017 device. You can then connect again (to this device or to another one).
         """
+        self.stop_streaming()
 
-        if self._resource is None:
-            raise TSCError("Invalid state: {:}.get_data() cannot be called before connect()".format(type(self).__name__))
+        if self._resource is not None:
+            #-- The session remains open, for reuse when connecting to this device again
+            #-- (the next user sets its own transformation)
+            if self._library.clear_transform is not None:
+                # noinspection PyUnresolvedReferences
+                self._library.clear_transform(self._resource_handle)
+            resource_pool.close_session(self._library, self._device_name, self._resource)
+            self._resource = None
+            self._device_name = None
+            self._resource_handle = None
+            self._dll_transform_id = 0
+            self._sample_listeners = []
+            self._dll_sample_callback_set = False
+
+    #------------------------------------------------------------
+    def _sync_timestamps(self):
+        """
+        Find how to convert the DLL's timestamps to seconds on the time.perf_counter() clock
+        """
+        if self._library.get_timestamp_frequency is None:
+            #-- Older DLLs have no timestamps: the samples are timestamped here, in nanoseconds
+            self._timestamp_scale = 1e-9
+            self._timestamp_offset = 0
+            return
 
         # noinspection PyUnresolvedReferences
-        data = self._library.get_touch_info(ctypes.c_uint32(self._resource))
+        self._timestamp_scale = 1 / self._library.get_timestamp_frequency()
 
-        if not data.valid:
-            #-- No data available: get again the last available touch information
-            if self._last_touch_data is None:
-                return TouchInfo(False, 0, 0)
+        t0 = clock()
+        # noinspection PyUnresolvedReferences
+        dll_time = self._library.get_timestamp() * self._timestamp_scale
+        t1 = clock()
 
-            data = self._last_touch_data
+        self._timestamp_offset = (t0 + t1) / 2 - dll_time
 
-        #-- Get x, y coordinates, where (0, 0) is the center of the touchpad
-        x = data.x - touchpad_full_size[0] / 2
-        y = data.y - touchpad_full_size[1] / 2
+    #------------------------------------------------------------
+    def get_touch_data(self, only_new=False):
+        """
+        Get touch data from the TSC2017 device.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
 
-        #-- Transform
-        if self._scale_coords_by is not None:
-            x *= self._scale_coords_by[0]
-            y *= self._scale_coords_by[1]
+        If :func:`~tsc2017.Touchpad.start_streaming` was called, this function does not access the device;
+        it returns the newest sample collected by the sampling thread.
 
-        if self._shift_coords_by is not None:
-            x += self._shift_coords_by[0]
-            y += self._shift_coords_by[1]
+        :param only_new: If True, return None when no new sample arrived since the previous call to
+                         get_touch_data() / :func:`~tsc2017.Touchpad.get_touch_data_into`
+        :return: :class:`~tsc2017.TouchInfo` (touched, x, y, timestamp, seq)
+        """
 
-        x = int(np.round(x))
-        y = int(np.round(y))
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.get_data() cannot be called before connect()".format(type(self).__name__))
 
-        return TouchInfo(data.touched, x, y)
+        return self._get_touch_data_into(TouchInfo(False, 0, 0), only_new)
+
+    #------------------------------------------------------------
+    def get_touch_data_into(self, out, only_new=False):
+        """
+        Same as :func:`~tsc2017.Touchpad.get_touch_data`, but instead of creating a new
+        :class:`~tsc2017.TouchInfo` object, update an existing object.
+
+        Use this function when polling the touchpad at a high rate, to avoid creating a new object per sample.
+        It reuses internal buffers, so don't call it from several threads concurrently.
+
+        :param out: The object to update: a :class:`~tsc2017.TouchInfo`, or a numpy record with the fields
+                    "touched", "x", "y", "timestamp" and "seq" (e.g., an element of an array with dtype
+                    :data:`tsc2017.samples_dtype`)
+        :param only_new: If True and no new sample arrived since the previous call to
+                         :func:`~tsc2017.Touchpad.get_touch_data` / get_touch_data_into(), return None
+                         (and do not change *out*)
+        :return: out
+        """
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.get_touch_data_into() cannot be called before connect()".format(type(self).__name__))
+
+        return self._get_touch_data_into(out, only_new)
+
+    #------------------------------------------------------------
+    def _get_touch_data_into(self, out, only_new):
+
+        #-- Get the newest sample collected by the sampling thread (copied directly from its ring buffer slot)
+        seq = None
+        if self._sampler is not None:
+            seq = self._stream_buffer.latest_into(out, self._last_seq if only_new else None)
+            if only_new and seq == self._last_seq:
+                return None
+
+        if seq is None:
+            #-- Get the data from the DLL
+            data = self._get_dll_touch_info(self._touch_info_buf, self._touch_info_ptr)
+            seq = data.seq
+            if only_new and seq == self._last_seq:
+                return None
+            self._dll_touch_info_to(data, out)
+
+        self._last_seq = seq
+        return out
+
+    #------------------------------------------------------------
+    def _poll_touch_data(self):
+        """
+        Get the touch data from the DLL (this function can be called from any thread)
+        """
+        return self._dll_touch_info_to(self._poll_dll_touch_info(), TouchInfo(False, 0, 0))
+
+    def _poll_dll_touch_info(self):
+        """
+        Get the raw touch data from the DLL (a new DLLTouchInfo; this function can be called from any thread)
+        """
+        data = DLLTouchInfo()
+        return self._get_dll_touch_info(data, ctypes.pointer(data))
+
+    #------------------------------------------------------------
+    def _get_dll_touch_info(self, data, data_ptr):
+        """
+        Get the touch information from the DLL into the given DLLTouchInfo (and update the statistics,
+        if instrumentation is on)
+        """
+        if not self._instrumentation:
+            return self._read_dll_touch_info(data, data_ptr)
+
+        t0 = clock()
+        data = self._read_dll_touch_info(data, data_ptr)
+        duration = clock() - t0
+
+        self._stats.add_call(duration, data.valid, data.seq, data.timestamp)
+
+        return data
+
+    #------------------------------------------------------------
+    def _read_dll_touch_info(self, data, data_ptr):
+
+        if self._library.get_touch_info_into is None:
+            self._get_legacy_dll_touch_info(data)
+        else:
+            # noinspection PyUnresolvedReferences
+            self._library.get_touch_info_into(self._resource_handle, data_ptr)
+
+        if not data.valid and self._last_touch_data is not None:
+            #-- No data available: get again the last available touch information
+            data = self._last_touch_data
+
+        return data
+
+    #------------------------------------------------------------
+    def _get_legacy_dll_touch_info(self, data):
+        """
+        Get the touch information from an older DLL, which reports only the current touch state.
+        A new sequence number and timestamp are assigned here whenever the touch state changes.
+        """
+        # noinspection PyUnresolvedReferences
+        legacy = self._library.get_touch_info(self._resource_handle)
+
+        with self._legacy_lock:
+            state = legacy.touched, legacy.x, legacy.y
+            if legacy.valid and state != self._legacy_touch_state:
+                self._legacy_touch_state = state
+                self._legacy_seq += 1
+                self._legacy_timestamp = int(round(clock() * 1e9))
+
+            data.valid = legacy.valid
+            data.touched, data.x, data.y = state
+            data.seq = self._legacy_seq
+            data.timestamp = self._legacy_timestamp
+            data.transform_id = 0
+
+    #------------------------------------------------------------
+    def _dll_touch_info_to(self, data, out):
+        """
+        Transform the DLL's touch information and write it to a TouchInfo object / numpy record
+        """
+
+        if not data.valid:
+            _set_touch_info(out, False, 0, 0, None, 0)
+        else:
+            if data.transform_id == self._dll_transform_id != 0:
+                x, y = data.screen_x, data.screen_y
+            else:
+                x, y = self._transform.apply(data.x, data.y)
+            timestamp = data.timestamp * self._timestamp_scale + self._timestamp_offset
+            if self._filters is not None:
+                x, y = self._filter_sample(data.seq, timestamp, data.touched, x, y)
+            _set_touch_info(out, data.touched, x, y, timestamp, data.seq)
+
+        return out
+
+    #------------------------------------------------------------
+    def _filter_sample(self, seq, timestamp, touched, x, y):
+        """
+        Apply the filters to a sample (unless it was already filtered).
+
+        Samples are read by several threads (the sampling thread, the wait functions, asyncio streams,
+        TouchpadGroup), so the filters' state is changed only while holding a lock, and a sample older
+        than the last filtered one is not filtered (it gets the last filtered coordinates).
+        """
+        with self._filter_lock:
+            filters = self._filters
+            if filters is None:
+                return x, y
+
+            if self._filtered_seq is None or seq > self._filtered_seq:
+                filtered_x, filtered_y = filters.step(timestamp, touched, x, y)
+                self._filtered_xy = _round(filtered_x), _round(filtered_y)
+                self._filtered_seq = seq
+
+            return self._filtered_xy
+
+    #------------------------------------------------------------
+    def read_samples(self):
+        """
+        Get all the samples received from the TSC2017 device since the previous call to this function.
+
+        Whereas :func:`~tsc2017.Touchpad.get_touch_data` returns only the latest sample, this function returns
+        every sample received from the device (the DLL keeps up to 4096 samples between calls; older
+        samples are dropped). The samples are transformed just like in :func:`~tsc2017.Touchpad.get_touch_data`
+        (normally by the DLL, when each sample is received).
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :return: numpy structured array (:data:`tsc2017.samples_dtype`) with the fields "touched" (bool),
+                 "x", "y" (int), "timestamp" (seconds, on the time.perf_counter() clock) and "seq"
+        """
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.read_samples() cannot be called before connect()".format(type(self).__name__))
+        self._library.require("read_packed_samples", "read_samples()")
+
+        return unpack_samples(self._read_packed_samples())
+
+    #------------------------------------------------------------
+    def read_packed_samples(self):
+        """
+        Same as :func:`~tsc2017.Touchpad.read_samples`, but the samples are returned in the compact format
+        (:data:`tsc2017.packed_sample_dtype`), which also includes the raw TSC2017 coordinates. The samples are
+        copied from the DLL directly into this format.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :return: numpy structured array (:data:`tsc2017.packed_sample_dtype`)
+        """
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.read_packed_samples() cannot be called before connect()".format(type(self).__name__))
+        self._library.require("read_packed_samples", "read_packed_samples()")
+
+        return self._read_packed_samples()
+
+    def _read_packed_samples(self):
+
+        #-- The DLL's samples are read into a shared buffer, which the sampling thread (when recording)
+        #-- and the caller's threads may use concurrently
+        with self._samples_lock:
+            buf = self._samples_buf
+            if buf is None:
+                buf = self._samples_buf = np.zeros(sample_queue_capacity, dtype=get_packed_sample_dtype())
+
+            # noinspection PyUnresolvedReferences
+            n = self._library.read_packed_samples(self._resource_handle,
+                                                  buf.ctypes.data_as(ctypes.POINTER(DLLPackedSample)), len(buf))
+
+            samples = buf[:n].copy()
+
+        #-- DLL ticks to nanoseconds on the time.perf_counter() clock
+        timestamp = samples["timestamp"] * (self._timestamp_scale * 1e9) + self._timestamp_offset * 1e9
+        samples["timestamp"] = np.round(timestamp)
+
+        return samples
+
+    #------------------------------------------------------------
+    def transform_batch(self, raw_xy):
+        """
+        Transform many raw TSC2017 coordinates to screen coordinates at once.
+
+        The transformation is the same one applied by :func:`~tsc2017.Touchpad.get_touch_data`
+        (:attr:`~tsc2017.Touchpad.transform_plan` or :attr:`~tsc2017.Touchpad.lookup_table`), and gives exactly the same results, but all samples
+        are processed in one vectorized operation. Use this e.g. to post-process recorded raw samples.
+
+        This function does not access the device, so it can be called also when not connected.
+
+        :param raw_xy: The raw touchpad coordinates (0-4095): an array-like of N (x, y) pairs
+        :return: numpy array of shape (N, 2) with the screen coordinates (int32)
+        """
+
+        xy = np.asarray(raw_xy)
+        if xy.ndim != 2 or xy.shape[1] != 2:
+            raise ValueError("{:}.transform_batch() expects an array of (x, y) pairs, got an array with shape {:}".
+                             format(type(self).__name__, xy.shape))
+
+        return self._transform.apply_batch(xy)
+
+    #=============================================================================================
+    #     Statistics
+    #=============================================================================================
+
+    #------------------------------------------------------------
+    def stats(self):
+        """
+        Get statistics about reading the touch data, since the touchpad was connected or since
+        :func:`~tsc2017.Touchpad.reset_stats` was called.
+
+        The statistics about reading from the DLL are collected only when
+        :attr:`~tsc2017.Touchpad.instrumentation` is True; the DLL's counters are always available.
+
+        :return: dict with the following entries:
+
+                 - calls: number of times the touch data was read from the DLL
+                 - invalid: how many of these calls returned no data (no sample received yet)
+                 - repeated: how many calls returned the same sample as the previous call
+                 - missed: how many samples were never returned (according to the gaps between sequence numbers)
+                 - sample_rate: the device's effective sample rate (samples per second)
+                 - latency: dict with the distribution of the DLL call's duration (count, min, mean, p50,
+                   p90, p99, max; in seconds)
+                 - dll: dict with the DLL's counters (interrupts_received, interrupts_ignored,
+                   samples_overwritten, samples_read); empty if not connected, or if the DLL is too old
+                   to have counters
+        """
+        stats = self._stats
+
+        dll_stats = {}
+        if self._resource is not None and self._library.get_device_stats is not None:
+            counters = DLLDeviceStats()
+            # noinspection PyUnresolvedReferences
+            if self._library.get_device_stats(self._resource_handle, ctypes.byref(counters)):
+                dll_stats = {name: getattr(counters, name) for name, _ in DLLDeviceStats._fields_}
+
+        return dict(calls=stats.n_calls,
+                    invalid=stats.n_invalid,
+                    repeated=stats.n_repeated,
+                    missed=stats.n_missed,
+                    sample_rate=stats.sample_rate(self._timestamp_scale),
+                    latency=stats.latency.summary(),
+                    dll=dll_stats)
+
+    #------------------------------------------------------------
+    def reset_stats(self):
+        """
+        Reset all the statistics returned by :func:`~tsc2017.Touchpad.stats` (including the DLL's counters)
+        """
+        self._stats.reset()
+
+        if self._resource is not None and self._library.reset_device_stats is not None:
+            # noinspection PyUnresolvedReferences
+            self._library.reset_device_stats(self._resource_handle)
+
+    #=============================================================================================
+    #     Wait for touch events
+    #=============================================================================================
+
+    #------------------------------------------------------------
+    def wait_next_sample(self, timeout=None):
+        """
+        Wait until the next sample arrives from the TSC2017 device.
+
+        The wait is done inside the DLL, which is notified by the device's interrupt, so this function returns
+        as soon as the sample arrives. Other Python threads keep running while waiting.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :param timeout: The maximal waiting duration (in seconds). None = wait forever.
+        :return: The new touch data (:class:`~tsc2017.TouchInfo`), or None if the wait timed out
+        """
+        self._validate_wait_args("wait_next_sample", timeout)
+
+        count = self._sample_count()
+        if self._wait_for_sample(count, timeout) == count:
+            return None
+
+        return self._poll_touch_data()
+
+    #------------------------------------------------------------
+    def wait_for_touch(self, timeout=None):
+        """
+        Wait until the touchpad is touched (returns immediately if it's already touched).
+
+        Like :func:`~tsc2017.Touchpad.wait_next_sample`, this function does not poll the device:
+        it returns as soon as the device reports a touch.
+
+        :param timeout: The maximal waiting duration (in seconds). None = wait forever.
+        :return: The touch data (:class:`~tsc2017.TouchInfo`), or None if the wait timed out
+        """
+        self._validate_wait_args("wait_for_touch", timeout)
+        return self._wait_for_touch_state(True, timeout)
+
+    #------------------------------------------------------------
+    def wait_for_release(self, timeout=None):
+        """
+        Wait until the finger is lifted from the touchpad (returns immediately if it's not touched).
+
+        Like :func:`~tsc2017.Touchpad.wait_next_sample`, this function does not poll the device:
+        it returns as soon as the device reports that the finger was lifted.
+
+        :param timeout: The maximal waiting duration (in seconds). None = wait forever.
+        :return: The touch data (:class:`~tsc2017.TouchInfo`), or None if the wait timed out
+        """
+        self._validate_wait_args("wait_for_release", timeout)
+        return self._wait_for_touch_state(False, timeout)
+
+    #------------------------------------------------------------
+    def _validate_wait_args(self, func_name, timeout):
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.{:}() cannot be called before connect()".format(type(self).__name__, func_name))
+
+        if timeout is not None and (not isinstance(timeout, numbers.Number) or timeout < 0):
+            raise ValueError("{:}.{:}() got an invalid timeout ({:})".format(type(self).__name__, func_name, timeout))
+
+    #------------------------------------------------------------
+    def _wait_for_touch_state(self, touched, timeout):
+
+        deadline = None if timeout is None else clock() + timeout
+
+        while True:
+
+            #-- Get the sample count before checking the touch state, so a sample that arrives
+            #-- right after the check would end the wait below
+            count = self._sample_count()
+
+            ti = self._poll_touch_data()
+            if bool(ti.touched) == touched:
+                return ti
+
+            remaining = None if deadline is None else max(0, deadline - clock())
+            if self._wait_for_sample(count, remaining) == count:
+                return None
+
+    #------------------------------------------------------------
+    def _sample_count(self):
+        """
+        The number of samples received from the device (with older DLLs: the sequence number of the current
+        touch state - see _get_legacy_dll_touch_info())
+        """
+        if self._library.get_sample_count is None:
+            return self._poll_dll_touch_info().seq
+
+        # noinspection PyUnresolvedReferences
+        return self._library.get_sample_count(self._resource_handle)
+
+    #------------------------------------------------------------
+    def _wait_for_sample(self, after_count, timeout):
+        """
+        Wait (in the DLL) until the device's sample count differs from after_count.
+        Older DLLs cannot wait, so the device is polled instead.
+
+        :return: The new sample count (after_count if the wait timed out)
+        """
+        if self._library.wait_for_sample is None:
+            deadline = None if timeout is None else clock() + timeout
+            while True:
+                count = self._sample_count()
+                if count != after_count or (deadline is not None and clock() >= deadline):
+                    return count
+                time.sleep(_legacy_poll_interval)
+
+        timeout_ms = -1 if timeout is None else int(round(timeout * 1000))
+        # noinspection PyUnresolvedReferences
+        return self._library.wait_for_sample(self._resource_handle, after_count, timeout_ms)
+
+    #=============================================================================================
+    #     asyncio interface
+    #=============================================================================================
+
+    #------------------------------------------------------------
+    def stream(self):
+        """
+        Get the touchpad's samples in an asyncio program:
+
+        ::
+
+            async for touch_info in touchpad.stream():
+                ...
+
+        Each iteration waits until a new sample arrives from the device. The wait does not block the event loop
+        and does not use a thread: the DLL notifies the event loop when the device's interrupt arrives.
+        If the samples arrive faster than they are consumed, each iteration returns the newest sample.
+
+        Close the stream when done, to stop the notifications from the device: use it as an async context manager
+        (``async with touchpad.stream() as stream:``), or call its aclose() method.
+        This function requires Python 3.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :return: An asynchronous iterator of :class:`~tsc2017.TouchInfo` objects
+        """
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.stream() cannot be called before connect()".format(type(self).__name__))
+
+        from ._aio import TouchStream
+        return TouchStream(self)
+
+    #------------------------------------------------------------
+    def next_touch(self, timeout=None):
+        """
+        The asyncio version of :func:`~tsc2017.Touchpad.wait_for_touch`: ``ti = await touchpad.next_touch()``.
+
+        This function requires Python 3.
+
+        :param timeout: The maximal waiting duration (in seconds). None = wait forever.
+        :return: A coroutine, which returns the touch data (:class:`~tsc2017.TouchInfo`) or None if the wait timed out
+        """
+        self._validate_wait_args("next_touch", timeout)
+
+        from ._aio import next_touch
+        return next_touch(self, timeout)
+
+    #------------------------------------------------------------
+    def _add_sample_listener(self, listener):
+        """
+        Call the given function (without arguments, from the DLL's event thread) whenever a sample is received
+        """
+        if not self._dll_sample_callback_set:
+            self._library.require("set_sample_callback", "Waiting for samples with asyncio")
+
+            if self._dll_sample_callback is None:
+                #-- The callback is kept for the touchpad's lifetime, so the DLL never calls a released callback.
+                #-- It refers to the touchpad weakly, to avoid a reference cycle.
+                touchpad_ref = weakref.ref(self)
+
+                def on_dll_sample(resource):
+                    touchpad = touchpad_ref()
+                    if touchpad is not None:
+                        touchpad._on_dll_sample(resource)
+
+                # noinspection PyUnresolvedReferences
+                self._dll_sample_callback = self._library.SampleCallback(on_dll_sample)
+
+            # noinspection PyUnresolvedReferences
+            self._library.set_sample_callback(self._resource_handle, self._dll_sample_callback)
+            self._dll_sample_callback_set = True
+
+        self._sample_listeners = self._sample_listeners + [listener]
+
+    #------------------------------------------------------------
+    def _remove_sample_listener(self, listener):
+
+        self._sample_listeners = [l for l in self._sample_listeners if l != listener]
+
+        if len(self._sample_listeners) == 0 and self._dll_sample_callback_set:
+            # noinspection PyUnresolvedReferences
+            self._library.set_sample_callback(self._resource_handle, self._library.SampleCallback())
+            self._dll_sample_callback_set = False
+
+    #------------------------------------------------------------
+    def _on_dll_sample(self, resource):
+        for listener in self._sample_listeners:
+            listener()
+
+    #=============================================================================================
+    #     Sample the touchpad in a background thread
+    #=============================================================================================
+
+    #------------------------------------------------------------
+    def start_streaming(self, rate_hz=1000, capacity=10000):
+        """
+        Start sampling the touchpad in a background thread, at a fixed rate.
+
+        The samples are timestamped, transformed to screen coordinates, and stored in a preallocated
+        ring buffer (:attr:`~tsc2017.Touchpad.stream_buffer`). While streaming,
+        :func:`~tsc2017.Touchpad.get_touch_data` (and hence :class:`~tsc2017.Mouse`) returns the newest sample
+        from this buffer without accessing the device, so the sampling rate does not depend on how often your
+        program reads the touchpad.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :param rate_hz: The sampling rate (samples per second)
+        :param capacity: The number of samples kept in the ring buffer (older samples are overwritten)
+        :type capacity: int
+        """
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.start_streaming() cannot be called before connect()".format(type(self).__name__))
+
+        if not isinstance(rate_hz, numbers.Number) or rate_hz <= 0:
+            raise ValueError("{:}.start_streaming() got an invalid rate_hz ({:})".format(type(self).__name__, rate_hz))
+        if not isinstance(capacity, int) or capacity <= 0:
+            raise ValueError("{:}.start_streaming() got an invalid capacity ({:})".format(type(self).__name__, capacity))
+
+        #-- Replace only the sampling thread: a recording in progress continues with the new thread
+        #-- (and is no longer stopped by stop_recording(), since the streaming was requested explicitly)
+        self._stop_sampler()
+        self._recording_started_streaming = False
+
+        self._stream_buffer = SampleRingBuffer(capacity)
+        self._sampler = Sampler(self, rate_hz, self._stream_buffer)
+        self._sampler.start()
+
+    #------------------------------------------------------------
+    def stop_streaming(self):
+        """
+        Stop the background sampling thread started by :func:`~tsc2017.Touchpad.start_streaming`.
+
+        The samples collected so far remain available in :attr:`~tsc2017.Touchpad.stream_buffer`
+        """
+        self.stop_recording()
+        self._stop_sampler()
+
+    #------------------------------------------------------------
+    def _stop_sampler(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+
+    #------------------------------------------------------------
+    @property
+    def streaming(self):
+        """
+        Whether the touchpad is being sampled by a background thread (see :func:`~tsc2017.Touchpad.start_streaming`)
+
+        :type: bool
+        """
+        return self._sampler is not None
+
+    #------------------------------------------------------------
+    @property
+    def stream_buffer(self):
+        """
+        The ring buffer with the samples collected by :func:`~tsc2017.Touchpad.start_streaming`
+        (None if streaming was never started)
+
+        :type: tsc2017.SampleRingBuffer
+        """
+        return self._stream_buffer
+
+    #=============================================================================================
+    #     Record the samples to a file
+    #=============================================================================================
+
+    #------------------------------------------------------------
+    def record(self, path, rate_hz=1000, buffer_size=4096, compression=None):
+        """
+        Record every sample received from the device to a binary file, until
+        :func:`~tsc2017.Touchpad.stop_recording` is called (see :mod:`tsc2017.recording`).
+
+        The samples are collected by the background sampling thread (see :func:`~tsc2017.Touchpad.start_streaming`),
+        which is started if it isn't running, and are written to the file in bulk, in the compact format
+        (:data:`tsc2017.packed_sample_dtype`).
+
+        The recorded samples are taken from the same queue as :func:`~tsc2017.Touchpad.read_samples`, so
+        don't call read_samples() / :func:`~tsc2017.Touchpad.read_packed_samples` while recording.
+
+        You must call :func:`~tsc2017.Touchpad.connect` before calling this function
+
+        :param path: The recording file (an existing file is overwritten)
+        :param rate_hz: The sampling thread's rate, if it needs to be started. The rate only determines how often
+                        the queued samples are written to the buffer; all samples are recorded regardless.
+        :param buffer_size: The number of samples kept in memory before they are written to the file
+                            (for a compressed recording: the maximal number of samples per chunk)
+        :param compression: None - write fixed-width records (:class:`tsc2017.recording.Recorder`);
+                            "zlib" or "lzma" - write compressed chunks (:class:`tsc2017.recording.ChunkedRecorder`)
+        """
+
+        if self._resource is None:
+            raise TSCError("Invalid state: {:}.record() cannot be called before connect()".format(type(self).__name__))
+        self._library.require("read_packed_samples", "record()")
+
+        from .recording import Recorder, ChunkedRecorder
+
+        self.stop_recording()
+
+        if compression is None:
+            recorder = Recorder(path, buffer_size)
+        else:
+            recorder = ChunkedRecorder(path, compression, buffer_size)
+
+        if self._sampler is None:
+            self.start_streaming(rate_hz)
+            self._recording_started_streaming = True
+
+        #-- Samples received before recording started are not recorded
+        self._read_packed_samples()
+
+        with self._recorder_lock:
+            self._recorder = recorder
+
+    #------------------------------------------------------------
+    def stop_recording(self):
+        """
+        Stop the recording started by :func:`~tsc2017.Touchpad.record`, and close the recording file.
+        The sampling thread is stopped too, if record() started it.
+        """
+        with self._recorder_lock:
+            recorder = self._recorder
+            self._recorder = None
+
+        if recorder is None:
+            return
+
+        if self._resource is not None:
+            recorder.write(self._read_packed_samples())
+        recorder.close()
+
+        if self._recording_started_streaming:
+            self._recording_started_streaming = False
+            self.stop_streaming()
+
+    #------------------------------------------------------------
+    @property
+    def recording(self):
+        """
+        Whether the samples are being recorded (see :func:`~tsc2017.Touchpad.record`)
+
+        :type: bool
+        """
+        return self._recorder is not None
+
+    #------------------------------------------------------------
+    def _record_new_samples(self):
+        """
+        Called by the sampling thread: write the samples received since the previous call to the recording
+        """
+        with self._recorder_lock:
+            if self._recorder is not None:
+                self._recorder.write(self._read_packed_samples())
+
+
+#-----------------------------------------------------------------
+def find_devices(dll_path=None):
+    """
+    Find the TSC2017 devices connected to the computer
+
+    :param dll_path: See :class:`~tsc2017.Touchpad`
+    :return: list of USB device IDs (str), which can be passed to :func:`~tsc2017.Touchpad.connect`
+    """
+    with Touchpad(dll_path) as touchpad:
+        return touchpad.find_devices()
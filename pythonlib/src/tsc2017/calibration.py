@@ -0,0 +1,443 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: calibrating the touchpad coordinates
+#------------------------------------------------------------------------------
+"""
+Fit the transformation from raw TSC2017 coordinates to screen coordinates, based on points whose
+raw coordinates (as reported by the touchpad) and screen coordinates (where they were displayed) are known.
+
+The fitted :class:`~tsc2017.TransformPlan` can be assigned to :attr:`~tsc2017.Touchpad.transform_plan`.
+Nonlinear (polynomial) fits are applied via a :class:`~tsc2017.LookupTable`, assigned to
+:attr:`~tsc2017.Touchpad.lookup_table`::
+
+    fit = calibration.fit_polynomial(raw_points, screen_points, degree=3)
+    fit.lookup_table().save("touchpad_lut.npy")
+
+    # In the experiment script:
+    touchpad.lookup_table = tsc2017.LookupTable.load("touchpad_lut.npy")
+
+The calibration of each device can be saved in a profile (:func:`save_profile`), and an experiment can then
+create a calibrated and connected touchpad with :func:`tsc2017.Touchpad.from_profile`.
+"""
+
+from __future__ import division
+
+import os
+import re
+import json
+import time
+import numbers
+import numpy as np
+
+from ._tsc2017 import TransformPlan, LookupTable, touchpad_full_size
+
+
+#-- Identifies calibration profile files, and their format version
+profile_format = "tsc2017-calibration-profile"
+profile_version = 1
+
+
+#=================================================================================================
+class CalibrationResult(object):
+    """
+    The result of a calibration fit
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, model, raw_points, screen_points):
+        self._model = model
+        self._residuals = screen_points - model.evaluate(raw_points)
+
+    #------------------------------------------------------------
+    @property
+    def model(self):
+        """
+        The fitted model (:class:`LinearModel` or :class:`PolynomialModel`)
+        """
+        return self._model
+
+    #------------------------------------------------------------
+    @property
+    def plan(self):
+        """
+        The fitted transformation, or None if the model is nonlinear (use :func:`lookup_table` in this case)
+
+        :type: tsc2017.TransformPlan
+        """
+        return self._model.plan if isinstance(self._model, LinearModel) else None
+
+    #------------------------------------------------------------
+    def lookup_table(self, step=16):
+        """
+        Precompute the fitted model into a lookup table
+
+        :param step: The distance between the table's grid nodes, in raw units (a power of 2)
+        :rtype: tsc2017.LookupTable
+        """
+        return LookupTable.build(self._model.evaluate, step)
+
+    #------------------------------------------------------------
+    @property
+    def residuals(self):
+        """
+        The difference between each point's screen coordinates and the fitted transformation of its raw
+        coordinates (before rounding)
+
+        :type: numpy array of shape (N, 2)
+        """
+        return self._residuals
+
+    #------------------------------------------------------------
+    @property
+    def errors(self):
+        """
+        The distance (in pixels) between each point's screen coordinates and its fitted coordinates
+
+        :type: numpy array of length N
+        """
+        return np.hypot(self._residuals[:, 0], self._residuals[:, 1])
+
+    #------------------------------------------------------------
+    @property
+    def rms_error(self):
+        """
+        The root-mean-square of :attr:`errors` (in pixels)
+        """
+        return float(np.sqrt(np.mean(self.errors ** 2)))
+
+    #------------------------------------------------------------
+    @property
+    def max_error(self):
+        """
+        The largest of :attr:`errors` (in pixels)
+        """
+        return float(np.max(self.errors))
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        return "{:}({:}, rms_error={:.2f}, max_error={:.2f})".format(type(self).__name__, self._model,
+                                                                      self.rms_error, self.max_error)
+
+
+#=================================================================================================
+class LinearModel(object):
+    """
+    An affine or projective calibration model
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, plan):
+        self.plan = plan
+
+    #------------------------------------------------------------
+    def evaluate(self, raw_points):
+        """
+        Transform (N, 2) raw coordinates to screen coordinates, without rounding
+        """
+        return _apply_matrix(self.plan.matrix, np.asarray(raw_points, dtype=np.float64))
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        return "{:}({:})".format(type(self).__name__, self.plan)
+
+
+#=================================================================================================
+class PolynomialModel(object):
+    """
+    A nonlinear calibration model: each screen coordinate is a 2-D polynomial of the raw coordinates.
+    The raw coordinates are first normalized to the range [-1, 1].
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, degree, coefs):
+        """
+        :param degree: The polynomial's degree
+        :param coefs: Array of shape (n_terms, 2) - the coefficients of the x and y polynomials, for the
+                      terms u^i * v^j (0 <= i + j <= degree) in the order of :func:`terms`
+        """
+        self.degree = degree
+        self.coefs = np.asarray(coefs, dtype=np.float64)
+
+    #------------------------------------------------------------
+    @staticmethod
+    def terms(raw_points, degree):
+        """
+        Get the polynomial terms of raw coordinates
+
+        :return: Array of shape (N, n_terms)
+        """
+        raw = np.asarray(raw_points, dtype=np.float64)
+        u = raw[:, 0] / (touchpad_full_size[0] / 2) - 1
+        v = raw[:, 1] / (touchpad_full_size[1] / 2) - 1
+        return np.column_stack([u ** (d - j) * v ** j for d in range(degree + 1) for j in range(d + 1)])
+
+    #------------------------------------------------------------
+    def evaluate(self, raw_points):
+        """
+        Transform (N, 2) raw coordinates to screen coordinates, without rounding
+        """
+        return self.terms(raw_points, self.degree).dot(self.coefs)
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        return "{:}(degree={:})".format(type(self).__name__, self.degree)
+
+
+#-----------------------------------------------------------------
+def fit_affine(raw_points, screen_points):
+    """
+    Fit an affine transformation (scaling, rotation, shear and shift) from raw touchpad coordinates
+    to screen coordinates, using least squares.
+
+    :param raw_points: Array-like of N (x, y) raw touchpad coordinates (N >= 3, not all on one line)
+    :param screen_points: Array-like of the corresponding N (x, y) screen coordinates
+    :return: CalibrationResult
+    """
+    raw, screen = _validate_points("fit_affine", raw_points, screen_points, 3)
+
+    a = np.column_stack((raw, np.ones(len(raw))))
+    coefs, _, rank, _ = np.linalg.lstsq(a, screen, rcond=None)
+    if rank < 3:
+        raise ValueError("tsc2017.calibration.fit_affine(): the raw points are all on one line")
+
+    plan = TransformPlan.from_matrix(coefs.T)
+    return CalibrationResult(LinearModel(plan), raw, screen)
+
+
+#-----------------------------------------------------------------
+def fit_projective(raw_points, screen_points):
+    """
+    Fit a projective transformation (homography) from raw touchpad coordinates to screen coordinates,
+    using least squares. Unlike an affine transformation, a projective one can also correct a trapezoid-shaped
+    distortion (e.g., when the touchpad is tilted relatively to the screen).
+
+    :param raw_points: Array-like of N (x, y) raw touchpad coordinates (N >= 4, no 3 of them on one line)
+    :param screen_points: Array-like of the corresponding N (x, y) screen coordinates
+    :return: CalibrationResult
+    """
+    raw, screen = _validate_points("fit_projective", raw_points, screen_points, 4)
+
+    #-- Normalize both point sets, so the equations are well conditioned
+    raw_norm = _normalization_matrix(raw)
+    screen_norm = _normalization_matrix(screen)
+    r = _apply_matrix(raw_norm, raw)
+    s = _apply_matrix(screen_norm, screen)
+
+    #-- With h22 = 1, each point gives two linear equations on the other 8 elements of the matrix:
+    #-- sx = h00*rx + h01*ry + h02 - h20*rx*sx - h21*ry*sx
+    #-- sy = h10*rx + h11*ry + h12 - h20*rx*sy - h21*ry*sy
+    n = len(raw)
+    a = np.zeros((2 * n, 8))
+    a[:n, 0:2] = r
+    a[:n, 2] = 1
+    a[:n, 6:8] = -r * s[:, 0:1]
+    a[n:, 3:5] = r
+    a[n:, 5] = 1
+    a[n:, 6:8] = -r * s[:, 1:2]
+    b = np.concatenate((s[:, 0], s[:, 1]))
+
+    h, _, rank, _ = np.linalg.lstsq(a, b, rcond=None)
+    if rank < 8:
+        raise ValueError("tsc2017.calibration.fit_projective(): the points do not define a single transformation")
+
+    h_norm = np.append(h, 1).reshape(3, 3)
+    matrix = np.linalg.inv(screen_norm).dot(h_norm).dot(raw_norm)
+
+    plan = TransformPlan.from_matrix(matrix)
+    return CalibrationResult(LinearModel(plan), raw, screen)
+
+
+#-----------------------------------------------------------------
+def fit_polynomial(raw_points, screen_points, degree=3):
+    """
+    Fit a nonlinear transformation from raw touchpad coordinates to screen coordinates: each screen
+    coordinate is a polynomial of the raw x and y coordinates, fitted using least squares.
+    This corrects the nonlinearity of the touchpad near its edges.
+
+    The fitted model is applied via a lookup table (see :func:`CalibrationResult.lookup_table`).
+
+    :param raw_points: Array-like of N (x, y) raw touchpad coordinates. There must be at least as many points as
+                       polynomial terms (6 for degree 2, 10 for degree 3), preferably many more, spread over the
+                       whole touchpad.
+    :param screen_points: Array-like of the corresponding N (x, y) screen coordinates
+    :param degree: The polynomial's degree (1 = affine)
+    :return: CalibrationResult
+    """
+    if not isinstance(degree, numbers.Integral) or degree < 1:
+        raise ValueError("tsc2017.calibration.fit_polynomial(): invalid degree ({:})".format(degree))
+
+    n_terms = (degree + 1) * (degree + 2) // 2
+    raw, screen = _validate_points("fit_polynomial", raw_points, screen_points, n_terms)
+
+    coefs, _, rank, _ = np.linalg.lstsq(PolynomialModel.terms(raw, degree), screen, rcond=None)
+    if rank < n_terms:
+        raise ValueError("tsc2017.calibration.fit_polynomial(): the points are not spread enough to fit a "
+                         "polynomial of degree {:}".format(degree))
+
+    return CalibrationResult(PolynomialModel(degree, coefs), raw, screen)
+
+
+#=================================================================================================
+class CalibrationProfile(object):
+    """
+    The calibration of one device, loaded from a profile file (see :func:`load_profile`)
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, device_id, transform_plan, lookup_table=None, dll_path=None):
+        #: The USB device ID
+        self.device_id = device_id
+        #: :class:`~tsc2017.TransformPlan`
+        self.transform_plan = transform_plan
+        #: :class:`~tsc2017.LookupTable` (memory-mapped), or None
+        self.lookup_table = lookup_table
+        #: The path of the DLL, or None
+        self.dll_path = dll_path
+
+    #------------------------------------------------------------
+    def __repr__(self):
+        return "{:}(device_id={:}, transform_plan={:}, lookup_table={:})".format(
+            type(self).__name__, self.device_id, self.transform_plan, self.lookup_table)
+
+
+#-----------------------------------------------------------------
+def save_profile(path, device_id, transform_plan=None, lookup_table=None, dll_path=None):
+    """
+    Save the calibration of a device to a profile file (JSON). If the file exists, the device is added to it
+    (replacing the device's previous calibration, if any), so one file can keep the calibrations of several devices.
+
+    The transformation is saved with full precision.
+
+    :param path: The profile file
+    :param device_id: The device's USB device ID (see :func:`tsc2017.Touchpad.connect`)
+    :param transform_plan: :class:`~tsc2017.TransformPlan` (e.g. from :func:`fit_affine`)
+    :param lookup_table: :class:`~tsc2017.LookupTable` (e.g. from :func:`fit_polynomial`). The table is saved
+                         as a .npy file next to the profile file.
+    :param dll_path: The path of the DLL on this computer (optional)
+    """
+    if isinstance(device_id, bytes):
+        device_id = device_id.decode("ascii")
+
+    if transform_plan is None and lookup_table is None:
+        raise ValueError("tsc2017.calibration.save_profile(): either transform_plan or lookup_table must be specified")
+    if transform_plan is not None and not isinstance(transform_plan, TransformPlan):
+        raise TypeError("tsc2017.calibration.save_profile(): invalid transform_plan ({:})".format(transform_plan))
+    if lookup_table is not None and not isinstance(lookup_table, LookupTable):
+        raise TypeError("tsc2017.calibration.save_profile(): invalid lookup_table ({:})".format(lookup_table))
+
+    profile = _read_profile_file(path) if os.path.exists(path) else \
+        dict(format=profile_format, version=profile_version, devices={})
+
+    if transform_plan is None:
+        transform_plan = TransformPlan.compile()
+
+    lut_file = None
+    if lookup_table is not None:
+        #-- The table is saved next to the profile, and its path is kept relatively to the profile
+        stem = os.path.splitext(os.path.basename(path))[0]
+        lut_file = "{:}_{:}.npy".format(stem, re.sub(r"[^A-Za-z0-9_.-]+", "_", device_id))
+        lookup_table.save(os.path.join(os.path.dirname(os.path.abspath(path)), lut_file))
+
+    profile["devices"][device_id] = dict(
+        transform_matrix=[[float(v) for v in row] for row in transform_plan.matrix],
+        lookup_table=lut_file,
+        dll_path=dll_path,
+        saved=time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    with open(path, "w") as fp:
+        json.dump(profile, fp, indent=2, sort_keys=True)
+
+
+#-----------------------------------------------------------------
+def load_profile(path, device_id=None):
+    """
+    Load a device's calibration from a profile file saved by :func:`save_profile`
+
+    :param path: The profile file
+    :param device_id: The device to load. If the profile has a single device, this argument can be omitted.
+    :rtype: CalibrationProfile
+    """
+    profile = _read_profile_file(path)
+    devices = profile["devices"]
+
+    if isinstance(device_id, bytes):
+        device_id = device_id.decode("ascii")
+
+    if device_id is None:
+        if len(devices) != 1:
+            raise ValueError("tsc2017.calibration.load_profile(): the profile {:} has {:} devices, please specify "
+                             "the device_id".format(path, len(devices)))
+        device_id = list(devices.keys())[0]
+
+    elif device_id not in devices:
+        raise ValueError("tsc2017.calibration.load_profile(): the profile {:} has no calibration of device {:}".
+                         format(path, device_id))
+
+    device = devices[device_id]
+
+    lookup_table = None
+    if device.get("lookup_table") is not None:
+        lookup_table = LookupTable.load(os.path.join(os.path.dirname(os.path.abspath(path)), device["lookup_table"]))
+
+    return CalibrationProfile(device_id, TransformPlan.from_matrix(device["transform_matrix"]),
+                              lookup_table=lookup_table, dll_path=device.get("dll_path"))
+
+
+#-----------------------------------------------------------------
+def _read_profile_file(path):
+
+    with open(path, "r") as fp:
+        profile = json.load(fp)
+
+    if not isinstance(profile, dict) or profile.get("format") != profile_format:
+        raise ValueError("{:} is not a TSC2017 calibration profile".format(path))
+
+    if profile.get("version") != profile_version:
+        raise ValueError("The calibration profile {:} has an unsupported version ({:}; expected version {:})".
+                         format(path, profile.get("version"), profile_version))
+
+    return profile
+
+
+#-----------------------------------------------------------------
+def _validate_points(func_name, raw_points, screen_points, min_n):
+
+    raw = np.array(raw_points, dtype=np.float64)
+    screen = np.array(screen_points, dtype=np.float64)
+
+    for name, points in ("raw_points", raw), ("screen_points", screen):
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError("tsc2017.calibration.{:}(): {:} must be a list of (x, y) coordinates".
+                             format(func_name, name))
+
+    if len(raw) != len(screen):
+        raise ValueError("tsc2017.calibration.{:}(): got {:} raw points but {:} screen points".
+                         format(func_name, len(raw), len(screen)))
+
+    if len(raw) < min_n:
+        raise ValueError("tsc2017.calibration.{:}(): at least {:} points are needed (got {:})".
+                         format(func_name, min_n, len(raw)))
+
+    return raw, screen
+
+
+#-----------------------------------------------------------------
+def _apply_matrix(matrix, points):
+    """
+    Transform (N, 2) points by a 3x3 matrix, without rounding
+    """
+    xyw = np.column_stack((points, np.ones(len(points)))).dot(np.transpose(matrix))
+    return xyw[:, :2] / xyw[:, 2:3]
+
+
+#-----------------------------------------------------------------
+def _normalization_matrix(points):
+    """
+    A matrix that moves the points' centroid to (0, 0) and scales them to a mean distance of sqrt(2) from it
+    """
+    center = points.mean(axis=0)
+    mean_dist = np.mean(np.hypot(points[:, 0] - center[0], points[:, 1] - center[1]))
+    scale = np.sqrt(2) / mean_dist if mean_dist > 0 else 1
+
+    return np.array([[scale, 0, -scale * center[0]],
+                     [0, scale, -scale * center[1]],
+                     [0, 0, 1]])
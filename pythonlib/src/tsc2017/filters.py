@@ -0,0 +1,412 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: filtering (smoothing) the touch coordinates
+#------------------------------------------------------------------------------
+"""
+Filters that smooth the touchpad's coordinates and reject spikes.
+
+A filter can be attached to a touchpad, which then filters each sample as it is read
+(see :attr:`tsc2017.Touchpad.filters`)::
+
+    touchpad.filters = filters.FilterChain(filters.SpikeFilter(max_jump=80), filters.OneEuroFilter())
+
+Each touch is filtered separately: when the touchpad is released, the filter's state is reset.
+Filtering a sample takes constant time, and the filters' state is kept in a few preallocated variables.
+
+The same filters can be applied offline, to recorded samples (:func:`Filter.apply`). The results are identical
+to filtering the samples one by one::
+
+    x, y = chain.apply(samples["timestamp"] / 1e9, samples["flags"] & tsc2017.flag_touched, samples["x"], samples["y"])
+"""
+
+from __future__ import division
+
+import copy
+import math
+import numbers
+import numpy as np
+
+
+#=================================================================================================
+class Filter(object):
+    """
+    The base class of filters
+    """
+
+    #------------------------------------------------------------
+    def reset(self):
+        """
+        Forget the previous samples (this is done automatically when the touchpad is released)
+        """
+        raise NotImplementedError()
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        """
+        Filter one sample
+
+        :param t: The sample's timestamp (in seconds)
+        :param touched: Whether the touchpad is touched. If not, the sample is not changed.
+        :param x: The sample's x coordinate
+        :param y: The sample's y coordinate
+        :return: The filtered (x, y) coordinates (float)
+        """
+        raise NotImplementedError()
+
+    #------------------------------------------------------------
+    def apply(self, t, touched, x, y):
+        """
+        Filter recorded samples. The result is identical to calling :func:`step` on each sample, starting from
+        a reset state. This filter's state is not changed.
+
+        :param t: Array-like of N timestamps (in seconds)
+        :param touched: Array-like of N touched states (bool or 0/1)
+        :param x: Array-like of N x coordinates
+        :param y: Array-like of N y coordinates
+        :return: (x, y) - two numpy arrays with the filtered coordinates (float64)
+        """
+        t, touched, x, y = _as_arrays(t, touched, x, y)
+
+        out_x = x.copy()
+        out_y = y.copy()
+
+        #-- Recursive filters: run the same per-sample computation, on a copy of the filter
+        f = copy.deepcopy(self)
+        f.reset()
+        step = f.step
+        for i, (ti, touched_i, xi, yi) in enumerate(zip(t.tolist(), touched.tolist(), x.tolist(), y.tolist())):
+            out_x[i], out_y[i] = step(ti, touched_i, xi, yi)
+
+        return out_x, out_y
+
+
+#-----------------------------------------------------------------
+def _as_arrays(t, touched, x, y):
+    t = np.asarray(t, dtype=np.float64)
+    touched = np.asarray(touched) != 0
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not (t.ndim == 1 and t.shape == touched.shape == x.shape == y.shape):
+        raise ValueError("Filter.apply(): t, touched, x and y must be 1-dimensional arrays of the same length")
+    return t, touched, x, y
+
+
+#-----------------------------------------------------------------
+def _validate_positive(filter_type, name, value):
+    if not isinstance(value, numbers.Number) or value <= 0:
+        raise ValueError("{:}: invalid {:} ({:})".format(filter_type.__name__, name, value))
+
+
+#=================================================================================================
+class MedianFilter(Filter):
+    """
+    A moving median: each coordinate is replaced by the median of the last *window* samples
+    (or of all samples since the touch onset, if there are fewer).
+    Removes isolated outliers while keeping sharp movements, with a delay of window/2 samples.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, window=5):
+        """
+        :param window: The number of samples (odd)
+        """
+        if not isinstance(window, int) or window < 1 or window % 2 == 0:
+            raise ValueError("{:}: the window must be a positive odd number (got {:})".format(type(self).__name__, window))
+
+        self._window = window
+        self._xs = [0.0] * window
+        self._ys = [0.0] * window
+        self._n = 0
+
+    #------------------------------------------------------------
+    @property
+    def window(self):
+        return self._window
+
+    #------------------------------------------------------------
+    def reset(self):
+        self._n = 0
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        if not touched:
+            self._n = 0
+            return x, y
+
+        i = self._n % self._window
+        self._xs[i] = x
+        self._ys[i] = y
+        self._n += 1
+
+        if self._n >= self._window:
+            return _median(self._xs), _median(self._ys)
+
+        return _median(self._xs[:self._n]), _median(self._ys[:self._n])
+
+    #------------------------------------------------------------
+    def apply(self, t, touched, x, y):
+        t, touched, x, y = _as_arrays(t, touched, x, y)
+        n = len(x)
+        w = self._window
+
+        out_x = x.copy()
+        out_y = y.copy()
+
+        #-- The number of samples since the touch onset (including the current one)
+        onsets = np.flatnonzero(touched & ~np.concatenate(([False], touched[:-1])))
+        segment_start = np.zeros(n, dtype=np.int64)
+        segment_start[onsets] = onsets
+        segment_start = np.maximum.accumulate(segment_start)
+        n_samples = np.arange(n) - segment_start + 1
+
+        #-- Samples with a full window
+        full = np.flatnonzero(touched & (n_samples >= w))
+        if len(full) > 0:
+            window_index = full[:, np.newaxis] - np.arange(w)[np.newaxis, :]
+            out_x[full] = np.median(x[window_index], axis=1)
+            out_y[full] = np.median(y[window_index], axis=1)
+
+        #-- The first samples of each touch
+        for i in np.flatnonzero(touched & (n_samples < w)).tolist():
+            first = i - n_samples[i] + 1
+            out_x[i] = _median(x[first:i + 1].tolist())
+            out_y[i] = _median(y[first:i + 1].tolist())
+
+        return out_x, out_y
+
+
+#-----------------------------------------------------------------
+def _median(values):
+    values = sorted(values)
+    m = len(values) // 2
+    return values[m] if len(values) % 2 == 1 else (values[m - 1] + values[m]) / 2
+
+
+#=================================================================================================
+class SpikeFilter(Filter):
+    """
+    Spike rejection: a sample that jumps more than *max_jump* (in x or in y) from the last accepted sample
+    is replaced by the last accepted sample. This removes the spikes that resistive panels produce, e.g.
+    when the finger is lifted.
+
+    A real fast movement would look like a series of spikes, so after *max_spike_length* consecutive rejected
+    samples, the next sample is accepted.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, max_jump=100, max_spike_length=3):
+        """
+        :param max_jump: The maximal distance between consecutive samples (in screen units)
+        :param max_spike_length: The maximal number of consecutive samples that can be rejected
+        """
+        _validate_positive(type(self), "max_jump", max_jump)
+        if not isinstance(max_spike_length, int) or max_spike_length < 0:
+            raise ValueError("{:}: invalid max_spike_length ({:})".format(type(self).__name__, max_spike_length))
+
+        self._max_jump = max_jump
+        self._max_spike_length = max_spike_length
+        self._last_x = None
+        self._last_y = None
+        self._n_rejected = 0
+
+    #------------------------------------------------------------
+    def reset(self):
+        self._last_x = None
+        self._n_rejected = 0
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        if not touched:
+            self._last_x = None
+            self._n_rejected = 0
+            return x, y
+
+        if self._last_x is not None and self._n_rejected < self._max_spike_length and \
+                (abs(x - self._last_x) > self._max_jump or abs(y - self._last_y) > self._max_jump):
+            self._n_rejected += 1
+            return self._last_x, self._last_y
+
+        self._last_x = x
+        self._last_y = y
+        self._n_rejected = 0
+        return x, y
+
+
+#=================================================================================================
+class OneEuroFilter(Filter):
+    """
+    The 1€ filter (Casiez, Roussel & Vogel, 2012): a low-pass filter whose cutoff frequency increases with
+    the speed, so slow movements are smoothed strongly (less jitter) and fast movements are followed closely
+    (less lag).
+
+    Samples with the same timestamp as the previous sample are not filtered again
+    (the previous output is returned).
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+        """
+        :param min_cutoff: The cutoff frequency (Hz) when not moving. Decrease it to reduce the jitter.
+        :param beta: How fast the cutoff frequency increases with the speed. Increase it to reduce the lag.
+        :param d_cutoff: The cutoff frequency (Hz) for smoothing the speed
+        """
+        _validate_positive(type(self), "min_cutoff", min_cutoff)
+        _validate_positive(type(self), "d_cutoff", d_cutoff)
+        if not isinstance(beta, numbers.Number) or beta < 0:
+            raise ValueError("{:}: invalid beta ({:})".format(type(self).__name__, beta))
+
+        self._min_cutoff = min_cutoff
+        self._beta = beta
+        self._d_tau = 1 / (2 * math.pi * d_cutoff)
+        self._t = None
+        self._x = self._y = 0.0
+        self._dx = self._dy = 0.0
+
+    #------------------------------------------------------------
+    def reset(self):
+        self._t = None
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        if not touched:
+            self._t = None
+            return x, y
+
+        if self._t is None:
+            self._t = t
+            self._x, self._y = x, y
+            self._dx = self._dy = 0.0
+            return x, y
+
+        dt = t - self._t
+        if dt <= 0:
+            return self._x, self._y
+        self._t = t
+
+        d_alpha = 1 / (1 + self._d_tau / dt)
+        self._x, self._dx = self._filter(x, self._x, self._dx, dt, d_alpha)
+        self._y, self._dy = self._filter(y, self._y, self._dy, dt, d_alpha)
+        return self._x, self._y
+
+    def _filter(self, value, prev_value, prev_speed, dt, d_alpha):
+        speed = prev_speed + d_alpha * ((value - prev_value) / dt - prev_speed)
+        cutoff = self._min_cutoff + self._beta * abs(speed)
+        alpha = 1 / (1 + 1 / (2 * math.pi * cutoff * dt))
+        return prev_value + alpha * (value - prev_value), speed
+
+
+#=================================================================================================
+class KalmanFilter(Filter):
+    """
+    A constant-velocity Kalman filter: each coordinate is modeled as a position moving at a velocity that
+    changes randomly (white-noise acceleration), and measured with noise.
+
+    Both coordinates have the same noise parameters, so their covariance matrices are identical and are
+    computed once per sample.
+    Samples with the same timestamp as the previous sample are not filtered again
+    (the previous output is returned).
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, process_noise=1e6, measurement_noise=4.0, initial_velocity_variance=1e6):
+        """
+        :param process_noise: The acceleration noise's spectral density (screen units^2 / s^3).
+                              Increase it to follow fast movements more closely.
+        :param measurement_noise: The variance of the measured coordinates (screen units^2).
+                                  Increase it to smooth more.
+        :param initial_velocity_variance: The velocity's variance at the touch onset ((screen units / s)^2)
+        """
+        _validate_positive(type(self), "process_noise", process_noise)
+        _validate_positive(type(self), "measurement_noise", measurement_noise)
+        _validate_positive(type(self), "initial_velocity_variance", initial_velocity_variance)
+
+        self._q = process_noise
+        self._r = measurement_noise
+        self._v0 = initial_velocity_variance
+
+        self._t = None
+        self._x = self._vx = self._y = self._vy = 0.0
+        self._p00 = self._p01 = self._p11 = 0.0  # the covariance matrix (symmetric)
+
+    #------------------------------------------------------------
+    def reset(self):
+        self._t = None
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        if not touched:
+            self._t = None
+            return x, y
+
+        if self._t is None:
+            self._t = t
+            self._x, self._y = x, y
+            self._vx = self._vy = 0.0
+            self._p00, self._p01, self._p11 = self._r, 0.0, self._v0
+            return x, y
+
+        dt = t - self._t
+        if dt <= 0:
+            return self._x, self._y
+        self._t = t
+
+        #-- Predict
+        q = self._q
+        p00 = self._p00 + dt * (2 * self._p01 + dt * self._p11) + q * dt ** 3 / 3
+        p01 = self._p01 + dt * self._p11 + q * dt ** 2 / 2
+        p11 = self._p11 + q * dt
+        pred_x = self._x + dt * self._vx
+        pred_y = self._y + dt * self._vy
+
+        #-- Update
+        s = p00 + self._r
+        k0 = p00 / s
+        k1 = p01 / s
+        self._x = pred_x + k0 * (x - pred_x)
+        self._vx += k1 * (x - pred_x)
+        self._y = pred_y + k0 * (y - pred_y)
+        self._vy += k1 * (y - pred_y)
+        self._p00 = (1 - k0) * p00
+        self._p01 = (1 - k0) * p01
+        self._p11 = p11 - k1 * p01
+
+        return self._x, self._y
+
+
+#=================================================================================================
+class FilterChain(Filter):
+    """
+    Several filters applied one after the other (each filter gets the previous filter's output)
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, *filters):
+        for f in filters:
+            if not isinstance(f, Filter):
+                raise TypeError("{:}: invalid filter ({:})".format(type(self).__name__, f))
+        self._filters = tuple(filters)
+
+    #------------------------------------------------------------
+    @property
+    def filters(self):
+        """
+        The filters in the chain (tuple)
+        """
+        return self._filters
+
+    #------------------------------------------------------------
+    def reset(self):
+        for f in self._filters:
+            f.reset()
+
+    #------------------------------------------------------------
+    def step(self, t, touched, x, y):
+        for f in self._filters:
+            x, y = f.step(t, touched, x, y)
+        return x, y
+
+    #------------------------------------------------------------
+    def apply(self, t, touched, x, y):
+        t, touched, x, y = _as_arrays(t, touched, x, y)
+        for f in self._filters:
+            x, y = f.apply(t, touched, x, y)
+        return x, y
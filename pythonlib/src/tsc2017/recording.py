@@ -0,0 +1,572 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: recording the touchpad samples to a file
+#------------------------------------------------------------------------------
+"""
+Record every sample received from the touchpad to a file, and read recordings.
+
+Samples are kept in the compact format of :data:`tsc2017.packed_sample_dtype` (21 bytes per sample),
+and are written in bulk, so recording costs almost nothing per sample::
+
+    touchpad.record("session1.tsc")
+    ...
+    touchpad.stop_recording()
+
+There are two file formats:
+
+- Fixed-width records (:class:`Recorder`): a short header followed by one record per sample.
+  :func:`read_recording` memory-maps the file, so even a multi-GB recording is available immediately
+  as a numpy structured array (the data is read from the disk only when accessed)::
+
+    samples = recording.read_recording("session1.tsc")
+    touched = samples[(samples["flags"] & tsc2017.flag_touched) != 0]
+
+- Compressed chunks (:class:`ChunkedRecorder`, or ``touchpad.record(path, compression="zlib")``):
+  the samples are delta-encoded and compressed, typically to a small fraction of their size. The file ends
+  with an index of the chunks and of the trials (touches), so a single trial can be read without reading
+  the rest of the file::
+
+    rec = recording.ChunkedRecording("session1.tscz")
+    trial = rec.read_trial(5)   # the samples of the 6th touch, from touch onset to release
+"""
+
+from __future__ import division
+
+import os
+import zlib
+import struct
+import numpy as np
+
+from ._samples import get_packed_sample_dtype, flag_touched
+
+
+#-- The header of recording files: magic string, format version, record size
+file_magic = b"TSC2017R"
+file_version = 2
+_header = struct.Struct("<8sII")
+
+#-- The fixed-width record of one sample
+record_dtype = get_packed_sample_dtype()
+
+
+#=================================================================================================
+class Recorder(object):
+    """
+    Writes samples to a recording file.
+
+    The samples are collected in a preallocated buffer, and written to the file whenever the buffer is full
+    (or when :func:`flush` / :func:`close` are called).
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, path, buffer_size=4096):
+        """
+        Create the recording file (an existing file is overwritten)
+
+        :param path: The file's path
+        :param buffer_size: The number of samples kept in memory before they are written to the file
+        """
+        if not isinstance(buffer_size, int) or buffer_size <= 0:
+            raise ValueError("{:}: invalid buffer_size ({:})".format(type(self).__name__, buffer_size))
+
+        self._path = path
+        self._buffer = np.zeros(buffer_size, dtype=record_dtype)
+        self._n_buffered = 0
+        self._n_written = 0
+
+        self._file = open(path, "wb")
+        self._file.write(_header.pack(file_magic, file_version, record_dtype.itemsize))
+
+    #------------------------------------------------------------
+    @property
+    def path(self):
+        """
+        The recording file's path
+        """
+        return self._path
+
+    #------------------------------------------------------------
+    @property
+    def dtype(self):
+        """
+        The numpy dtype of the records (:data:`record_dtype`)
+        """
+        return record_dtype
+
+    #------------------------------------------------------------
+    @property
+    def n_samples(self):
+        """
+        The number of samples recorded so far (including those not written to the file yet)
+        """
+        return self._n_written + self._n_buffered
+
+    #------------------------------------------------------------
+    @property
+    def closed(self):
+        """
+        Whether the recording file was closed
+        """
+        return self._file is None
+
+    #------------------------------------------------------------
+    def write(self, samples):
+        """
+        Record samples
+
+        :param samples: numpy structured array with (at least) the fields of :data:`record_dtype`
+        """
+        if self._file is None:
+            raise ValueError("{:}.write(): the recording was closed".format(type(self).__name__))
+
+        n = len(samples)
+        if n == 0:
+            return
+
+        if self._n_buffered + n > len(self._buffer):
+            self.flush()
+
+        if n > len(self._buffer):
+            #-- Too many samples for the buffer: write them directly
+            records = np.empty(n, dtype=record_dtype)
+            _copy_fields(samples, records)
+            records.tofile(self._file)
+            self._n_written += n
+            return
+
+        _copy_fields(samples, self._buffer[self._n_buffered:self._n_buffered + n])
+        self._n_buffered += n
+
+    #------------------------------------------------------------
+    def flush(self):
+        """
+        Write the buffered samples to the file
+        """
+        if self._file is None:
+            return
+
+        if self._n_buffered > 0:
+            self._buffer[:self._n_buffered].tofile(self._file)
+            self._n_written += self._n_buffered
+            self._n_buffered = 0
+
+        self._file.flush()
+
+    #------------------------------------------------------------
+    def close(self):
+        """
+        Write the buffered samples and close the file
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    #------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+#-----------------------------------------------------------------
+def _copy_fields(source, target):
+    for name in record_dtype.names:
+        target[name] = source[name]
+
+
+#-----------------------------------------------------------------
+def read_recording(path):
+    """
+    Read a recording file created by :class:`Recorder` or :class:`ChunkedRecorder`
+    (or :func:`tsc2017.Touchpad.record`).
+
+    A file with fixed-width records is memory-mapped, not read: this function returns immediately regardless
+    of the file's size, and the samples are loaded from the disk only when accessed.
+    If the recording was interrupted in the middle of a record, the incomplete record is ignored.
+
+    A compressed (chunked) file is decompressed entirely; use :class:`ChunkedRecording` to read parts of it.
+
+    :param path: The file's path
+    :return: numpy structured array (:data:`record_dtype`) with one record per sample (read-only, if memory-mapped)
+    """
+    with open(path, "rb") as fp:
+        header = fp.read(_header.size)
+
+    if len(header) < _header.size:
+        raise ValueError("{:} is not a tsc2017 recording (the file is too short)".format(path))
+
+    magic, version, record_size = _header.unpack(header)
+    if magic == chunked_file_magic:
+        return ChunkedRecording(path).read()
+    if magic != file_magic:
+        raise ValueError("{:} is not a tsc2017 recording".format(path))
+    if version != file_version or record_size != record_dtype.itemsize:
+        raise ValueError("{:}: unsupported recording format (version {:}, record size {:})".
+                         format(path, version, record_size))
+
+    n_samples = (os.path.getsize(path) - _header.size) // record_dtype.itemsize
+    if n_samples == 0:
+        return np.zeros(0, dtype=record_dtype)
+
+    return np.memmap(path, dtype=record_dtype, mode="r", offset=_header.size, shape=(n_samples, ))
+
+
+#=================================================================================================
+#     Compressed (chunked) recordings
+#=================================================================================================
+
+#-- The header of compressed recording files: magic string, format version, compression
+chunked_file_magic = b"TSC2017C"
+chunked_file_version = 1
+
+#-- The compression methods (the value stored in the header of compressed files)
+_compressions = {"zlib": 1, "lzma": 2}
+
+#-- The end of compressed recording files: the index's offset, and a magic string
+_trailer = struct.Struct("<Q8s")
+_index_magic = b"TSC2017I"
+
+#-- The index's header: the number of samples, chunks and trials
+_index_header = struct.Struct("<QQQ")
+
+
+#-----------------------------------------------------------------
+def _get_codec(compression):
+    """
+    Get the (compress, decompress) functions of a compression method
+    """
+    if compression == "zlib":
+        return zlib.compress, zlib.decompress
+
+    if compression == "lzma":
+        import lzma
+        return lzma.compress, lzma.decompress
+
+    raise ValueError("Unsupported compression ({:}); use one of {:}".format(compression, ", ".join(sorted(_compressions))))
+
+
+#-----------------------------------------------------------------
+def _encode_chunk(samples, compress):
+    """
+    Delta-encode each field of the samples (except the flags), and compress the fields one after the other.
+    Consecutive samples differ only slightly, so the deltas are small numbers that compress well.
+    Deltas are computed in the field's own type; overflows wrap around, and decoding wraps them back.
+    """
+    columns = []
+    for name in record_dtype.names:
+        values = np.ascontiguousarray(samples[name])
+        if name != "flags":
+            values = values.copy()
+            values[1:] -= samples[name][:-1]
+        columns.append(values.tobytes())
+
+    return compress(b"".join(columns))
+
+
+#-----------------------------------------------------------------
+def _decode_chunk(data, n_samples, decompress):
+    """
+    Decode a chunk encoded by _encode_chunk()
+    """
+    data = decompress(data)
+    samples = np.empty(n_samples, dtype=record_dtype)
+
+    offset = 0
+    for name in record_dtype.names:
+        field_dtype = record_dtype.fields[name][0]
+        values = np.frombuffer(data, dtype=field_dtype, count=n_samples, offset=offset)
+        offset += n_samples * field_dtype.itemsize
+        samples[name] = values if name == "flags" else np.cumsum(values, dtype=field_dtype)
+
+    return samples
+
+
+#=================================================================================================
+class ChunkedRecorder(object):
+    """
+    Writes samples to a compressed recording file.
+
+    The samples are collected in chunks (up to *chunk_size* samples). Each chunk is delta-encoded and compressed,
+    and written to the file when it's full. A new chunk starts at each touch onset, so each trial (a touch,
+    from onset to release) starts at the beginning of a chunk.
+
+    When the recording is closed, an index is written at the end of the file: the offset and first sample of
+    each chunk, and the first and last sample of each trial. An interrupted recording (not closed) has no
+    index and cannot be read.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, path, compression="zlib", chunk_size=4096):
+        """
+        Create the recording file (an existing file is overwritten)
+
+        :param path: The file's path
+        :param compression: "zlib" (faster) or "lzma" (smaller files)
+        :param chunk_size: The maximal number of samples per chunk
+        """
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise ValueError("{:}: invalid chunk_size ({:})".format(type(self).__name__, chunk_size))
+
+        self._compress = _get_codec(compression)[0]
+        self._path = path
+        self._chunk = np.zeros(chunk_size, dtype=record_dtype)
+        self._n_chunk_samples = 0
+        self._n_written = 0
+        self._touched = False
+
+        #-- The index
+        self._chunk_offsets = []
+        self._chunk_starts = []
+        self._trial_starts = []
+        self._trial_ends = []
+
+        self._file = open(path, "wb")
+        self._file.write(_header.pack(chunked_file_magic, chunked_file_version, _compressions[compression]))
+
+    #------------------------------------------------------------
+    @property
+    def path(self):
+        """
+        The recording file's path
+        """
+        return self._path
+
+    #------------------------------------------------------------
+    @property
+    def dtype(self):
+        """
+        The numpy dtype of the records (:data:`record_dtype`)
+        """
+        return record_dtype
+
+    #------------------------------------------------------------
+    @property
+    def n_samples(self):
+        """
+        The number of samples recorded so far (including those not written to the file yet)
+        """
+        return self._n_written + self._n_chunk_samples
+
+    #------------------------------------------------------------
+    @property
+    def closed(self):
+        """
+        Whether the recording file was closed
+        """
+        return self._file is None
+
+    #------------------------------------------------------------
+    def write(self, samples):
+        """
+        Record samples
+
+        :param samples: numpy structured array with (at least) the fields of :data:`record_dtype`
+        """
+        if self._file is None:
+            raise ValueError("{:}.write(): the recording was closed".format(type(self).__name__))
+
+        n = len(samples)
+        if n == 0:
+            return
+
+        #-- Find the touch onsets and offsets
+        touched = (samples["flags"] & flag_touched) != 0
+        was_touched = np.concatenate(([self._touched], touched[:-1]))
+        onsets = np.flatnonzero(touched & ~was_touched)
+        offsets = np.flatnonzero(~touched & was_touched)
+        self._touched = bool(touched[-1])
+
+        first_sample = self.n_samples
+        self._trial_starts.extend((onsets + first_sample).tolist())
+        self._trial_ends.extend((offsets + first_sample).tolist())
+
+        #-- Add the samples to the chunk, starting a new chunk at each onset
+        start = 0
+        for end in onsets.tolist() + [n]:
+            if end == start:
+                if self._n_chunk_samples > 0:
+                    self._write_chunk()
+                continue
+
+            while start < end:
+                n_copied = min(end - start, len(self._chunk) - self._n_chunk_samples)
+                _copy_fields(samples[start:start + n_copied],
+                             self._chunk[self._n_chunk_samples:self._n_chunk_samples + n_copied])
+                self._n_chunk_samples += n_copied
+                start += n_copied
+                if self._n_chunk_samples == len(self._chunk) or (start == end and end < n):
+                    self._write_chunk()
+
+    #------------------------------------------------------------
+    def _write_chunk(self):
+        self._chunk_offsets.append(self._file.tell())
+        self._chunk_starts.append(self._n_written)
+        self._file.write(_encode_chunk(self._chunk[:self._n_chunk_samples], self._compress))
+        self._n_written += self._n_chunk_samples
+        self._n_chunk_samples = 0
+
+    #------------------------------------------------------------
+    def flush(self):
+        """
+        Write the current chunk to the file (even if it's not full)
+        """
+        if self._file is None:
+            return
+
+        if self._n_chunk_samples > 0:
+            self._write_chunk()
+
+        self._file.flush()
+
+    #------------------------------------------------------------
+    def close(self):
+        """
+        Write the remaining samples and the index, and close the file
+        """
+        if self._file is None:
+            return
+
+        self.flush()
+
+        #-- A trial that did not end yet ends with the recording
+        trial_ends = self._trial_ends + [self._n_written] * (len(self._trial_starts) - len(self._trial_ends))
+
+        index_offset = self._file.tell()
+        self._file.write(_index_header.pack(self._n_written, len(self._chunk_offsets), len(self._trial_starts)))
+        for values in self._chunk_offsets, self._chunk_starts, self._trial_starts, trial_ends:
+            self._file.write(np.array(values, dtype="<u8").tobytes())
+        self._file.write(_trailer.pack(index_offset, _index_magic))
+
+        self._file.close()
+        self._file = None
+
+    #------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+#=================================================================================================
+class ChunkedRecording(object):
+    """
+    A compressed recording file (created by :class:`ChunkedRecorder`).
+
+    Only the file's index is read when the object is created; the samples are read and decompressed
+    when requested, one chunk at a time.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, path):
+        """
+        :param path: The file's path
+        """
+        self._path = path
+
+        with open(path, "rb") as fp:
+            header = fp.read(_header.size)
+            if len(header) < _header.size or _header.unpack(header)[0] != chunked_file_magic:
+                raise ValueError("{:} is not a compressed tsc2017 recording".format(path))
+
+            magic, version, compression = _header.unpack(header)
+            compressions = {code: name for name, code in _compressions.items()}
+            if version != chunked_file_version or compression not in compressions:
+                raise ValueError("{:}: unsupported recording format (version {:}, compression {:})".
+                                 format(path, version, compression))
+            self._decompress = _get_codec(compressions[compression])[1]
+
+            fp.seek(0, os.SEEK_END)
+            file_size = fp.tell()
+            if file_size < _header.size + _trailer.size:
+                raise ValueError("{:}: the recording has no index (it was not closed properly)".format(path))
+            fp.seek(file_size - _trailer.size)
+            index_offset, index_magic = _trailer.unpack(fp.read(_trailer.size))
+            if index_magic != _index_magic:
+                raise ValueError("{:}: the recording has no index (it was not closed properly)".format(path))
+
+            fp.seek(index_offset)
+            self._n_samples, n_chunks, n_trials = _index_header.unpack(fp.read(_index_header.size))
+            index = np.frombuffer(fp.read(8 * (2 * n_chunks + 2 * n_trials)), dtype="<u8").astype(np.int64)
+
+        self._chunk_offsets = np.append(index[:n_chunks], index_offset)
+        self._chunk_starts = np.append(index[n_chunks:2 * n_chunks], self._n_samples)
+        self._trial_starts = index[2 * n_chunks:2 * n_chunks + n_trials]
+        self._trial_ends = index[2 * n_chunks + n_trials:]
+
+    #------------------------------------------------------------
+    @property
+    def path(self):
+        """
+        The recording file's path
+        """
+        return self._path
+
+    #------------------------------------------------------------
+    @property
+    def n_samples(self):
+        """
+        The number of samples in the recording
+        """
+        return self._n_samples
+
+    #------------------------------------------------------------
+    @property
+    def n_trials(self):
+        """
+        The number of trials (touches) in the recording
+        """
+        return len(self._trial_starts)
+
+    #------------------------------------------------------------
+    def trial_range(self, k):
+        """
+        The samples of trial k: from the touch onset until (not including) the first sample after the
+        release (or the end of the recording)
+
+        :return: (first sample, end sample)
+        """
+        if not 0 <= k < len(self._trial_starts):
+            raise IndexError("{:}: no trial #{:} (the recording has {:} trials)".
+                             format(type(self).__name__, k, len(self._trial_starts)))
+
+        return int(self._trial_starts[k]), int(self._trial_ends[k])
+
+    #------------------------------------------------------------
+    def read_trial(self, k):
+        """
+        Read the samples of trial k (see :func:`trial_range`). Only the chunks that contain the trial are
+        read from the file (usually one).
+
+        :return: numpy structured array (:data:`record_dtype`)
+        """
+        return self.read(*self.trial_range(k))
+
+    #------------------------------------------------------------
+    def read(self, start=0, stop=None):
+        """
+        Read samples
+
+        :param start: The first sample to read
+        :param stop: The sample after the last one to read (None = until the end of the recording)
+        :return: numpy structured array (:data:`record_dtype`)
+        """
+        stop = self._n_samples if stop is None else min(stop, self._n_samples)
+        if start >= stop:
+            return np.zeros(0, dtype=record_dtype)
+
+        #-- The chunks that contain the samples
+        first_chunk = np.searchsorted(self._chunk_starts, start, side="right") - 1
+        end_chunk = np.searchsorted(self._chunk_starts, stop, side="left")
+
+        chunks = []
+        with open(self._path, "rb") as fp:
+            fp.seek(self._chunk_offsets[first_chunk])
+            for i in range(first_chunk, end_chunk):
+                data = fp.read(self._chunk_offsets[i + 1] - self._chunk_offsets[i])
+                chunks.append(_decode_chunk(data, self._chunk_starts[i + 1] - self._chunk_starts[i], self._decompress))
+
+        samples = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        first_sample = self._chunk_starts[first_chunk]
+        return samples[start - first_sample:stop - first_sample]
@@ -0,0 +1,232 @@
+#------------------------------------------------------------------------------
+#   TrajTracker touchpad interface: resampling touch samples at a fixed rate
+#------------------------------------------------------------------------------
+"""
+Convert irregularly-timed touch samples into a series with a fixed sampling rate, by linear interpolation.
+
+Each grid time gets the coordinates interpolated between the samples before and after it. Coordinates are
+never interpolated across a release of the touchpad (or across a gap longer than *max_gap*): such grid
+times are marked as not touched, and their coordinates are NaN.
+
+Offline::
+
+    samples = touchpad.read_samples()
+    resampled = resampling.resample(samples["timestamp"], samples["touched"], samples["x"], samples["y"], 100)
+
+Online, sample by sample::
+
+    resampler = resampling.Resampler(rate_hz=100)
+    for t, touched, x, y in resampler.push(ti.timestamp, ti.touched, ti.x, ti.y):
+        ...
+
+Both give identical results.
+"""
+
+from __future__ import division
+
+import math
+import numbers
+import numpy as np
+
+
+#-- The numpy dtype of resampled series
+resampled_dtype = np.dtype([("timestamp", np.float64), ("touched", np.bool_), ("x", np.float64), ("y", np.float64)])
+
+
+#-----------------------------------------------------------------
+def _validate_args(func_name, rate_hz, max_gap):
+    if not isinstance(rate_hz, numbers.Number) or rate_hz <= 0:
+        raise ValueError("{:}: invalid rate_hz ({:})".format(func_name, rate_hz))
+    if max_gap is not None and (not isinstance(max_gap, numbers.Number) or max_gap <= 0):
+        raise ValueError("{:}: invalid max_gap ({:})".format(func_name, max_gap))
+
+
+#-----------------------------------------------------------------
+def _first_grid_index(start, rate_hz, t0):
+    """
+    The index of the first grid time (start + k / rate_hz, k >= 0) that is not earlier than t0
+    """
+    k = max(0, int(math.ceil((t0 - start) * rate_hz)))
+    while start + k / rate_hz < t0:
+        k += 1
+    while k > 0 and start + (k - 1) / rate_hz >= t0:
+        k -= 1
+    return k
+
+
+#-----------------------------------------------------------------
+def _last_grid_index(start, rate_hz, t1):
+    """
+    The index of the last grid time (start + k / rate_hz) that is not later than t1
+    """
+    k = int(math.floor((t1 - start) * rate_hz))
+    while start + (k + 1) / rate_hz <= t1:
+        k += 1
+    while start + k / rate_hz > t1:
+        k -= 1
+    return k
+
+
+#-----------------------------------------------------------------
+def resample(timestamps, touched, x, y, rate_hz, max_gap=None, start=None):
+    """
+    Resample touch samples at a fixed rate
+
+    :param timestamps: Array-like of N sample times (in seconds). A sample whose timestamp is not later than all
+                       previous timestamps is ignored.
+    :param touched: Array-like of N touched states (bool or 0/1)
+    :param x: Array-like of N x coordinates
+    :param y: Array-like of N y coordinates
+    :param rate_hz: The output's sampling rate
+    :param max_gap: The maximal duration (in seconds) between two samples for interpolating between them
+                    (None = no limit)
+    :param start: The time of the output's grid: grid times are start + k / rate_hz (k = 0, 1, ...).
+                  By default, the grid starts at the first sample.
+    :return: numpy structured array (:data:`resampled_dtype`) with the grid times from the first sample (or
+             *start*, if later) to the last sample: timestamp, touched, and the interpolated x, y (NaN if
+             not touched)
+    """
+    _validate_args("resample()", rate_hz, max_gap)
+
+    t = np.asarray(timestamps, dtype=np.float64)
+    touched = np.asarray(touched) != 0
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not (t.ndim == 1 and t.shape == touched.shape == x.shape == y.shape):
+        raise ValueError("resample(): timestamps, touched, x and y must be 1-dimensional arrays of the same length")
+
+    if len(t) == 0:
+        return np.zeros(0, dtype=resampled_dtype)
+
+    #-- Ignore samples that are not later than the previous ones
+    keep = t > np.maximum.accumulate(np.concatenate(([-np.inf], t[:-1])))
+    t, touched, x, y = t[keep], touched[keep], x[keep], y[keep]
+
+    if start is None:
+        start = t[0]
+    first_k = _first_grid_index(start, rate_hz, t[0])
+    last_k = max(first_k - 1, _last_grid_index(start, rate_hz, t[-1]))
+    grid = start + np.arange(first_k, last_k + 1) / rate_hz
+
+    #-- For each grid time, the sample before it (or at the same time) and the sample after it
+    i0 = np.searchsorted(t, grid, side="right") - 1
+    i1 = np.minimum(i0 + 1, len(t) - 1)
+    exact = grid == t[i0]
+
+    interpolate = touched[i0] & touched[i1] & ~exact
+    if max_gap is not None:
+        interpolate &= t[i1] - t[i0] <= max_gap
+
+    result = np.empty(len(grid), dtype=resampled_dtype)
+    result["timestamp"] = grid
+    result["touched"] = (exact & touched[i0]) | interpolate
+    result["x"] = np.nan
+    result["y"] = np.nan
+
+    #-- Same operations as in Resampler.push()
+    j0 = i0[interpolate]
+    j1 = i1[interpolate]
+    fraction = (grid[interpolate] - t[j0]) / (t[j1] - t[j0])
+    result["x"][interpolate] = x[j0] + (x[j1] - x[j0]) * fraction
+    result["y"][interpolate] = y[j0] + (y[j1] - y[j0]) * fraction
+
+    exact_touched = exact & touched[i0]
+    result["x"][exact_touched] = x[i0[exact_touched]]
+    result["y"][exact_touched] = y[i0[exact_touched]]
+
+    return result
+
+
+#=================================================================================================
+class Resampler(object):
+    """
+    Resample touch samples at a fixed rate, online: each new sample produces the grid times up to
+    (and including) the sample's time.
+    The results are identical to :func:`resample`.
+    """
+
+    #------------------------------------------------------------
+    def __init__(self, rate_hz, max_gap=None, start=None):
+        """
+        :param rate_hz: See :func:`resample`
+        :param max_gap: See :func:`resample`
+        :param start: See :func:`resample`
+        """
+        _validate_args("Resampler", rate_hz, max_gap)
+
+        self._rate_hz = rate_hz
+        self._max_gap = max_gap
+        self._start = start
+        self.reset()
+
+    #------------------------------------------------------------
+    def reset(self):
+        """
+        Forget the previous samples; the next sample starts a new series
+        """
+        self._t = None
+        self._touched = False
+        self._x = self._y = 0.0
+        self._grid_start = self._start
+        self._next_k = 0
+
+    #------------------------------------------------------------
+    @property
+    def rate_hz(self):
+        return self._rate_hz
+
+    #------------------------------------------------------------
+    def push(self, t, touched, x, y):
+        """
+        Add a sample
+
+        :param t: The sample's time (in seconds). A sample that is not later than the previous one is ignored.
+        :param touched: Whether the touchpad is touched
+        :param x: The sample's x coordinate
+        :param y: The sample's y coordinate
+        :return: list of (timestamp, touched, x, y) tuples: the grid times after the previous sample, up to
+                 this sample's time
+        """
+        t = float(t)
+        touched = bool(touched)
+        x = float(x)
+        y = float(y)
+
+        prev_t = self._t
+        if prev_t is not None and t <= prev_t:
+            return []
+
+        rate_hz = self._rate_hz
+        if prev_t is None:
+            if self._grid_start is None:
+                self._grid_start = t
+            self._next_k = _first_grid_index(self._grid_start, rate_hz, t)
+
+        interpolate = prev_t is not None and self._touched and touched and \
+            (self._max_gap is None or t - prev_t <= self._max_gap)
+
+        result = []
+        start = self._grid_start
+        k = self._next_k
+        while True:
+            g = start + k / rate_hz
+            if g > t:
+                break
+
+            if g == t:
+                result.append((g, touched, x, y) if touched else (g, False, np.nan, np.nan))
+            elif interpolate:
+                #-- Same operations as in resample()
+                fraction = (g - prev_t) / (t - prev_t)
+                result.append((g, True, self._x + (x - self._x) * fraction, self._y + (y - self._y) * fraction))
+            else:
+                result.append((g, False, np.nan, np.nan))
+            k += 1
+
+        self._next_k = k
+        self._t = t
+        self._touched = touched
+        self._x = x
+        self._y = y
+
+        return result
@@ -1,10 +1,16 @@
+import time
+import ctypes
+import threading
+
+import numpy as np
 
 import tsc2017
-from tsc2017._tsc2017 import DLLTouchInfo
+from tsc2017._tsc2017 import DLLFuncs, DLLTouchInfo, DLLLegacyTouchInfo, DLLPackedSample
 
 
-class _DummyTouchpadLib(object):
-    pass
+class _DummyTouchpadLib(DLLFuncs):
+    def __init__(self):
+        super(_DummyTouchpadLib, self).__init__(None, "dummy.dll")
 
 
 class TestTouchpad(tsc2017.Touchpad):
@@ -45,3 +51,200 @@ class TestTouchpad(tsc2017.Touchpad):
             not isinstance(value[0], bool) or not isinstance(value[1], int) or not isinstance(value[2], int):
             raise TypeError("Invalida data")
         self._data = value
+
+
+#=============================================================================================
+class DummyTouchpad(tsc2017.Touchpad):
+    """
+    A touchpad that simulates the DLL: samples are received from the "device" by calling add_sample()
+    """
+
+    #-- The connected touchpads, by resource ID
+    connected = {}
+
+    #-- The devices that find_devices() finds, and the devices that cannot be connected
+    device_ids = []
+    unavailable_devices = set()
+
+    #-- The touchpad that is connecting now
+    connecting = None
+
+    #---------------------------------------------------------
+    def __init__(self, dll_of=None, **kwargs):
+        """
+        :param dll_of: Another DummyTouchpad, whose (simulated) DLL this touchpad should use
+        """
+        super(DummyTouchpad, self).__init__(**kwargs)
+        self._dll_of = dll_of
+        self.pending_samples = []
+        self.last_sample = None
+        self.sample_count = 0
+        self.sample_callback = None
+        self.events_enabled = False
+        self.n_stats_resets = 0
+        self.n_connects = 0
+        self.dll_transform = None
+        self.n_dll_transforms = 0
+        self._sample_received = threading.Condition()
+
+
+    #---------------------------------------------------------
+    def _init_dll(self, dll_path=""):
+
+        if self._dll_of is not None:
+            #-- Use the other touchpad's DLL
+            self._dll_of._open_library()
+            self._library = self._dll_of._library
+            return
+
+        #-- Like the DLL's functions, the functions find the device by the resource ID
+        device = lambda resource: DummyTouchpad.connected[resource.value]
+
+        self._library = _DummyTouchpadLib()
+        self._library.create_resource_manager = lambda: 1
+        self._library.cleanup_resource_manager = lambda res_mgr: 0
+        self._library.connect = lambda res_mgr, device_name: DummyTouchpad.connecting._connect_impl(device_name.value)
+        self._library.find_devices = lambda res_mgr, buf, buf_size: self._find_devices_impl(buf, buf_size)
+        self._library.clear_samples = lambda resource: device(resource)._clear_samples_impl()
+        self._library.suspend_events = lambda resource: setattr(device(resource), "events_enabled", False)
+        self._library.resume_events = lambda resource: setattr(device(resource), "events_enabled", True) or 1
+        self._library.disconnect = lambda resource: DummyTouchpad.connected.pop(resource.value, None)
+        self._library.get_touch_info = lambda resource: device(resource)._get_touch_info_impl()
+        self._library.get_touch_info_multi = lambda resources, n, ti: \
+            [ctypes.memmove(ctypes.byref(ti[i]), ctypes.byref(DummyTouchpad.connected[resources[i]]._get_touch_info_impl()),
+                            ctypes.sizeof(DLLTouchInfo)) for i in range(n)]
+        self._library.get_touch_info_into = lambda resource, ti: ctypes.memmove(ti, ctypes.byref(device(resource)._get_touch_info_impl()),
+                                                                               ctypes.sizeof(DLLTouchInfo))
+        self._library.get_timestamp_frequency = lambda: 1000000
+        self._library.get_timestamp = lambda: int(time.perf_counter() * 1000000)
+        self._library.read_packed_samples = lambda resource, buf, max_n: device(resource)._read_packed_samples_impl(buf, max_n)
+        self._library.get_sample_count = lambda resource: device(resource).sample_count
+        self._library.wait_for_sample = lambda resource, after_count, timeout_ms: \
+            device(resource)._wait_for_sample_impl(after_count, timeout_ms)
+        self._library.get_device_stats = lambda resource, stats: device(resource)._get_device_stats_impl(stats)
+        self._library.reset_device_stats = lambda resource: setattr(device(resource), "n_stats_resets", device(resource).n_stats_resets + 1)
+        self._library.set_transform = lambda resource, matrix: \
+            device(resource)._set_dll_transform(tsc2017.TransformPlan.from_matrix(np.reshape(matrix[:9], (3, 3))))
+        self._library.set_lookup_table = lambda resource, table, n: \
+            device(resource)._set_dll_transform(tsc2017.LookupTable(np.ctypeslib.as_array(table, (n, n, 2)).copy()))
+        self._library.clear_transform = lambda resource: setattr(device(resource), "dll_transform", None)
+        self._library.SampleCallback = ctypes.CFUNCTYPE(None, ctypes.c_uint32)
+        self._library.set_sample_callback = lambda resource, callback: setattr(device(resource), "sample_callback", callback or None)
+
+
+    #---------------------------------------------------------
+    def connect(self, device_name):
+        DummyTouchpad.connecting = self
+        super(DummyTouchpad, self).connect(device_name)
+        #-- A reused session now belongs to this touchpad
+        DummyTouchpad.connected[self._resource] = self
+
+
+    #---------------------------------------------------------
+    def add_sample(self, touched, x, y):
+        if not self.events_enabled:
+            return  # The DLL doesn't handle the interrupts of an idle session
+
+        with self._sample_received:
+            self.sample_count += 1
+            screen_x, screen_y, transform_id = 0, 0, 0
+            if self.dll_transform is not None:
+                (screen_x, screen_y), transform_id = self.dll_transform.apply(x, y), self.n_dll_transforms
+            self.last_sample = touched, x, y, self.sample_count, int(time.perf_counter() * 1000000), \
+                screen_x, screen_y, transform_id
+            self.pending_samples.append(self.last_sample)
+            self._sample_received.notify_all()
+
+        if self.sample_callback is not None:
+            self.sample_callback(1)
+
+
+    def _find_devices_impl(self, buf, buf_size):
+        names = b""
+        for device_id in DummyTouchpad.device_ids:
+            name = device_id if names == b"" else b"\n" + device_id
+            if len(names) + len(name) < buf_size:
+                names += name
+        buf.value = names
+        return len(DummyTouchpad.device_ids)
+
+
+    def _connect_impl(self, device_name):
+        if device_name in DummyTouchpad.unavailable_devices:
+            return 0
+        self.device_name = device_name
+        self.n_connects += 1
+        self.events_enabled = True
+        resource = max([0] + list(DummyTouchpad.connected.keys())) + 1
+        DummyTouchpad.connected[resource] = self
+        return resource
+
+
+    def _set_dll_transform(self, transform):
+        self.dll_transform = transform
+        self.n_dll_transforms += 1
+        return self.n_dll_transforms
+
+
+    def _clear_samples_impl(self):
+        #-- Like the DLL, restart the sequence numbers and the counters
+        self.last_sample = None
+        self.pending_samples = []
+        self.sample_count = 0
+
+
+    def _get_touch_info_impl(self):
+        ti = DLLTouchInfo()
+        if self.last_sample is not None:
+            ti.valid = 1
+            ti.touched, ti.x, ti.y, ti.seq, ti.timestamp, ti.screen_x, ti.screen_y, ti.transform_id = self.last_sample
+        return ti
+
+
+    def _read_packed_samples_impl(self, buf, max_n):
+        samples = self.pending_samples[:max_n]
+        self.pending_samples = self.pending_samples[max_n:]
+        for i, (touched, x, y, seq, timestamp, screen_x, screen_y, transform_id) in enumerate(samples):
+            #-- Like the DLL, transform again samples that were transformed with an older transformation
+            if self.dll_transform is not None and transform_id != self.n_dll_transforms:
+                screen_x, screen_y = self.dll_transform.apply(x, y)
+            buf[i] = DLLPackedSample(int(x), int(y), screen_x, screen_y, 1 if touched else 0, seq, timestamp)
+        return len(samples)
+
+
+    def _wait_for_sample_impl(self, after_count, timeout_ms):
+        with self._sample_received:
+            if self.sample_count == after_count:
+                self._sample_received.wait(None if timeout_ms < 0 else timeout_ms / 1000)
+            return self.sample_count
+
+
+    def _get_device_stats_impl(self, stats):
+        stats._obj.interrupts_received = self.sample_count
+        return 1
+
+
+#=============================================================================================
+class LegacyDummyTouchpad(DummyTouchpad):
+    """
+    A DummyTouchpad that simulates an older DLL, which exports only the functions that connect to the device and
+    get the current touch info
+    """
+
+    #-- The functions that older DLLs export
+    legacy_funcs = "create_resource_manager", "cleanup_resource_manager", "connect", "disconnect", "get_touch_info"
+
+    #---------------------------------------------------------
+    def _init_dll(self, dll_path=""):
+        super(LegacyDummyTouchpad, self)._init_dll(dll_path)
+        for name in list(vars(self._library)):
+            if name not in self.legacy_funcs + ("dll", "dll_path"):
+                setattr(self._library, name, None)
+
+
+    def _get_touch_info_impl(self):
+        ti = DLLLegacyTouchInfo()
+        if self.last_sample is not None:
+            ti.valid = 1
+            ti.touched, ti.x, ti.y = self.last_sample[:3]
+        return ti
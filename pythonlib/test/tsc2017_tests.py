@@ -1,6 +1,17 @@
+import os
+import sys
+import time
+import subprocess
+import tempfile
+import asyncio
+import threading
 import unittest
-from TestUtils import TestTouchpad
-from tsc2017 import TouchInfo
+from TestUtils import TestTouchpad, DummyTouchpad, LegacyDummyTouchpad
+import numpy as np
+import tsc2017
+from tsc2017 import TouchInfo, TransformPlan, calibration
+from tsc2017._stats import LatencyHistogram
+from tsc2017._resources import ResourcePool
 
 
 #------------------------------------------------------------------------------
@@ -71,6 +82,911 @@ class Tsc2017Tests(unittest.TestCase):
         tp.output_screen_size = (2000, 1000)
         self.assertEqual((True, -500, -250), get_touch_data(tp))
 
+    #------------------------------------------------------------------------------
+    def test_read_samples(self):
+        tp = DummyTouchpad(scale_coords_by=(0.5, 0.25), shift_coords_by=(10, -10))
+        tp.connect(b"dummy")
+        tp.add_sample(True, 3048, 3048)
+        tp.add_sample(True, 2048, 1048)
+        tp.add_sample(False, 1000, 1000)
+
+        samples = tp.read_samples()
+        self.assertEqual([True, True, False], list(samples["touched"]))
+        self.assertEqual([510, 10, -514], list(samples["x"]))
+        self.assertEqual([240, -260, -272], list(samples["y"]))
+
+        #-- Samples are returned only once
+        self.assertEqual(0, len(tp.read_samples()))
+
+    #------------------------------------------------------------------------------
+    def test_read_samples_same_as_get_touch_data(self):
+        tp = DummyTouchpad(scale_coords_by=(0.37, 1.21), shift_coords_by=(3, 7))
+        tp.connect(b"dummy")
+        for x, y in (0, 0), (17, 4095), (2049, 2047), (3333, 123):
+            tp.add_sample(True, x, y)
+            td = tp.get_touch_data()
+            sample = tp.read_samples()[0]
+            self.assertEqual((td.x, td.y), (sample["x"], sample["y"]))
+
+    #------------------------------------------------------------------------------
+    def test_read_packed_samples(self):
+        tp = DummyTouchpad(scale_coords_by=(0.5, 0.25), shift_coords_by=(10, -10))
+        tp.connect(b"dummy")
+        t0 = time.perf_counter()
+        tp.add_sample(True, 3048, 3048)
+        tp.add_sample(False, 1000, 1000)
+        t1 = time.perf_counter()
+
+        packed = tp.read_packed_samples()
+        self.assertEqual(tsc2017.packed_sample_dtype, packed.dtype)
+        self.assertEqual(21, packed.dtype.itemsize)
+        self.assertEqual([(3048, 3048, 510, 240, 1, 1), (1000, 1000, -514, -272, 0, 2)],
+                         packed[["raw_x", "raw_y", "x", "y", "flags", "seq"]].tolist())
+        self.assertTrue(t0 - 0.001 <= packed["timestamp"][0] / 1e9 <= t1 + 0.001)
+
+        samples = tsc2017.unpack_samples(packed)
+        self.assertEqual([True, False], list(samples["touched"]))
+        self.assertEqual([510, -514], list(samples["x"]))
+        self.assertAlmostEqual(packed["timestamp"][1] / 1e9, samples["timestamp"][1], places=6)
+
+    #------------------------------------------------------------------------------
+    def test_timestamps(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        self.assertIsNone(tp.get_touch_data().timestamp)
+
+        t0 = time.perf_counter()
+        tp.add_sample(True, 2148, 2058)
+        t1 = time.perf_counter()
+        time.sleep(0.01)
+        tp.add_sample(True, 2148, 2058)
+
+        samples = tp.read_samples()
+        self.assertTrue(t0 - 0.001 <= samples["timestamp"][0] <= t1 + 0.001)
+        self.assertTrue(samples["timestamp"][1] - samples["timestamp"][0] >= 0.009)
+        self.assertAlmostEqual(samples["timestamp"][1], tp.get_touch_data().timestamp, places=6)
+
+    #------------------------------------------------------------------------------
+    def test_only_new(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        self.assertIsNone(tp.get_touch_data(only_new=True))
+
+        tp.add_sample(True, 2148, 2058)
+        ti = tp.get_touch_data(only_new=True)
+        self.assertEqual((True, 100, 10, 1), (ti.touched, ti.x, ti.y, ti.seq))
+        self.assertIsNone(tp.get_touch_data(only_new=True))
+        self.assertIsNone(tp.get_touch_data_into(ti, only_new=True))
+        self.assertEqual(1, tp.get_touch_data().seq)
+
+        tp.add_sample(True, 2148, 2058)
+        tp.add_sample(False, 2148, 2058)
+        self.assertEqual(3, tp.get_touch_data_into(ti, only_new=True).seq)
+        self.assertEqual([1, 2, 3], list(tp.read_samples()["seq"]))
+
+    #------------------------------------------------------------------------------
+    def test_stats(self):
+        tp = DummyTouchpad(instrumentation=True)
+        tp.connect(b"dummy")
+
+        tp.get_touch_data()
+        tp.add_sample(True, 2148, 2058)
+        tp.get_touch_data()
+        tp.get_touch_data()
+        tp.add_sample(True, 2148, 2058)
+        tp.add_sample(True, 2148, 2058)
+        tp.get_touch_data()
+
+        stats = tp.stats()
+        self.assertEqual((4, 1, 1, 1), (stats["calls"], stats["invalid"], stats["repeated"], stats["missed"]))
+        self.assertEqual(4, stats["latency"]["count"])
+        self.assertTrue(stats["latency"]["min"] <= stats["latency"]["p50"] <= stats["latency"]["max"])
+        self.assertEqual(3, stats["dll"]["interrupts_received"])
+
+        tp.reset_stats()
+        self.assertEqual(0, tp.stats()["calls"])
+        self.assertEqual(1, tp.n_stats_resets)
+
+        #-- Without instrumentation, nothing is counted
+        tp.instrumentation = False
+        tp.get_touch_data()
+        self.assertEqual(0, tp.stats()["calls"])
+
+    #------------------------------------------------------------------------------
+    def test_latency_histogram(self):
+        hist = LatencyHistogram()
+        for i in range(1, 1001):
+            hist.record(i * 1e-6)
+        self.assertAlmostEqual(500e-6, hist.percentile(50), delta=500e-6 * 0.07)
+        self.assertAlmostEqual(990e-6, hist.percentile(99), delta=990e-6 * 0.07)
+        self.assertEqual(1e-3, hist.percentile(100))
+        self.assertAlmostEqual(500.5e-6, hist.summary()["mean"])
+
+    #------------------------------------------------------------------------------
+    def test_transform_batch(self):
+        tp = DummyTouchpad(scale_coords_by=(0.5, -1.5), shift_coords_by=(3, 4))
+        raw = [(0, 0), (2048, 2048), (2049, 2051), (4095, 17)]
+        xy = tp.transform_batch(raw)
+        self.assertEqual((4, 2), xy.shape)
+        self.assertEqual([[-1021, 3076], [3, 4], [4, 0], [1026, 3050]], xy.tolist())
+
+        tp.connect(b"dummy")
+        for (raw_x, raw_y), (x, y) in zip(raw, xy):
+            tp.add_sample(True, raw_x, raw_y)
+            self.assertEqual((True, x, y), get_touch_data(tp))
+
+        self.assertRaises(ValueError, lambda: tp.transform_batch([1, 2, 3]))
+
+    #------------------------------------------------------------------------------
+    def test_transform_plan(self):
+        tp = DummyTouchpad()
+        plan = tp.transform_plan
+        self.assertEqual((1, 1, -2048, -2048), (plan.scale_x, plan.scale_y, plan.offset_x, plan.offset_y))
+
+        tp.scale_coords_by = (0.5, 2)
+        tp.shift_coords_by = (10, 20)
+        plan = tp.transform_plan
+        self.assertEqual((0.5, 2, -1014, -4076), (plan.scale_x, plan.scale_y, plan.offset_x, plan.offset_y))
+        self.assertEqual((10, 22), plan.apply(2048, 2049))
+        self.assertEqual([[0.5, 0, -1014], [0, 2, -4076], [0, 0, 1]], plan.matrix.tolist())
+
+    #------------------------------------------------------------------------------
+    def test_transform_plan_affine(self):
+        plan = TransformPlan.from_matrix([[0.5, 0.1, -1000], [-0.2, -0.4, 900]])
+        self.assertEqual("affine", plan.kind)
+        self.assertEqual((0, 500), plan.apply(2000, 0))
+
+        raw = [(0, 0), (2048, 2048), (4095, 17), (1001, 3)]
+        xy = plan.apply_batch(raw)
+        self.assertEqual([list(plan.apply(x, y)) for x, y in raw], xy.tolist())
+
+        plan = TransformPlan.from_matrix([[2, 0.1, -1000], [0.2, 4, 900], [0.0001, 0.0002, 2]])
+        self.assertEqual("projective", plan.kind)
+        self.assertEqual([[1, 0.05, -500], [0.1, 2, 450], [0.00005, 0.0001, 1]], plan.matrix.tolist())
+        xy = plan.apply_batch(raw)
+        self.assertEqual([list(plan.apply(x, y)) for x, y in raw], xy.tolist())
+
+        self.assertRaises(ValueError, lambda: TransformPlan.from_matrix([[1, 0], [0, 1]]))
+
+        tp = DummyTouchpad(transform_plan=plan)
+        self.assertIs(plan, tp.transform_plan)
+        tp.connect(b"dummy")
+        tp.add_sample(True, 1001, 3)
+        self.assertEqual((True,) + plan.apply(1001, 3), get_touch_data(tp))
+
+        def set_plan():
+            tp.transform_plan = (1, 2)
+        self.assertRaises(TypeError, set_plan)
+
+    #------------------------------------------------------------------------------
+    def test_dll_transform(self):
+        tp = DummyTouchpad(scale_coords_by=(0.5, 0.25), shift_coords_by=(10, -10))
+        tp.connect(b"dummy")
+        self.assertIsNotNone(tp.dll_transform)
+
+        #-- The DLL's screen coordinates are used
+        tp.add_sample(True, 3048, 3048)
+        tp.last_sample = tp.last_sample[:5] + (1, 2, tp.n_dll_transforms)
+        self.assertEqual((1, 2), (tp.get_touch_data().x, tp.get_touch_data().y))
+
+        #-- Samples transformed by the DLL before the plan changed are transformed again
+        tp.add_sample(True, 2048, 1048)
+        tp.transform_plan = TransformPlan.from_matrix([[0, 1, 0], [1, 0, 0]])
+        tp.add_sample(True, 2048, 1048)
+        self.assertEqual(2, tp.n_dll_transforms)
+        samples = tp.read_samples()
+        self.assertEqual([1048, 1048], list(samples["x"][1:]))
+        self.assertEqual([2048, 2048], list(samples["y"][1:]))
+
+        #-- The DLL's lookup-table transformation is identical to the Python one
+        lut = tsc2017.LookupTable.build(lambda raw: raw * (0.3, 0.2) + raw[:, ::-1] ** 2 / 10000, step=256)
+        tp.lookup_table = lut
+        for x, y in (0, 0), (17, 4095), (2049, 2047), (3333, 123.5):
+            tp.add_sample(True, x, y)
+            td = tp.get_touch_data()
+            self.assertEqual(tp.n_dll_transforms, tp.last_sample[7])
+            self.assertEqual(lut.apply(x, y), (td.x, td.y))
+        self.assertEqual([lut.apply(x, y) for x, y in ((0, 0), (17, 4095), (2049, 2047), (3333, 123.5))],
+                         tp.read_samples()[["x", "y"]].tolist())
+
+        #-- The idle session does not keep the transformation, nor handle the device's interrupts
+        tp.disconnect()
+        self.assertIsNone(tp.dll_transform)
+        self.assertFalse(tp.events_enabled)
+
+    #------------------------------------------------------------------------------
+    def test_legacy_dll(self):
+        tp = LegacyDummyTouchpad(scale_coords_by=(0.5, 0.25), shift_coords_by=(10, -10))
+        tp.connect(b"dummy")
+        self.assertEqual(0, tp.get_touch_data().seq)
+
+        #-- The samples are transformed in Python, and numbered whenever the touch state changes
+        tp.add_sample(True, 100, 200)
+        td = tp.get_touch_data()
+        self.assertTrue(td.touched)
+        self.assertEqual(tp.transform_plan.apply(100, 200), (td.x, td.y))
+        self.assertAlmostEqual(time.perf_counter(), td.timestamp, delta=1)
+        self.assertEqual(1, td.seq)
+        self.assertIsNone(tp.get_touch_data(only_new=True))
+        tp.add_sample(True, 100, 200)
+        self.assertIsNone(tp.get_touch_data(only_new=True))
+        tp.add_sample(False, 100, 200)
+        self.assertEqual(2, tp.get_touch_data(only_new=True).seq)
+
+        #-- Waiting polls the device
+        self.assertFalse(tp.wait_for_release(timeout=0.01).touched)
+        self.assertIsNone(tp.wait_next_sample(timeout=0.01))
+        self.assertEqual({}, tp.stats()["dll"])
+
+        #-- Features that need a newer DLL
+        self.assertRaises(tsc2017.TSCError, tp.read_samples)
+        self.assertRaises(tsc2017.TSCError, tp.find_devices)
+        self.assertRaises(tsc2017.TSCError, lambda: tp.record(os.devnull))
+
+        #-- The session is not reused, because its samples cannot be discarded
+        tp.disconnect()
+        tp.connect(b"dummy")
+        self.assertEqual(2, tp.n_connects)
+        tp.close()
+
+    #------------------------------------------------------------------------------
+    def test_calibration_fit(self):
+        angle = np.radians(3)
+        matrix = [[0.4 * np.cos(angle), -0.4 * np.sin(angle), -800],
+                  [0.3 * np.sin(angle), 0.3 * np.cos(angle), -600]]
+        raw = np.array([(300, 200), (3800, 250), (3700, 3900), (250, 3850), (2000, 2100), (1000, 3000)])
+        screen = np.column_stack((raw, np.ones(len(raw)))).dot(np.transpose(matrix))
+
+        fit = calibration.fit_affine(raw, screen)
+        self.assertEqual("affine", fit.plan.kind)
+        np.testing.assert_allclose(matrix, fit.plan.matrix[:2], atol=1e-9)
+        self.assertLess(fit.rms_error, 1e-6)
+
+        fit = calibration.fit_affine(raw, screen + [(1, 0), (-1, 0), (1, 0), (-1, 0), (0, 0), (0, 0)])
+        self.assertGreater(fit.rms_error, 0.1)
+        self.assertEqual((6, 2), fit.residuals.shape)
+
+        homography = np.array([[0.5, 0.02, -900], [-0.01, 0.45, -700], [0.00002, -0.00001, 1]])
+        xyw = np.column_stack((raw, np.ones(len(raw)))).dot(homography.T)
+        screen = xyw[:, :2] / xyw[:, 2:]
+        fit = calibration.fit_projective(raw, screen)
+        self.assertEqual("projective", fit.plan.kind)
+        np.testing.assert_allclose(homography, fit.plan.matrix, rtol=1e-6, atol=1e-9)
+        self.assertLess(fit.max_error, 1e-6)
+
+        self.assertRaises(ValueError, lambda: calibration.fit_affine(raw[:2], screen[:2]))
+        self.assertRaises(ValueError, lambda: calibration.fit_affine(raw, screen[:3]))
+        self.assertRaises(ValueError, lambda: calibration.fit_affine([(0, 0), (1, 1), (2, 2)], screen[:3]))
+        self.assertRaises(ValueError, lambda: calibration.fit_projective(raw[:3], screen[:3]))
+
+    #------------------------------------------------------------------------------
+    def test_polynomial_lookup_table(self):
+        def distort(raw):
+            u = raw[:, 0] / 2048 - 1
+            v = raw[:, 1] / 2048 - 1
+            return np.column_stack((500 * u + 20 * u ** 3 - 5 * u * v, -400 * v + 15 * v ** 3 + 8 * u ** 2))
+
+        grid = np.arange(100, 4096, 400, dtype=np.float64)
+        raw = np.array([(x, y) for x in grid for y in grid])
+        fit = calibration.fit_polynomial(raw, distort(raw), degree=3)
+        self.assertIsNone(fit.plan)
+        self.assertLess(fit.max_error, 1e-6)
+
+        lut = fit.lookup_table(step=64)
+        self.assertEqual(64, lut.step)
+        self.assertEqual((65, 65, 2), lut.table.shape)
+
+        test_raw = np.array([(0, 0), (4095, 4095), (4095, 0), (1234.0, 3210.0), (2048, 2048), (77, 4000), (-5, 5000)])
+        xy = lut.apply_batch(test_raw)
+        self.assertEqual([list(lut.apply(x, y)) for x, y in test_raw], xy.tolist())
+        expected = distort(np.clip(test_raw, 0, 4095))
+        self.assertLessEqual(np.max(np.abs(xy - expected)), 1.5)
+
+        path = os.path.join(tempfile.mkdtemp(), "lut.npy")
+        lut.save(path)
+        loaded = tsc2017.LookupTable.load(path)
+        self.assertIsInstance(loaded.table, np.memmap)
+        self.assertEqual(xy.tolist(), loaded.apply_batch(test_raw).tolist())
+
+        tp = DummyTouchpad(lookup_table=loaded)
+        tp.connect(b"dummy")
+        tp.add_sample(True, 1234, 3210)
+        self.assertEqual((True,) + tuple(xy[3]), get_touch_data(tp))
+        self.assertEqual(xy.tolist(), tp.transform_batch(test_raw).tolist())
+
+        tp.lookup_table = None
+        self.assertEqual((True, 1234 - 2048, 3210 - 2048), get_touch_data(tp))
+
+        self.assertRaises(ValueError, lambda: calibration.fit_polynomial(raw[:9], distort(raw[:9]), degree=3))
+        self.assertRaises(ValueError, lambda: tsc2017.LookupTable.build(distort, step=100))
+        self.assertRaises(ValueError, lambda: tsc2017.LookupTable(np.zeros((10, 10, 2))))
+
+    #------------------------------------------------------------------------------
+    def test_calibration_profile(self):
+        path = os.path.join(tempfile.mkdtemp(), "profile.json")
+        plan = TransformPlan.from_matrix([[0.123456789, 0.001, -1000.5], [0.002, -0.2, 900.25]])
+        calibration.save_profile(path, "USB0::1::RAW", transform_plan=plan, dll_path="c:\\connect_tsc.dll")
+
+        profile = calibration.load_profile(path)
+        self.assertEqual("USB0::1::RAW", profile.device_id)
+        self.assertEqual(plan.matrix.tolist(), profile.transform_plan.matrix.tolist())
+        self.assertIsNone(profile.lookup_table)
+        self.assertEqual("c:\\connect_tsc.dll", profile.dll_path)
+
+        lut = tsc2017.LookupTable.build(lambda raw: raw / 4, step=256)
+        calibration.save_profile(path, b"USB0::2::RAW", lookup_table=lut)
+        self.assertRaises(ValueError, lambda: calibration.load_profile(path))
+        self.assertRaises(ValueError, lambda: calibration.load_profile(path, "USB0::3::RAW"))
+
+        profile = calibration.load_profile(path, b"USB0::2::RAW")
+        self.assertEqual(lut.table.tolist(), profile.lookup_table.table.tolist())
+
+        tp = DummyTouchpad.from_profile(path, "USB0::2::RAW")
+        self.assertEqual(b"USB0::2::RAW", tp.device_name)
+        tp.add_sample(True, 400, 4000)
+        self.assertEqual((True, 100, 1000), get_touch_data(tp))
+
+        tp = DummyTouchpad.from_profile(path, "USB0::1::RAW", connect=False)
+        self.assertEqual(plan.matrix.tolist(), tp.transform_plan.matrix.tolist())
+        self.assertIsNone(tp.lookup_table)
+
+        with open(path, "w") as fp:
+            fp.write('{"format": "tsc2017-calibration-profile", "version": 99, "devices": {}}')
+        self.assertRaises(ValueError, lambda: calibration.load_profile(path))
+
+    #------------------------------------------------------------------------------
+    def test_find_devices(self):
+        tp = DummyTouchpad()
+        self.assertEqual([], tp.find_devices())
+        self.assertRaises(tsc2017.TSCError, tp.connect_first)
+
+        many_devices = [("USB0::0x0451::0x2FD7::NI-VISA-{:}::RAW".format(i)).encode("ascii") for i in range(100)]
+        try:
+            DummyTouchpad.device_ids = many_devices
+            DummyTouchpad.unavailable_devices = {many_devices[0]}
+            self.assertEqual([d.decode("ascii") for d in many_devices], tp.find_devices())
+            self.assertEqual(many_devices[1].decode("ascii"), tp.connect_first())
+            self.assertEqual(many_devices[1], tp.device_name)
+
+            DummyTouchpad.unavailable_devices = set(many_devices)
+            self.assertRaises(tsc2017.TSCError, DummyTouchpad().connect_first)
+        finally:
+            DummyTouchpad.device_ids = []
+            DummyTouchpad.unavailable_devices = set()
+
+    #------------------------------------------------------------------------------
+    def test_connect_to_device_with_legacy_dll(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "util"))
+        import setup_utils
+
+        #-- The DLL cannot find the devices, so the user is asked for the device ID
+        tp = LegacyDummyTouchpad()
+        setup_utils.raw_input = lambda prompt: "12345"
+        try:
+            device_id = setup_utils.connect_to_device(tp)
+        finally:
+            del setup_utils.raw_input
+        self.assertEqual("USB0::0x0451::0x2FD7::NI-VISA-12345::3::RAW", device_id)
+        self.assertEqual(device_id.encode("ascii"), tp.device_name)
+        tp.close()
+
+    #------------------------------------------------------------------------------
+    def test_reconnect_reuses_session(self):
+        with DummyTouchpad() as tp:
+            tp.connect(b"dummy")
+            tp.add_sample(True, 2048, 2048)
+            resource = tp._resource
+            tp.disconnect()
+
+            tp.add_sample(True, 2148, 2148)   # received while disconnected
+            tp.connect("dummy")
+            self.assertEqual(1, tp.n_connects)
+            self.assertEqual(resource, tp._resource)
+            self.assertEqual((False, 0, 0), get_touch_data(tp))
+            self.assertEqual(0, len(tp.read_samples()))
+
+            #-- The reused session numbers the samples again, and its counters are reset
+            tp.add_sample(True, 2048, 2048)
+            self.assertEqual(1, tp.get_touch_data().seq)
+            self.assertEqual([1], list(tp.read_samples()["seq"]))
+            self.assertEqual(1, tp.stats()["dll"]["interrupts_received"])
+
+            tp.connect(b"dummy2")
+            self.assertEqual(2, tp.n_connects)
+
+        self.assertIsNone(tp._resource)
+        self.assertRaises(tsc2017.TSCError, lambda: tp.connect(b"dummy"))
+        tp.close()
+
+    #------------------------------------------------------------------------------
+    def test_resource_pool(self):
+        class Library(object):
+            def __init__(self):
+                self.calls = []
+                self.n_connects = 0
+                self.SampleCallback = lambda: None
+                self.create_resource_manager = lambda: self.calls.append("create_rm") or 7
+                self.cleanup_resource_manager = lambda rm: self.calls.append("cleanup_rm")
+                self.connect = lambda rm, name: self.calls.append("connect") or self._new_session()
+                self.disconnect = lambda resource: self.calls.append("disconnect")
+                self.clear_samples = lambda resource: self.calls.append("clear")
+                self.suspend_events = lambda resource: self.calls.append("suspend")
+                self.resume_events = lambda resource: self.calls.append("resume") or 1
+                self.set_sample_callback = lambda resource, callback: None
+
+            def _new_session(self):
+                self.n_connects += 1
+                return 10 + self.n_connects
+
+        pool = ResourcePool()
+        lib = Library()
+        self.assertEqual(7, pool.acquire_manager(lib))
+        self.assertEqual(7, pool.acquire_manager(lib))
+        self.assertEqual(11, pool.open_session(lib, b"dev"))
+        pool.close_session(lib, b"dev", 11)
+        self.assertEqual(11, pool.open_session(lib, b"dev"))
+        pool.close_session(lib, b"dev", 11)
+        #-- The idle session doesn't handle the device's interrupts
+        self.assertEqual(["create_rm", "connect", "suspend", "resume", "clear", "suspend"], lib.calls)
+
+        pool.release_manager(lib)
+        pool.close_idle()
+        self.assertEqual("disconnect", lib.calls[-1])
+
+        pool.release_manager(lib)
+        pool.close_idle()
+        self.assertEqual("cleanup_rm", lib.calls[-1])
+
+    #------------------------------------------------------------------------------
+    def test_resource_pool_limits(self):
+        pool = ResourcePool(max_idle_sessions=2, max_idle_time=0.05)
+        lib = type("Library", (), {})()
+        open_sessions = set()
+        new_sessions = iter(range(11, 100))
+
+        def connect(rm, name):
+            resource = next(new_sessions)
+            open_sessions.add(resource)
+            return resource
+
+        lib.SampleCallback = lambda: None
+        lib.create_resource_manager = lambda: 7
+        lib.cleanup_resource_manager = lambda rm: None
+        lib.connect = connect
+        lib.disconnect = lambda resource: open_sessions.discard(resource.value)
+        lib.clear_samples = lib.suspend_events = lib.set_sample_callback = lambda *args: None
+        lib.resume_events = lambda resource: 1
+
+        #-- Only the newest idle sessions are kept
+        pool.acquire_manager(lib)
+        sessions = [pool.open_session(lib, name) for name in (b"a", b"b", b"c")]
+        for name, resource in zip((b"a", b"b", b"c"), sessions):
+            pool.close_session(lib, name, resource)
+        self.assertEqual({12, 13}, open_sessions)
+
+        #-- ... for a limited time
+        time.sleep(0.2)
+        self.assertEqual(set(), open_sessions)
+        self.assertEqual(14, pool.open_session(lib, b"b"))
+
+        pool.release_manager(lib)
+        pool.close_idle()
+
+    #------------------------------------------------------------------------------
+    def test_import_is_fast(self):
+        #-- "import tsc2017" and Touchpad() should not import numpy or load the DLL
+        code = "import sys; sys.path.insert(0, {!r}); import tsc2017; tp = tsc2017.Touchpad(); " \
+               "print('numpy' in sys.modules, tp._library is None and len(tsc2017._tsc2017._loaded_dlls) == 0)" \
+               .format(os.path.dirname(os.path.dirname(tsc2017.__file__)))
+        numpy_imported, dll_not_loaded = subprocess.check_output([sys.executable, "-c", code]).decode().split()
+
+        self.assertEqual("False", numpy_imported)
+        self.assertEqual("True", dll_not_loaded)
+
+    #------------------------------------------------------------------------------
+    def test_get_touch_data_into(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+
+        ti = TouchInfo(True, 1, 1)
+        self.assertIs(ti, tp.get_touch_data_into(ti))
+        self.assertEqual((False, 0, 0), (ti.touched, ti.x, ti.y))
+
+        tp.add_sample(True, 2148, 2058)
+        tp.get_touch_data_into(ti)
+        self.assertEqual((True, 100, 10), (ti.touched, ti.x, ti.y))
+
+        records = np.zeros(2, dtype=tsc2017.samples_dtype)
+        tp.get_touch_data_into(records[1])
+        self.assertEqual((True, 100, 10, ti.timestamp, 1), tuple(records[1]))
+
+    #------------------------------------------------------------------------------
+    def test_wait_for_touch(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.add_sample(False, 0, 0)
+
+        self.assertIsNone(tp.wait_for_touch(timeout=0.01))
+        self.assertIsNone(tp.wait_next_sample(timeout=0.01))
+
+        threading.Timer(0.02, lambda: tp.add_sample(False, 0, 0)).start()
+        threading.Timer(0.04, lambda: tp.add_sample(True, 2148, 2058)).start()
+        ti = tp.wait_for_touch(timeout=1)
+        self.assertEqual((True, 100, 10), (ti.touched, ti.x, ti.y))
+
+        #-- Already touched
+        self.assertIsNotNone(tp.wait_for_touch(timeout=0))
+        self.assertIsNone(tp.wait_for_release(timeout=0.01))
+
+        threading.Timer(0.02, lambda: tp.add_sample(False, 0, 0)).start()
+        self.assertFalse(tp.wait_for_release(timeout=1).touched)
+
+        self.assertRaises(ValueError, lambda: tp.wait_for_touch(timeout=-1))
+
+    #------------------------------------------------------------------------------
+    def test_async_stream(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+
+        async def read_stream():
+            samples = []
+            async with tp.stream() as stream:
+                threading.Timer(0.02, lambda: tp.add_sample(True, 2148, 2058)).start()
+                async for ti in stream:
+                    samples.append((ti.touched, ti.x, ti.y))
+                    if len(samples) == 1:
+                        threading.Timer(0.02, lambda: tp.add_sample(False, 2248, 2258)).start()
+                    else:
+                        break
+            return samples
+
+        self.assertEqual([(True, 100, 10), (False, 200, 210)], asyncio.run(read_stream()))
+        self.assertIsNone(tp.sample_callback)
+
+    #------------------------------------------------------------------------------
+    def test_async_stream_cleanup(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+
+        async def cancel_iteration():
+            stream = tp.stream()
+            try:
+                await asyncio.wait_for(stream.__anext__(), 0.02)
+            except asyncio.TimeoutError:
+                pass
+            return tp.sample_callback
+
+        #-- A cancelled iteration doesn't leave the listener installed
+        self.assertIsNone(asyncio.run(cancel_iteration()))
+
+        async def read_and_close():
+            stream = tp.stream()
+            threading.Timer(0.02, lambda: tp.add_sample(True, 2148, 2058)).start()
+            ti = await stream.__anext__()
+            installed = tp.sample_callback is not None
+            await stream.aclose()
+            return ti.touched, installed
+
+        self.assertEqual((True, True), asyncio.run(read_and_close()))
+        self.assertIsNone(tp.sample_callback)
+
+    #------------------------------------------------------------------------------
+    def test_async_next_touch(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.add_sample(False, 0, 0)
+
+        self.assertIsNone(asyncio.run(tp.next_touch(timeout=0.02)))
+
+        threading.Timer(0.02, lambda: tp.add_sample(True, 2148, 2058)).start()
+        ti = asyncio.run(tp.next_touch(timeout=1))
+        self.assertEqual((True, 100, 10), (ti.touched, ti.x, ti.y))
+        self.assertIsNone(tp.sample_callback)
+
+    #------------------------------------------------------------------------------
+    def test_streaming(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.add_sample(True, 2148, 2048)
+        tp.start_streaming(rate_hz=500, capacity=100)
+        self.assertTrue(tp.streaming)
+        time.sleep(0.05)
+
+        tp.add_sample(True, 2248, 1948)
+        time.sleep(0.05)
+        tp.stop_streaming()
+        self.assertFalse(tp.streaming)
+
+        #-- Each sample is stored once, however often it was polled
+        samples = tp.stream_buffer.get_samples()
+        self.assertEqual(2, len(samples))
+        self.assertEqual([1, 2], list(samples["seq"]))
+        self.assertTrue(all(samples["timestamp"][1:] >= samples["timestamp"][:-1]))
+        self.assertEqual((100, 0), (samples["x"][0], samples["y"][0]))
+        self.assertEqual((200, -100), (samples["x"][-1], samples["y"][-1]))
+
+    #------------------------------------------------------------------------------
+    def test_get_touch_data_while_streaming(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.start_streaming(rate_hz=500, capacity=100)
+        tp.add_sample(True, 2148, 2048)
+        time.sleep(0.05)
+        tp.last_sample = None   # The device is not accessed while streaming
+        self.assertEqual((True, 100, 0), get_touch_data(tp))
+
+        #-- The newest sample is filled into the caller's TouchInfo, and not returned again
+        out = TouchInfo(False, 0, 0)
+        self.assertIs(out, tp.get_touch_data_into(out))
+        self.assertEqual((True, 100, 0), (out.touched, out.x, out.y))
+        self.assertIsNone(tp.get_touch_data_into(out, only_new=True))
+        tp.disconnect()
+        self.assertFalse(tp.streaming)
+
+    #------------------------------------------------------------------------------
+    def test_recording(self):
+        from tsc2017 import recording
+
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "session.tsc")
+
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.add_sample(True, 100, 100)  # received before recording: not recorded
+        tp.record(path, buffer_size=2)
+        self.assertTrue(tp.recording and tp.streaming)
+        tp.add_sample(True, 2148, 2058)
+        tp.add_sample(True, 2149, 2059)
+        tp.add_sample(False, 2150, 2060)
+        tp.stop_recording()
+        self.assertFalse(tp.recording or tp.streaming)
+
+        samples = recording.read_recording(path)
+        self.assertIsInstance(samples, np.memmap)
+        self.assertEqual([2, 3, 4], list(samples["seq"]))
+        self.assertEqual(21, samples.itemsize)
+        self.assertEqual([1, 1, 0], list(samples["flags"]))
+        self.assertEqual([2148, 2149, 2150], list(samples["raw_x"]))
+        self.assertEqual([2058, 2059, 2060], list(samples["raw_y"]))
+        self.assertEqual(tp.transform_batch(np.column_stack((samples["raw_x"], samples["raw_y"]))).tolist(),
+                         np.column_stack((samples["x"], samples["y"])).tolist())
+        del samples
+
+        #-- Restarting the streaming does not stop the recording
+        tp.record(path)
+        tp.add_sample(True, 2148, 2058)
+        tp.start_streaming(rate_hz=500)
+        self.assertTrue(tp.recording)
+        tp.add_sample(True, 2149, 2059)
+        tp.stop_recording()
+        self.assertTrue(tp.streaming)
+        tp.stop_streaming()
+        self.assertEqual([5, 6], list(recording.read_recording(path)["seq"]))
+
+        #-- Bulk writes; an incomplete last record is ignored
+        records = np.zeros(10, dtype=recording.record_dtype)
+        records["seq"] = np.arange(10)
+        with recording.Recorder(path, buffer_size=4) as recorder:
+            recorder.write(records[:3])
+            recorder.write(records[3:])
+            self.assertEqual(10, recorder.n_samples)
+        with open(path, "ab") as fp:
+            fp.write(b"\0" * 5)
+        self.assertEqual(list(range(10)), list(recording.read_recording(path)["seq"]))
+
+        with open(path, "wb") as fp:
+            fp.write(b"not a recording file")
+        self.assertRaises(ValueError, lambda: recording.read_recording(path))
+
+    #------------------------------------------------------------------------------
+    def test_chunked_recording(self):
+        from tsc2017 import recording
+
+        path = os.path.join(tempfile.mkdtemp(), "session.tscz")
+
+        #-- 3 trials; the last one does not end before the recording ends
+        n = 10000
+        samples = np.zeros(n, dtype=tsc2017.packed_sample_dtype)
+        samples["seq"] = np.arange(1, n + 1)
+        samples["timestamp"] = 10 ** 12 + np.arange(n) * 997123
+        samples["raw_x"] = 2048 + (1000 * np.sin(np.arange(n) / 300)).astype(np.int16)
+        samples["x"] = samples["raw_x"] - 40000 // 2
+        samples["flags"][100:5100] = tsc2017.flag_touched
+        samples["flags"][6000:6003] = tsc2017.flag_touched
+        samples["flags"][9000:] = tsc2017.flag_touched
+
+        for compression in "zlib", "lzma":
+            with recording.ChunkedRecorder(path, compression, chunk_size=1000) as recorder:
+                for i in range(0, n, 777):
+                    recorder.write(samples[i:i + 777])
+            self.assertTrue(os.path.getsize(path) < samples.nbytes / 5)
+
+            rec = recording.ChunkedRecording(path)
+            self.assertEqual((n, 3), (rec.n_samples, rec.n_trials))
+            self.assertEqual([(100, 5100), (6000, 6003), (9000, n)], [rec.trial_range(k) for k in range(3)])
+            self.assertEqual(samples[6000:6003].tolist(), rec.read_trial(1).tolist())
+            self.assertEqual(samples[100:5100].tolist(), rec.read_trial(0).tolist())
+            self.assertEqual(samples[1234:1240].tolist(), rec.read(1234, 1240).tolist())
+            self.assertEqual(samples.tolist(), recording.read_recording(path).tolist())
+            self.assertRaises(IndexError, lambda: rec.read_trial(3))
+
+        #-- Touchpad.record() with compression
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        tp.record(path, compression="zlib")
+        for i in range(5):
+            tp.add_sample(i in (1, 2, 4), 2048 + i, 2048)
+        tp.stop_recording()
+        rec = recording.ChunkedRecording(path)
+        self.assertEqual([(1, 3), (4, 5)], [rec.trial_range(k) for k in range(rec.n_trials)])
+        self.assertEqual([2052], list(rec.read_trial(1)["raw_x"]))
+
+    #------------------------------------------------------------------------------
+    def test_filters(self):
+        from tsc2017 import filters
+
+        #-- A noisy recording with 3 touches and a few spikes
+        rng = np.random.RandomState(0)
+        n = 600
+        t = np.cumsum(rng.uniform(0.0005, 0.0015, n))
+        t[300] = t[299]
+        touched = np.ones(n, dtype=bool)
+        touched[200:210] = False
+        touched[400:401] = False
+        x = np.round(np.linspace(0, 500, n) + rng.normal(0, 3, n))
+        y = np.round(np.linspace(100, -100, n) + rng.normal(0, 3, n))
+        x[[50, 51, 250, 500]] += 300
+
+        chain = filters.FilterChain(filters.SpikeFilter(max_jump=50), filters.MedianFilter(5))
+        all_filters = [filters.MedianFilter(1), filters.MedianFilter(7), filters.SpikeFilter(50, 1),
+                       filters.OneEuroFilter(min_cutoff=0.5, beta=0.01), filters.KalmanFilter(), chain,
+                       filters.FilterChain(chain, filters.KalmanFilter(process_noise=1e5))]
+
+        for f in all_filters:
+            f.reset()
+            batch_x, batch_y = f.apply(t, touched, x, y)
+            streamed = [f.step(*sample) for sample in zip(t, touched, x.astype(int).tolist(), y.astype(int).tolist())]
+            self.assertEqual([tuple(s) for s in streamed], list(zip(batch_x.tolist(), batch_y.tolist())))
+
+            #-- Untouched samples are not changed
+            self.assertEqual(x[~touched].tolist(), batch_x[~touched].tolist())
+
+        #-- The spikes are removed, and the noise is reduced
+        fx, fy = chain.apply(t, touched, x, y)
+        self.assertTrue(np.all(np.abs(fx[touched] - np.linspace(0, 500, n)[touched]) < 20))
+        fx, fy = filters.KalmanFilter().apply(t, touched, x, y)
+        ideal = np.linspace(0, 500, n)
+        self.assertTrue(np.std((fx - ideal)[220:240]) < np.std((x - ideal)[220:240]))
+
+        #-- Attached to a touchpad
+        tp = DummyTouchpad(scale_coords_by=(1, 1), shift_coords_by=(2048, 2048))
+        tp.filters = filters.MedianFilter(3)
+        tp.connect(b"dummy")
+        for raw_x, expected_x in (100, 100), (110, 105), (500, 110), (120, 120), (130, 130):
+            tp.add_sample(True, raw_x, 0)
+            self.assertEqual(expected_x, tp.get_touch_data().x)
+        self.assertEqual(130, tp.get_touch_data().x)  # The same sample is not filtered again
+        self.assertRaises(TypeError, lambda: setattr(tp, "filters", 3))
+
+        #-- Samples read by several threads are filtered once each, in order
+        class CountingFilter(filters.Filter):
+            def __init__(self):
+                self.seq = []
+            def reset(self):
+                pass
+            def step(self, t, touched, x, y):
+                self.seq.append(x)
+                time.sleep(0.0001)
+                return x, y
+
+        tp.filters = counting = CountingFilter()
+        tp.start_streaming(rate_hz=2000)
+        readers = [threading.Thread(target=lambda: [tp._poll_touch_data() for _ in range(200)]) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        for i in range(50):
+            tp.add_sample(True, 200 + i, 0)
+            time.sleep(0.0002)
+        for reader in readers:
+            reader.join()
+        tp.stop_streaming()
+        self.assertEqual(sorted(set(counting.seq)), counting.seq)
+
+    #------------------------------------------------------------------------------
+    def test_resampling(self):
+        from tsc2017 import resampling
+
+        t = [0.0, 0.004, 0.011, 0.02, 0.03, 0.03, 0.041, 0.05, 0.1, 0.113]
+        touched = [1, 1, 1, 1, 0, 0, 1, 1, 1, 1]
+        x = [0, 4, 11, 20, 0, 5, 41, 50, 100, 113]
+        y = [0, -4, -11, -20, 0, 5, -41, -50, -100, -113]
+
+        #-- Interpolated within touches; not across the release, and not across a gap longer than max_gap
+        result = resampling.resample(t, touched, x, y, 200, max_gap=0.02)
+        self.assertEqual([0.005 * k for k in range(23)], result["timestamp"].tolist())
+        touched_expected = [True] * 5 + [False] * 4 + [True, True] + [False] * 9 + [True] * 3
+        self.assertEqual(touched_expected, result["touched"].tolist())
+        self.assertTrue(np.allclose(result["x"][result["touched"]], result["timestamp"][result["touched"]] * 1000))
+        self.assertTrue(np.all(np.isnan(result["y"][~result["touched"]])))
+
+        #-- Without max_gap
+        result = resampling.resample(t, touched, x, y, 200)
+        self.assertTrue(np.all(result["touched"][9:]))
+
+        #-- The streaming resampler gives identical results, also with an irregular rate and a grid start
+        rng = np.random.RandomState(1)
+        n = 1000
+        t = np.cumsum(rng.uniform(0.0001, 0.003, n))
+        touched = rng.uniform(size=n) > 0.05
+        x = rng.uniform(0, 1000, n).round()
+        y = rng.uniform(0, 1000, n).round()
+        for rate_hz, max_gap, start in (1000, None, None), (333, 0.002, 0.0), (100, None, 0.5):
+            batch = resampling.resample(t, touched, x, y, rate_hz, max_gap, start)
+            resampler = resampling.Resampler(rate_hz, max_gap, start)
+            streamed = [r for sample in zip(t, touched, x, y) for r in resampler.push(*sample)]
+            self.assertEqual(len(batch), len(streamed))
+            self.assertEqual(np.array(streamed, dtype=resampling.resampled_dtype).tobytes(), batch.tobytes())
+
+    #------------------------------------------------------------------------------
+    def test_touchpad_group(self):
+        tp1 = DummyTouchpad(instrumentation=True)
+        tp2 = DummyTouchpad(dll_of=tp1, shift_coords_by=(10, 10))
+        group = tsc2017.TouchpadGroup([tp1, tp2])
+        tp1.connect(b"dummy1")
+        self.assertRaises(tsc2017.TSCError, group.get_touch_data)
+        tp2.connect(b"dummy2")
+
+        tp1.add_sample(True, 2148, 2058)
+        tp2.add_sample(False, 2148, 2058)
+        tp2.add_sample(True, 2048, 2048)
+        data = [(ti.touched, ti.x, ti.y, ti.seq) for ti in group.get_touch_data()]
+        self.assertEqual([(True, 100, 10, 1), (True, 10, 10, 2)], data)
+
+        #-- The touchpads know which samples were already read
+        self.assertEqual(1, tp1.stats()["calls"])
+        self.assertIsNone(tp1.get_touch_data(only_new=True))
+        self.assertIsNone(tp2.get_touch_data(only_new=True))
+
+        self.assertRaises(TypeError, lambda: tsc2017.TouchpadGroup([tp1, None]))
+
+        #-- All touchpads must use the same DLL
+        tp3 = DummyTouchpad()
+        tp3.connect(b"dummy3")
+        self.assertRaises(ValueError, lambda: tsc2017.TouchpadGroup([tp1, tp3]))
+
+    #------------------------------------------------------------------------------
+    def test_mouse_frame_snapshot(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        mouse = tsc2017.Mouse(tp, object())
+        tp.add_sample(True, 2148, 2058)
+
+        mouse.begin_frame()
+        tp.add_sample(True, 2248, 2258)
+        self.assertEqual((100, 10), mouse.position)
+        tp.add_sample(False, 0, 0)
+        self.assertTrue(mouse.check_button_pressed(0))
+
+        mouse.begin_frame()
+        self.assertFalse(mouse.check_button_pressed(0))
+        mouse.end_frame()
+        tp.add_sample(True, 2248, 2258)
+        self.assertEqual((200, 210), mouse.position)
+
+    #------------------------------------------------------------------------------
+    def test_mouse_snapshot_ttl(self):
+        tp = DummyTouchpad()
+        tp.connect(b"dummy")
+        mouse = tsc2017.Mouse(tp, object(), snapshot_ttl=0.05)
+        tp.add_sample(True, 2148, 2058)
+        self.assertEqual((100, 10), mouse.position)
+        tp.add_sample(True, 2248, 2258)
+        self.assertEqual((100, 10), mouse.position)
+        time.sleep(0.06)
+        self.assertEqual((200, 210), mouse.position)
+
+        self.assertRaises(TypeError, lambda: tsc2017.Mouse(tp, object(), snapshot_ttl=-1))
+
 
 if __name__ == '__main__':
     unittest.main()
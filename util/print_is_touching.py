@@ -10,10 +10,8 @@ touchpad.connect(device_id)
 
 print("Move your finger around the touchpad")
 
-touching = False
-
 while True:
-
-    if touchpad.get_touch_data().touched != touching:
-        touching = not touching
-        print("Now {:}touching".format("" if touching else "not "))
+    touchpad.wait_for_touch()
+    print("Now touching")
+    touchpad.wait_for_release()
+    print("Now not touching")
@@ -4,12 +4,11 @@ from __future__ import division
 import os
 import random
 import time
-import sklearn.linear_model as lin
 
 import expyriment as xpy
 import trajtracker as ttrk
 
-from tsc2017 import Touchpad
+from tsc2017 import Touchpad, TransformPlan, calibration
 import setup_utils as sut
 
 
@@ -22,6 +21,19 @@ simulate_with_mouse = False
 
 n_pointings_per_quarter = 3
 
+#-- Fit a projective transformation (e.g. if the touchpad is tilted) rather than an affine one
+use_projective_transform = False
+
+#-- To correct the touchpad's nonlinearity (near its edges), set this to the degree of the polynomial to fit
+#-- (e.g. 3). Nonlinear fits need more pointings - increase n_pointings_per_quarter accordingly.
+nonlinear_degree = None
+
+#-- The grid step of the nonlinear calibration's lookup table (in raw touchpad units)
+lookup_table_step = 16
+
+#-- The calibration profile file (created in the current directory)
+profile_file_name = "tsc2017_profile.json"
+
 
 #---------------------------------------------------------------------------
 def main():
@@ -46,7 +58,8 @@ def main():
     else:
         dll_path = sut.get_dll_path()
         dll_path += "\\connect_tsc.dll"
-        touchpad = Touchpad(dll_path)
+        #-- Get the raw touchpad coordinates (no transformation)
+        touchpad = Touchpad(dll_path, transform_plan=TransformPlan())
         device_id = sut.connect_to_device(touchpad)
 
     target_positions = generate_positions()
@@ -55,9 +68,10 @@ def main():
     print("target = {:}".format(target_positions))
     print("marked = {:}".format(marked_positions))
 
-    intercepts, scale_factors = get_scaling_factors(target_positions, marked_positions)
+    fit = get_transform(marked_positions, target_positions)
+    print("Calibration errors: RMS = {:.1f} pixels, max = {:.1f} pixels".format(fit.rms_error, fit.max_error))
 
-    save_script(dll_path, device_id, intercepts, scale_factors)
+    save_profile(dll_path, device_id, fit)
 
     xpy.control.end()
 
@@ -109,8 +123,9 @@ def ask_to_mark(target_positions, touchpad):
 
         while True:
 
-            td = touchpad.get_touch_data()
-            if td.touched:
+            #-- Wait for a touch; return from time to time to process keyboard control keys
+            td = touchpad.wait_for_touch(timeout=0.1)
+            if td is not None:
                 pos = (td.x, td.y)
                 print("Displayed at {:}, touched at {:}".format(target_positions[i], pos))
                 marked_positions.append(pos)
@@ -118,13 +133,10 @@ def ask_to_mark(target_positions, touchpad):
 
                 #-- wait until finger lifted, plus a little longer
                 if i+1 < len(target_positions):
-                    while touchpad.get_touch_data().touched:
-                        time.sleep(0.02)
+                    touchpad.wait_for_release()
                     time.sleep(0.5)
 
                 break
-            else:
-                time.sleep(0.02)
 
             xpy.io.Keyboard.process_control_keys()
 
@@ -136,66 +148,44 @@ def ask_to_mark(target_positions, touchpad):
 
 
 #---------------------------------------------------------------------------
-def get_scaling_factors(target_positions, marked_positions):
+def get_transform(marked_positions, target_positions):
     """
-    Compute how the marked coordinates should be scaled to match the target coordinates
-    :return: tuple (intercepts, scales): each of the two is a tuple with 2 elements (x, y)
+    Compute how the marked (raw touchpad) coordinates should be transformed to match the target coordinates
+    :return: tsc2017.calibration.CalibrationResult
     """
-
-    regression = lin.LinearRegression()
-    intercepts = []
-    scales = []
-
-    for coord in 0, 1:
-
-        target = [c[coord] for c in target_positions]
-        marked = [[c[coord]] for c in marked_positions]
-
-        regression.fit(marked, target)
-        intercepts.append(regression.intercept_)
-        scales.append(regression.coef_[0])
-
-    return tuple(intercepts), tuple(scales)
+    if nonlinear_degree is not None:
+        return calibration.fit_polynomial(marked_positions, target_positions, nonlinear_degree)
+    elif use_projective_transform:
+        return calibration.fit_projective(marked_positions, target_positions)
+    else:
+        return calibration.fit_affine(marked_positions, target_positions)
 
 
 #---------------------------------------------------------------------------
-def save_script(dll_path, device_id, shift_factors, scale_factors):
+def save_profile(dll_path, device_id, fit):
+    """
+    Save the calibration to the profile file (adding this device to the profile if it already exists)
+    """
 
-    shift_factors = [ttrk.utils.round(x) for x in shift_factors]
-    scale_factors = [ttrk.utils.round(x * 10000) / 10000 for x in scale_factors]
+    out_file = os.getcwd() + os.sep + profile_file_name
+
+    if fit.plan is None:
+        calibration.save_profile(out_file, device_id, lookup_table=fit.lookup_table(lookup_table_step), dll_path=dll_path)
+    else:
+        calibration.save_profile(out_file, device_id, transform_plan=fit.plan, dll_path=dll_path)
 
     commands = [
-        "",
-        "# Paste the following lines around the beginning of your python script",
         "import tsc2017",
         "import trajtracker as ttrk",
-        "device_id = '{:}'".format(device_id),
-        "dll_path = '{:}'".format(dll_path.replace("\\", "\\\\")),
-        "touchpad_scale_coords_factor = {:}, {:}".format(scale_factors[0], scale_factors[1]),
-        "touchpad_shift_coords_factor = {:}, {:}".format(shift_factors[0], shift_factors[1]),
         "",
-        "# Paste the following lines only after calling trajtracker.initialize()",
-        "touchpad = tsc2017.Touchpad(dll_path=dll_path, scale_coords_by=touchpad_scale_coords_factor, shift_coords_by=touchpad_shift_coords_factor)",
-        "touchpad.connect(device_id)",
+        "# After calling trajtracker.initialize():",
+        "touchpad = tsc2017.Touchpad.from_profile('{:}', device_id='{:}')".format(out_file.replace("\\", "\\\\"), device_id),
         "ttrk.env.mouse = tsc2017.Mouse(touchpad, ttrk.env.mouse)",
     ]
 
-    script = "".join([c + "\n" for c in commands])
-
-    print("To initialize TSC2017 in your script, please write the following python commands:\n")
-    print(script)
-
-    #-- Save script
-    out_dir = os.getcwd()
-    out_file = out_dir + os.sep + "results_to_paste_in_your_script.py"
-    with open(out_file, 'w') as fp:
-        fp.write("#\n")
-        fp.write("# Paste the following commands in your script to connect with the TSC2017 device\n")
-        fp.write("# Note that you may have to change device_id each time you reconnect the TSC2017 to your computer\n")
-        fp.write("#\n")
-        fp.write(script)
-
-    print("\nThese commands were saved to {:}".format(out_file))
+    print("\nThe calibration of device {:} was saved to {:}".format(device_id, out_file))
+    print("To initialize TSC2017 in your script, use the following python commands:\n")
+    print("".join([c + "\n" for c in commands]))
 
 
 #=================================================================================================
@@ -1,5 +1,6 @@
 
 import os
+import time
 from tsc2017 import TouchInfo, TSCError
 
 
@@ -19,6 +20,22 @@ class TouchpadMouseSimulator(object):
         x, y = self._mouse.position
         return TouchInfo(touched, x, y)
 
+    def wait_for_touch(self, timeout=None):
+        return self._wait_for_touch_state(True, timeout)
+
+    def wait_for_release(self, timeout=None):
+        return self._wait_for_touch_state(False, timeout)
+
+    def _wait_for_touch_state(self, touched, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            td = self.get_touch_data()
+            if bool(td.touched) == touched:
+                return td
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(0.01)
+
     def touchpad_x_resolution(self):
         return self._exp.screen.size[0]
 
@@ -43,7 +60,37 @@ def get_dll_path():
 #---------------------------------------------------------------------------
 def connect_to_device(touchpad):
 
+    try:
+        devices = touchpad.find_devices()
+    except TSCError:
+        #-- An older DLL, which cannot search for the devices
+        devices = []
+
+    if len(devices) == 1:
+        print("Found the TSC2017 device {:}".format(devices[0]))
+        touchpad.connect(devices[0])
+        return devices[0]
+
+    if len(devices) > 1:
+        print("")
+        print("Several TSC2017 devices were found:")
+        for i, device_id in enumerate(devices):
+            print("   {:}. {:}".format(i+1, device_id))
+
+        while True:
+            choice = raw_input("Please type the number of the device to calibrate:")
+            if choice.isdigit() and 1 <= int(choice) <= len(devices):
+                device_id = devices[int(choice) - 1]
+                try:
+                    touchpad.connect(device_id)
+                    print("Succeeded")
+                    return device_id
+                except TSCError:
+                    print("Cannot connect to this device. Please choose another one.")
+
+    #-- No device was found automatically: ask for the device ID
     print("")
+    print("No TSC2017 device was found automatically.")
     print("The USB device ID (which you can see in the NI-MAX application) should be")
     print("USB0::0x0451::0x2FD7::NI-VISA-#####::3::RAW, where '#####' is a sequence of digits")
 
@@ -57,5 +104,3 @@ def connect_to_device(touchpad):
             return device_id
         except TSCError:
             print("Cannot connect to this device. Please double-check and try again.")
-
-